@@ -0,0 +1,53 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# Throughput of do_aggregate on a synthetic gzipped ui_short log:
+# sequential gzip.open reader vs pipelined decompression (with 1 and several parsing workers)
+# vs parallel decompression with a seek index (built by the first of indexed runs).
+import os
+import time
+import shutil
+import tempfile
+from argparse import ArgumentParser
+
+from logwiz.parser import do_aggregate
+from loggen import generate_log
+
+
+def main():
+    argparser = ArgumentParser()
+    argparser.add_argument("--size-mb", type=int, default=2048, help="uncompressed log size")
+    argparser.add_argument("--urls", type=int, default=10000, help="number of distinct urls")
+    argparser.add_argument("--workers", type=int, default=4, help="parsing workers for pipelined run")
+    argparser.add_argument("--log", default=None, help="existing gzipped log to use instead of generated one")
+    args = argparser.parse_args()
+
+    log = args.log
+    if not log:
+        log = os.path.join(tempfile.gettempdir(), "bench-nginx-access-ui.log-%dmb.gz" % args.size_mb)
+        if not os.path.isfile(log):
+            print "Generating %s" % log
+            generate_log(log, args.size_mb, args.urls)
+
+    index_dir = tempfile.mkdtemp()
+    runs = [
+        ("gzip.open", dict(gzip_pipeline=False)),
+        ("pipeline", dict(gzip_pipeline=True)),
+        ("pipeline, %d workers" % args.workers, dict(gzip_pipeline=True, workers=args.workers)),
+        ("indexing, %d workers" % args.workers, dict(workers=args.workers, gzip_index_span=16 << 20,
+                                                     gzip_index_dir=index_dir)),
+        ("indexed, %d workers" % args.workers, dict(workers=args.workers, gzip_index_span=16 << 20,
+                                                    gzip_index_dir=index_dir)),
+        ]
+    base = None
+    for name, kwargs in runs:
+        started = time.time()
+        stats = do_aggregate(log, parser="fast", sketch_accuracy=0.01, **kwargs)
+        elapsed = time.time() - started
+        lines = sum(len(data) for data in stats.itervalues())
+        base = base or elapsed
+        print "%-24s %8.2fs %12.0f lines/s  x%.2f" % (name, elapsed, lines / elapsed, base / elapsed)
+    shutil.rmtree(index_dir)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,128 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# Per-stage benchmark of logwiz pipeline on a synthetic ui_short log:
+# parse_line, do_aggregate, calc_url_stats and render_report timings, throughput and memory.
+# Stages run in one process, so max RSS is the high-water mark of the run so far (of this process or a pool worker),
+# memory of a stage is rss_delta: change of the current RSS of this process (memory retained by the stage result).
+# Results are written as JSON, two result files are compared with compare.py.
+import os
+import io
+import gzip
+import json
+import time
+import shutil
+import platform
+import resource
+import tempfile
+import subprocess
+from itertools import islice
+from argparse import ArgumentParser
+
+from logwiz.parser import parse_line, parse_line_fast, do_aggregate, calc_url_stats
+from logwiz.report import render_report
+from logwiz.profiling import cpu_time, max_rss
+from loggen import generate_log
+
+
+def megabytes(value):
+    return round(value / float(1 << 20), 1) if value is not None else None
+
+
+def current_rss():
+    """
+    resident set size of this process in bytes, None if /proc is not available
+    """
+    try:
+        with open("/proc/self/statm") as infile:
+            return int(infile.read().split()[1]) * resource.getpagesize()
+    except (IOError, IndexError, ValueError):
+        return None
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "HEAD"], cwd=os.path.dirname(__file__) or ".",
+                                       stderr=open(os.devnull, "w")).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def timed(results, name, func, lines=None):
+    """
+    lines: number of processed items or function of result returning it.
+    cpu_seconds include pool workers of the stage (they are joined by the time it returns)
+    """
+    started, cpu_started, rss_started = time.time(), cpu_time(), current_rss()
+    res = func()
+    elapsed = time.time() - started
+    if callable(lines):
+        lines = lines(res)
+    rss = current_rss()
+    results[name] = {
+        "seconds": round(elapsed, 4),
+        "cpu_seconds": round(cpu_time() - cpu_started, 4),
+        "max_rss_mb": megabytes(max_rss()),
+        "rss_delta_mb": megabytes(rss - rss_started) if rss is not None else None,
+        }
+    if lines is not None:
+        results[name]["lines"] = lines
+        results[name]["lines_per_sec"] = round(lines / elapsed) if elapsed else None
+    print "%-16s %9.3fs %s" % (name, elapsed, "%12.0f lines/s" % (lines / elapsed) if lines and elapsed else "")
+    return res
+
+
+def main():
+    argparser = ArgumentParser()
+    argparser.add_argument("--size-mb", type=int, default=100, help="uncompressed log size")
+    argparser.add_argument("--urls", type=int, default=10000, help="number of distinct urls")
+    argparser.add_argument("--gzip", action="store_true", help="benchmark gzipped log")
+    argparser.add_argument("--log", default=None, help="existing log to use instead of generated one")
+    argparser.add_argument("--parse-lines", type=int, default=200000, help="lines for parse_line benchmark")
+    argparser.add_argument("--workers", type=int, default=1)
+    argparser.add_argument("--parser", default="full", choices=["full", "fast"])
+    argparser.add_argument("--sketch-accuracy", type=float, default=None)
+    argparser.add_argument("--top", type=int, default=1000, help="report size")
+    argparser.add_argument("--output", default="bench_results.json", help="JSON results file")
+    args = argparser.parse_args()
+
+    tmp_dir = tempfile.mkdtemp()
+    try:
+        log = args.log
+        if not log:
+            log = os.path.join(tmp_dir, "nginx-access-ui.log-20170629" + (".gz" if args.gzip else ""))
+            print "Generating %s" % log
+            generate_log(log, args.size_mb, args.urls)
+
+        stages = {}
+        opener = gzip.open if log.endswith("gz") else io.open
+        with opener(log, "rb") as infile:
+            sample = [line.decode("utf-8") for line in islice(infile, args.parse_lines)]
+        timed(stages, "parse_line", lambda: [parse_line(line) for line in sample], len(sample))
+        timed(stages, "parse_line_fast", lambda: [parse_line_fast(line) for line in sample], len(sample))
+
+        url_data = timed(stages, "do_aggregate",
+                         lambda: do_aggregate(log, workers=args.workers, parser=args.parser,
+                                              sketch_accuracy=args.sketch_accuracy),
+                         lambda res: sum(len(data) for data in res.itervalues()))
+        lines = stages["do_aggregate"]["lines"]
+
+        url_stats = timed(stages, "calc_url_stats", lambda: calc_url_stats(url_data, top=args.top), len(url_data))
+        timed(stages, "render_report",
+              lambda: render_report(url_stats, os.path.join(tmp_dir, "report.html"), "time_sum"), len(url_stats))
+
+        results = {
+            "commit": git_commit(),
+            "python": platform.python_version(),
+            "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "params": dict(vars(args), log_size=os.path.getsize(log), lines=lines, distinct_urls=len(url_data)),
+            "stages": stages,
+            }
+        with open(args.output, "w") as outfile:
+            json.dump(results, outfile, indent=2, sort_keys=True)
+        print "Results written to %s" % args.output
+    finally:
+        shutil.rmtree(tmp_dir)
+
+
+if __name__ == "__main__":
+    main()
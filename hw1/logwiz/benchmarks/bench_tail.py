@@ -0,0 +1,42 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# Throughput of tail mode: aggregate_lines into sliding window slots (lines arrive in batches
+# every poll interval, slots are closed as time passes) and the cost of a snapshot of all windows.
+import time
+from itertools import islice
+from argparse import ArgumentParser
+
+from logwiz.parser import aggregate_lines
+from logwiz.tail import SlidingWindows
+from loggen import gen_lines
+
+
+def main():
+    argparser = ArgumentParser()
+    argparser.add_argument("--lines", type=int, default=500000, help="number of lines")
+    argparser.add_argument("--urls", type=int, default=10000, help="number of distinct urls")
+    argparser.add_argument("--rate", type=int, default=50000, help="simulated lines per second")
+    argparser.add_argument("--poll", type=float, default=0.5, help="poll interval, seconds")
+    argparser.add_argument("--parser", default="fast", help="parser, see PARSERS")
+    args = argparser.parse_args()
+
+    lines = [line.rstrip("\n").encode("utf-8") for line in islice(gen_lines(args.urls), args.lines)]
+    batch = int(args.rate * args.poll)
+    windows = SlidingWindows()
+    clock = 0.0
+    started = time.time()
+    for start in xrange(0, len(lines), batch):
+        windows.advance(clock)
+        aggregate_lines(lines[start:start + batch], windows.current, parser=args.parser)
+        clock += args.poll
+    windows.advance(clock + windows.slot)
+    elapsed = time.time() - started
+    print "aggregate %8.2fs %12.0f lines/s" % (elapsed, len(lines) / elapsed)
+
+    started = time.time()
+    windows.snapshot()
+    print "snapshot  %8.2fs" % (time.time() - started)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,43 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# Compare two bench_pipeline.py result files stage by stage.
+import json
+from argparse import ArgumentParser
+
+
+def _rss(stage):
+    """
+    change of RSS during stage and RSS high-water mark after it, older results have only the latter
+    """
+    if "max_rss_mb" not in stage:
+        return "(%.1f)" % stage["peak_rss_mb"]
+    delta = "%.1f" % stage["rss_delta_mb"] if stage["rss_delta_mb"] is not None else "n/a"
+    return "%s (%.1f)" % (delta, stage["max_rss_mb"])
+
+
+def main():
+    argparser = ArgumentParser()
+    argparser.add_argument("base", help="results of the base commit")
+    argparser.add_argument("new", help="results of the new commit")
+    args = argparser.parse_args()
+    with open(args.base) as infile:
+        base = json.load(infile)
+    with open(args.new) as infile:
+        new = json.load(infile)
+
+    print "base: %s\nnew:  %s" % (base.get("commit"), new.get("commit"))
+    print "%-16s %10s %10s %8s %16s %16s" % ("stage", "base, s", "new, s", "speedup", "base RSS+, MB",
+                                             "new RSS+, MB")
+    print "(RSS+: change of RSS during the stage, in parentheses: RSS high-water mark of the run after the stage)"
+    for stage in sorted(set(base["stages"]) | set(new["stages"])):
+        old, cur = base["stages"].get(stage), new["stages"].get(stage)
+        if not old or not cur:
+            print "%-16s %s" % (stage, "missing in " + ("base" if not old else "new"))
+            continue
+        speedup = old["seconds"] / cur["seconds"] if cur["seconds"] else float("inf")
+        print "%-16s %10.3f %10.3f %7.2fx %16s %16s" % (stage, old["seconds"], cur["seconds"], speedup,
+                                                        _rss(old), _rss(cur))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# Synthetic nginx ui_short logs for benchmarks: zipf-like url popularity, per-url latency profiles,
+# a share of urls with numeric ids and query strings.
+import io
+import gzip
+import random
+from argparse import ArgumentParser
+
+LINE = (u'{addr} {user}  - [{time_local}] "{method} {url} HTTP/1.1" {status} {size} "-" "{agent}" "-" '
+        u'"{request_id}" "{rb_user}" {request_time:.3f}\n')
+AGENTS = [
+    u"Lynx/2.8.8dev.9 libwww-FM/2.14 SSL-MM/1.4.1 GNUTLS/2.10.5",
+    u"Python-urllib/2.7",
+    u"Slotovod",
+    u"Mozilla/5.0 (Windows NT 6.1; WOW64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/59.0.3071.115",
+    u"Go-http-client/1.1",
+    ]
+URL_TEMPLATES = [
+    u"/api/v2/banner/{id}",
+    u"/api/v2/group/{id}/statistic/sites/?date_type=day&date_from=2017-06-28&date_to=2017-06-28",
+    u"/api/1/photogenic_banners/list/?server_name=WIN7RB{id}",
+    u"/export/appinstall_raw/2017-06-{id}/",
+    u"/api/v2/slot/{id}/groups",
+    u"/accounts/login/?next=/campaigns/{id}/",
+    ]
+STATUSES = [200] * 95 + [302, 304, 400, 404, 500]
+
+
+def _url(rnd, urls):
+    # log-uniform rank: P(rank < k) = log(k + 1) / log(urls + 1), close to zipf with s = 1
+    rank = int((urls + 1) ** rnd.random()) - 1
+    return URL_TEMPLATES[rank % len(URL_TEMPLATES)].format(id=rank), rank
+
+
+def gen_lines(urls=10000, seed=0):
+    rnd = random.Random(seed)
+    second = 0
+    while True:
+        url, rank = _url(rnd, urls)
+        second += rnd.random() < 0.01
+        yield LINE.format(
+            addr="1.%d.%d.%d" % (rnd.randint(0, 255), rnd.randint(0, 255), rnd.randint(0, 255)),
+            user=rnd.choice([u"-", u"-", u"3b81f63526fa8"]),
+            time_local=u"29/Jun/2017:%02d:%02d:%02d +0300" % (second // 3600 % 24, second // 60 % 60, second % 60),
+            method=u"GET" if rnd.random() < 0.9 else u"POST",
+            url=url,
+            status=rnd.choice(STATUSES),
+            size=rnd.randint(0, 50000),
+            agent=rnd.choice(AGENTS),
+            request_id=u"1498697422-%d-4708-%d" % (rnd.getrandbits(31), rnd.getrandbits(24)),
+            rb_user=u"%x" % rnd.getrandbits(36) if rnd.random() < 0.7 else u"-",
+            request_time=rnd.lognormvariate(-2.5 + (rank % 7) * 0.3, 0.8),
+            )
+
+
+def generate_log(filename, size_mb, urls=10000, seed=0, encoding="utf-8"):
+    """
+    writes ui_short log of about size_mb uncompressed megabytes (gzipped if filename ends with gz),
+    returns number of lines
+    """
+    size = size_mb << 20
+    written = count = 0
+    opener = gzip.open if filename.endswith("gz") else io.open
+    lines = gen_lines(urls, seed)
+    with opener(filename, "wb") as outfile:
+        while written < size:
+            chunk = u"".join(next(lines) for _ in range(10000)).encode(encoding)
+            outfile.write(chunk)
+            written += len(chunk)
+            count += 10000
+    return count
+
+
+def main():
+    argparser = ArgumentParser(description="Generate synthetic ui_short log")
+    argparser.add_argument("filename", help="output log, gzipped if name ends with gz")
+    argparser.add_argument("--size-mb", type=int, default=100, help="uncompressed log size")
+    argparser.add_argument("--urls", type=int, default=10000, help="number of distinct urls")
+    argparser.add_argument("--seed", type=int, default=0)
+    args = argparser.parse_args()
+    print "%d lines written" % generate_log(args.filename, args.size_mb, args.urls, args.seed)
+
+
+if __name__ == "__main__":
+    main()
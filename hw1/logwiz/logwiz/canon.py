@@ -0,0 +1,74 @@
+# -*- coding: utf-8 -*-
+# Url canonicalization: folds urls which differ only by ids or query strings into one stats key.
+import re
+
+
+OTHER_URL = u"__other__"  # bucket for urls over the distinct keys limit
+_NUMERIC_SEGMENT = re.compile(r"(?<=/)\d+(?=/|$)", flags=re.UNICODE)
+
+
+def fold_key(keys, key, max_keys):
+    """
+    key to keep values of key which is missing in keys (dict or set) under, if keys are limited to max_keys:
+    key itself while there is room for it, OTHER_URL otherwise (OTHER_URL itself is added over the limit)
+    """
+    if max_keys and len(keys) >= max_keys and key != OTHER_URL:
+        return OTHER_URL
+    return key
+
+
+def capped_get(table, key, max_keys, factory):
+    """
+    (key, value) of key in table (dict) limited to max_keys keys, see fold_key.
+    missing value is created with factory(key)
+    """
+    value = table.get(key)
+    if value is None:
+        key = fold_key(table, key, max_keys)
+        value = table.get(key)
+        if value is None:
+            value = table[key] = factory(key)
+    return key, value
+
+
+class UrlCanonicalizer(object):
+    """
+    rules are applied in order: regex rewrites (list of (pattern, replacement)),
+    query string stripping, replacing numeric path segments with {id}.
+    results are memoized (cache is dropped when it grows over cache_size),
+    equal keys are returned as the same object (interned keys are dropped too when there are over cache_size of them)
+    """
+    def __init__(self, strip_query=False, numeric_ids=False, rewrites=(), cache_size=100000):
+        self.strip_query = strip_query
+        self.numeric_ids = numeric_ids
+        self.rewrites = [(re.compile(pattern, flags=re.UNICODE), repl) for pattern, repl in rewrites]
+        self.cache_size = cache_size
+        self._cache = {}
+        self._keys = {}
+
+    def _canonical(self, url):
+        for pattern, repl in self.rewrites:
+            url = pattern.sub(repl, url)
+        path, sep, query = url.partition(u"?")
+        if self.strip_query:
+            sep = query = u""
+        if self.numeric_ids:
+            path = _NUMERIC_SEGMENT.sub(u"{id}", path)
+        return path + sep + query
+
+    def __call__(self, url):
+        key = self._cache.get(url)
+        if key is None:
+            if len(self._cache) >= self.cache_size:
+                self._cache.clear()
+            key = self._intern(self._canonical(url))
+            self._cache[url] = key
+        return key
+
+    def _intern(self, key):
+        interned = self._keys.get(key)
+        if interned is None:
+            if len(self._keys) >= self.cache_size:
+                self._keys.clear()
+            interned = self._keys[key] = key
+        return interned
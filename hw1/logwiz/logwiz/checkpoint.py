@@ -0,0 +1,77 @@
+# -*- coding: utf-8 -*-
+# Checkpoints of partially aggregated logs: file identity, byte offset reached, partial aggregate
+# and aggregation options it was collected with.
+# Allows to resume aggregation of the same (untouched) log after a failure.
+import os
+import time
+import cPickle as pickle
+from collections import namedtuple
+
+
+CHECKPOINT_SUFFIX = ".ckpt"
+
+FileIdentity = namedtuple("FileIdentity", "inode size mtime")
+Checkpoint = namedtuple("Checkpoint", "filename identity offset aggregate options")
+Checkpoint.__new__.__defaults__ = (None,)  # checkpoints saved without options are never resumed
+
+
+def checkpoint_file_for(timestamp_file):
+    return timestamp_file + CHECKPOINT_SUFFIX
+
+
+def file_identity(filename):
+    st = os.stat(filename)
+    return FileIdentity(st.st_ino, st.st_size, st.st_mtime)
+
+
+def save_checkpoint(checkpoint_file, filename, identity, offset, aggregate, options=None):
+    tmp_file = checkpoint_file + ".tmp"
+    with open(tmp_file, "wb") as outfile:
+        pickle.dump(Checkpoint(os.path.realpath(filename), identity, offset, aggregate, options), outfile,
+                    pickle.HIGHEST_PROTOCOL)
+    os.rename(tmp_file, checkpoint_file)
+
+
+def remove_checkpoint(checkpoint_file):
+    try:
+        os.remove(checkpoint_file)
+    except OSError:
+        pass
+
+
+class Checkpointer(object):
+    """
+    saves checkpoints of filename when called with (offset, aggregate).
+    the whole aggregate is pickled every time, so a checkpoint is skipped while the time since the previous one
+    is less than its saving time divided by max_overhead: checkpointing takes at most max_overhead
+    of aggregation time however big the aggregate grows (None or 0: every checkpoint is saved)
+    """
+    def __init__(self, checkpoint_file, filename, identity, options, max_overhead=None):
+        self.checkpoint_file, self.filename, self.identity, self.options = \
+            checkpoint_file, filename, identity, options
+        self.max_overhead = max_overhead
+        self._saved, self._save_time = time.time(), 0.0
+
+    def __call__(self, offset, aggregate):
+        started = time.time()
+        if self.max_overhead and (started - self._saved) * self.max_overhead < self._save_time:
+            return
+        save_checkpoint(self.checkpoint_file, self.filename, self.identity, offset, aggregate, self.options)
+        self._saved = time.time()
+        self._save_time = self._saved - started
+
+
+def load_checkpoint(checkpoint_file, filename, identity=None):
+    """
+    returns checkpoint for filename if it is still valid: the file is the same (inode, size, mtime),
+    so a log rotated to the same name or changed in any way is aggregated from the start
+    """
+    if not os.path.isfile(checkpoint_file):
+        return None
+    with open(checkpoint_file, "rb") as infile:
+        ckpt = pickle.load(infile)
+
+    if ckpt.filename != os.path.realpath(filename):
+        return None
+    identity = identity or file_identity(filename)
+    return ckpt if identity == ckpt.identity else None
@@ -0,0 +1,121 @@
+# -*- coding: utf-8 -*-
+# Columnar url statistics: url dictionary plus parallel arrays of url ids and request times.
+# Per url stats are computed with numpy instead of python loops over urls.
+from array import array
+
+from logwiz.canon import capped_get
+from logwiz.sampling import scale_row
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+
+def check_numpy():
+    if np is None:
+        raise RuntimeError("numpy is required for columnar stats")
+
+
+class ColumnarStats(object):
+    def __init__(self, max_urls=None):
+        self.max_urls = max_urls
+        self.urls = []
+        self.url_ids = {}
+        self.ids = array("l")
+        self.times = array("d")
+
+    def __len__(self):
+        return len(self.urls)
+
+    def _new_id(self, url):
+        self.urls.append(url)
+        return len(self.urls) - 1
+
+    def _url_id(self, url):
+        url_id = self.url_ids.get(url)
+        return url_id if url_id is not None else capped_get(self.url_ids, url, self.max_urls, self._new_id)[1]
+
+    def append(self, url, request_time):
+        """
+        returns the key request is aggregated under: url or OTHER_URL if it is folded
+        """
+        url_id = self._url_id(url)
+        self.ids.append(url_id)
+        self.times.append(request_time)
+        return self.urls[url_id]
+
+    def extend(self, other):
+        if not other.ids:
+            return
+        remap = np.array([self._url_id(url) for url in other.urls], dtype=self.ids.typecode)
+        self.ids.fromstring(remap[np.frombuffer(other.ids, dtype=other.ids.typecode)].tostring())
+        self.times.extend(other.times)
+
+    def iteritems(self):
+        """
+        url -> list of its request times (in order of appearance), like dict of lists
+        """
+        if not self.ids:
+            return
+        ids = np.frombuffer(self.ids, dtype=self.ids.typecode)
+        sorted_times = np.frombuffer(self.times, dtype=np.float64)[np.argsort(ids, kind="mergesort")]
+        start = 0
+        for url, end in zip(self.urls, np.cumsum(np.bincount(ids, minlength=len(self.urls)))):
+            yield url, sorted_times[start:end].tolist()
+            start = end
+
+
+def calc_url_stats_columnar(data, top=None, sample_fraction=None):
+    """
+    same output as parser.calc_url_stats for ColumnarStats:
+    count and sum via np.bincount, top urls by avg via np.argpartition,
+    median and max from a sort restricted to request times of top urls
+    """
+    check_numpy()
+    n = len(data.urls)
+    if not n:
+        return []
+    ids = np.frombuffer(data.ids, dtype=data.ids.typecode)
+    times = np.frombuffer(data.times, dtype=np.float64)
+
+    counts = np.bincount(ids, minlength=n)
+    sums = np.bincount(ids, weights=times, minlength=n)
+    avgs = sums / counts
+    sumsqs = np.bincount(ids, weights=times * times, minlength=n) if sample_fraction else None
+    total_count = float(counts.sum())
+    total_time = float(sums.sum())
+
+    if top is not None and top < n:
+        top_ids = np.argpartition(-avgs, top - 1)[:top] if top > 0 else np.array([], dtype=int)
+    else:
+        top_ids = np.arange(n)
+    top_ids = top_ids[np.argsort(-avgs[top_ids], kind="mergesort")]
+
+    selected = np.zeros(n, dtype=bool)
+    selected[top_ids] = True
+    mask = selected[ids]
+    sel_ids, sel_times = ids[mask], times[mask]
+    sorted_times = sel_times[np.lexsort((sel_times, sel_ids))]
+    group_ids = np.flatnonzero(selected)
+    starts = np.cumsum(counts[group_ids]) - counts[group_ids]
+    position = np.empty(n, dtype=np.int64)
+    position[group_ids] = starts
+
+    result = []
+    for url_id in top_ids:
+        count, start = int(counts[url_id]), position[url_id]
+        row = {
+            "url": data.urls[url_id],
+            "count": count,
+            "time_avg": round(float(avgs[url_id]), 3),
+            "time_sum": round(float(sums[url_id]), 3),
+            "time_max": round(float(sorted_times[start + count - 1]), 3),
+            "time_med": round(float(sorted_times[start + count // 2]), 3),
+            "count_perc": round(100 * count / total_count, 3),
+            "time_perc": round(100 * float(sums[url_id]) / total_time, 3)
+            }
+        if sample_fraction:
+            scale_row(row, count, float(sums[url_id]), float(sumsqs[url_id]), sample_fraction)
+        result.append(row)
+    return result
@@ -1,4 +1,5 @@
 # -*- coding: utf-8 -*-
+import os
 import json
 import logging
 
@@ -17,7 +18,54 @@ DEFAULT_CONFIG = {
     "MAX_ERRORS": 100,
     "MAX_ERRORS_RATIO": 10,
     "LOG_ENCODING": "utf-8",
-    "REPORT_ENCODING": "utf-8"
+    "REPORT_ENCODING": "utf-8",
+    "WORKERS": 1,
+    "SKETCH_ACCURACY": None,
+    "PARSER": "full",
+    "CHECKPOINT_INTERVAL": None,
+    "CHECKPOINT_MAX_OVERHEAD": 0.1,
+    "COLUMNAR": False,
+    "BACKFILL_WORKERS": 4,
+    "AGGREGATE_DIR": None,
+    "AGGREGATE_DATE_TEMPLATE": "aggregate-%Y.%m.%d.bin",
+    "ROLLUP_REPORT_TEMPLATE": "rollup-{start:%Y.%m.%d}-{end:%Y.%m.%d}.html",
+    "MMAP": False,
+    "URL_STRIP_QUERY": False,
+    "URL_NUMERIC_IDS": False,
+    "URL_REWRITES": [],
+    "MAX_URLS": None,
+    "ERRORS_CHECK_MIN_LINES": 1000,
+    "LOG_FORMAT": None,
+    "DIMENSIONS": [],
+    "SERIES_BUCKET": None,
+    "SERIES_MAX_URLS": 1000,
+    "HEATMAP_URLS": 20,
+    "WATCH_POLL_INTERVAL": 5,
+    "WATCH_SETTLE": 30,
+    "WATCH_HEARTBEAT": 60,
+    "WATCH_HEALTH_FILE": None,
+    "MEMORY_BUDGET_MB": None,
+    "SPILL_DIR": None,
+    "GZIP_INDEX_SPAN_MB": None,
+    "GZIP_INDEX_DIR": None,
+    "REPORT_PAGE_SIZE": None,
+    "REPORT_GZIP_PAGES": False,
+    "EXEMPLARS": None,
+    "EXEMPLARS_MAX_URLS": 10000,
+    "CLIENTS_FIELD": None,
+    "CLIENTS_PRECISION": 10,
+    "CLIENTS_MAX_URLS": 10000,
+    "SERVICES": [],
+    "SERVICE_WORKERS": 4,
+    "TAIL_LOG": "nginx-access-ui.log",
+    "TAIL_WINDOWS": [60, 300, 900],
+    "TAIL_SLOT": 5,
+    "TAIL_POLL_INTERVAL": 0.5,
+    "TAIL_REFRESH": 5,
+    "TAIL_TOP": 50,
+    "TAIL_MAX_URLS": 10000,
+    "TAIL_HTTP_PORT": None,
+    "TAIL_REPORT_FILE": None
 }
 
 
@@ -27,3 +75,26 @@ def read_config(config_file=None):
         with open(config_file) as conf_file:
             conf.update(json.load(conf_file))
     return conf
+
+
+def timestamp_file_for(timestamp_file, service):
+    root, ext = os.path.splitext(timestamp_file)
+    return "%s.%s%s" % (root, service, ext)
+
+
+def service_configs(conf):
+    """
+    configs of SERVICES sections: every section (dict with unique NAME) overrides keys of the top-level config.
+    without TIMESTAMP_FILE in section service timestamp is written next to the top-level one, e.g. log_analyzer.ui.ts
+    """
+    base = dict((key, value) for key, value in conf.iteritems() if key != "SERVICES")
+    confs, names = [], set()
+    for section in conf["SERVICES"]:
+        name = section.get("NAME")
+        if not name or name in names:
+            raise ValueError("Every service section should have unique NAME, got %r" % name)
+        names.add(name)
+        service_conf = dict(base, TIMESTAMP_FILE=timestamp_file_for(conf["TIMESTAMP_FILE"], name))
+        service_conf.update(section)
+        confs.append(service_conf)
+    return confs
@@ -0,0 +1,104 @@
+# -*- coding: utf-8 -*-
+# Aggregator plugins: breakdowns of request times (or other values of requests) by arbitrary keys,
+# fed in the same pass as url stats. Every dimension gets its own report section.
+from importlib import import_module
+
+
+class Dimension(object):
+    """
+    requests are grouped by key(rec), rec is a dict of parsed fields listed in fields.
+    value(rec) of every request is aggregated (count, sum, avg, med, max...), request_time by default,
+    e.g. body_bytes_sent, or 1.0 for errors and 0.0 otherwise to get error rate as avg.
+    value_name: prefix of stats fields in report rows (time_sum -> bytes_sum etc)
+    max_keys: keys over the limit are folded into OTHER_URL bucket
+    sort_by: report row field to sort section by (descending), None to sort by key
+    top: number of rows in report section, None for all (or report size)
+    """
+    name = None
+    fields = ()
+    value_name = "time"
+    max_keys = None
+    sort_by = None
+    top = None
+
+    def key(self, rec):
+        raise NotImplementedError
+
+    def value(self, rec):
+        return float(rec["request_time"])
+
+
+class FieldDimension(Dimension):
+    """
+    requests grouped by value of a parsed field,
+    value_field: numeric parsed field aggregated instead of request_time (named value_name in report)
+    """
+    def __init__(self, name, field, max_keys=None, sort_by=None, top=None, value_field=None, value_name=None):
+        self.name = name
+        self.field = field
+        self.fields = (field, value_field) if value_field else (field,)
+        self.max_keys = max_keys
+        self.sort_by = sort_by
+        self.top = top
+        self.value_field = value_field
+        self.value_name = value_name or (value_field if value_field else "time")
+
+    def key(self, rec):
+        return rec[self.field]
+
+    def value(self, rec):
+        return float(rec[self.value_field or "request_time"])
+
+
+class StatusDimension(FieldDimension):
+    def __init__(self):
+        super(StatusDimension, self).__init__("status", "status")
+
+
+class ClientDimension(FieldDimension):
+    def __init__(self):
+        super(ClientDimension, self).__init__("client", "remote_addr", max_keys=100000, sort_by="time_sum")
+
+
+class HourDimension(Dimension):
+    """
+    hour of day from time_local (dd/Mon/yyyy:HH:MM:SS +zzzz)
+    """
+    name = "hour"
+    fields = ("time_local",)
+
+    def key(self, rec):
+        hour = rec["time_local"][12:14]
+        if not hour.isdigit():
+            raise ValueError("Malformed time_local %s" % rec["time_local"])
+        return hour
+
+
+DIMENSIONS = {
+    "status": StatusDimension,
+    "client": ClientDimension,
+    "hour": HourDimension
+    }
+
+
+def load_dimension(spec):
+    """
+    spec: name of built-in dimension (see DIMENSIONS), "package.module:Class" of a Dimension subclass
+    or dict of FieldDimension arguments
+    """
+    if isinstance(spec, dict):
+        return FieldDimension(**spec)
+    if spec in DIMENSIONS:
+        return DIMENSIONS[spec]()
+    module, sep, name = spec.partition(":")
+    if not sep:
+        raise ValueError("Unknown dimension %s" % spec)
+    return getattr(import_module(module), name)()
+
+
+def load_dimensions(specs):
+    dimensions = [load_dimension(spec) for spec in specs or ()]
+    names = [dim.name for dim in dimensions]
+    if len(set(names)) != len(names) or "url" in names:
+        raise ValueError("Dimension names should be unique and differ from url: %s" % ", ".join(names))
+    return dimensions
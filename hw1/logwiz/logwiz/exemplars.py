@@ -0,0 +1,104 @@
+# -*- coding: utf-8 -*-
+# K slowest requests (exemplars) per url collected while parsing, so that outliers of a report
+# can be looked up in the log by request id without another scan.
+# Memory is bounded by max_urls x k records, every line costs one comparison (O(log k) if it gets in).
+# Over max_urls the tracked urls are the ones with the slowest requests: a new url replaces the tracked url
+# with the smallest max request time if its request is slower, records of the replaced url move to OTHER_URL.
+import heapq
+
+from logwiz.canon import OTHER_URL, fold_key
+
+
+EXEMPLAR_FIELDS = ("http_X_REQUEST_ID", "time_local")
+
+
+class Exemplars(object):
+    """
+    url -> min-heap of the k slowest (request_time, request_id, time_local) records.
+    at most max_urls urls (with the slowest requests) are tracked, others are folded into OTHER_URL.
+    fields of lines parsed as bytes are kept as bytes and decoded with the log encoding for the report
+    """
+    encoding = "utf-8"  # exemplars pickled before the encoding was kept
+
+    def __init__(self, k=5, max_urls=10000, encoding="utf-8"):
+        self.k = k
+        self.max_urls = max_urls
+        self.encoding = encoding
+        self.heaps = {}
+        self._maxes = {}  # tracked url (except OTHER_URL) -> max request time of its records
+        self._by_max = []  # min-heap of (max request time, url), entries with outdated max are skipped
+
+    def _min_max_url(self):
+        while self._by_max:
+            request_time, url = self._by_max[0]
+            if self._maxes.get(url) == request_time:
+                return url
+            heapq.heappop(self._by_max)
+        return None
+
+    def _track(self, url, request_time):
+        """
+        (url, heap) to add a record with request_time of url to: url is tracked if there is room for it
+        or if it is slower than the tracked url with the smallest max, OTHER_URL otherwise
+        """
+        if fold_key(self._maxes, url, self.max_urls) == OTHER_URL:
+            fastest = self._min_max_url()
+            if fastest is None or request_time <= self._maxes[fastest]:
+                return OTHER_URL, self._url_heap(OTHER_URL)
+            del self._maxes[fastest]
+            other = self._url_heap(OTHER_URL)
+            for record in self.heaps.pop(fastest):
+                self._push(OTHER_URL, other, record)
+        return url, self._url_heap(url)
+
+    def _url_heap(self, url):
+        heap = self.heaps.get(url)
+        if heap is None:
+            heap = self.heaps[url] = []
+        return heap
+
+    def _push(self, url, heap, record):
+        if len(heap) < self.k:
+            heapq.heappush(heap, record)
+        elif record > heap[0]:
+            heapq.heapreplace(heap, record)
+        else:
+            return
+        if url != OTHER_URL and record[0] > self._maxes.get(url, -1.0):
+            self._maxes[url] = record[0]
+            heapq.heappush(self._by_max, (record[0], url))
+            if len(self._by_max) > 4 * len(self._maxes) + 16:
+                self._by_max = [(request_time, key) for key, request_time in self._maxes.iteritems()]
+                heapq.heapify(self._by_max)
+
+    def add(self, url, request_time, request_id, time_local):
+        heap = self.heaps.get(url)
+        if heap is None:
+            url, heap = self._track(url, request_time)
+        if len(heap) < self.k or request_time > heap[0][0]:
+            self._push(url, heap, (request_time, request_id, time_local))
+
+    def update(self, other):
+        for url, other_heap in other.heaps.iteritems():
+            if not other_heap:
+                continue
+            heap = self.heaps.get(url)
+            if heap is None:
+                url, heap = self._track(url, max(other_heap)[0])
+            for record in other_heap:
+                self._push(url, heap, record)
+
+    def tracked(self, url):
+        return url in self.heaps
+
+    def slowest(self, url):
+        """
+        report data: exemplars of url, the slowest first
+        """
+        return [{"request_time": request_time, "request_id": _text(request_id, self.encoding),
+                 "time_local": _text(time_local, self.encoding)}
+                for request_time, request_id, time_local in sorted(self.heaps.get(url, ()), reverse=True)]
+
+
+def _text(value, encoding):
+    return value.decode(encoding, "replace") if isinstance(value, bytes) else value
@@ -0,0 +1,246 @@
+# -*- coding: utf-8 -*-
+# Random access to gzipped logs in the style of zlib's examples/zran.c: access points (compressed offset,
+# bit offset and last 32K of uncompressed data) are recorded every span bytes of uncompressed data while
+# the log is read for the first time and stored in a sidecar index, later reads start inflating at any
+# access point. Uses libz through ctypes (zlib module lacks inflatePrime), no index without libz.
+import os
+import io
+import zlib
+import ctypes
+import ctypes.util
+import cPickle as pickle
+from bisect import bisect_right
+from collections import namedtuple
+from logging import info
+
+from logwiz.checkpoint import file_identity
+
+
+INDEX_SUFFIX = ".idx"
+INDEX_VERSION = 1
+INDEX_SPAN = 16 << 20  # uncompressed bytes between access points
+WINDOW_SIZE = 32768
+INFLATE_OUT_SIZE = 1 << 18
+CHUNK_SIZE = 8 << 20  # uncompressed bytes per chunk of data returned
+
+Z_NO_FLUSH, Z_BLOCK = 0, 5
+Z_OK, Z_STREAM_END, Z_BUF_ERROR = 0, 1, -5
+_GZIP_WBITS, _RAW_WBITS = 16 + 15, -15
+_GZIP_TRAILER_SIZE = 8
+
+AccessPoint = namedtuple("AccessPoint", "out line_start offset bits window")
+
+
+class _ZStream(ctypes.Structure):
+    _fields_ = [("next_in", ctypes.c_void_p), ("avail_in", ctypes.c_uint), ("total_in", ctypes.c_ulong),
+                ("next_out", ctypes.c_void_p), ("avail_out", ctypes.c_uint), ("total_out", ctypes.c_ulong),
+                ("msg", ctypes.c_char_p), ("state", ctypes.c_void_p),
+                ("zalloc", ctypes.c_void_p), ("zfree", ctypes.c_void_p), ("opaque", ctypes.c_void_p),
+                ("data_type", ctypes.c_int), ("adler", ctypes.c_ulong), ("reserved", ctypes.c_ulong)]
+
+
+def _load_libz():
+    path = ctypes.util.find_library("z")
+    if not path:
+        return None
+    try:
+        lib = ctypes.CDLL(path)
+    except OSError:
+        return None
+    stream_p = ctypes.POINTER(_ZStream)
+    lib.zlibVersion.restype = ctypes.c_char_p
+    for name, argtypes in [("inflateInit2_", [stream_p, ctypes.c_int, ctypes.c_char_p, ctypes.c_int]),
+                           ("inflate", [stream_p, ctypes.c_int]),
+                           ("inflateEnd", [stream_p]),
+                           ("inflateReset", [stream_p]),
+                           ("inflateReset2", [stream_p, ctypes.c_int]),
+                           ("inflatePrime", [stream_p, ctypes.c_int, ctypes.c_int]),
+                           ("inflateSetDictionary", [stream_p, ctypes.c_char_p, ctypes.c_uint])]:
+        func = getattr(lib, name)
+        func.argtypes, func.restype = argtypes, ctypes.c_int
+    return lib
+
+libz = _load_libz()
+
+
+def _check(ret, strm):
+    if ret < 0 and ret != Z_BUF_ERROR:
+        raise zlib.error("Error %d while decompressing data: %s" % (ret, strm.msg))
+    return ret
+
+
+def _gen_inflate(infile, raw=False, flush=Z_NO_FLUSH, prime=None, window=None,
+                 read_size=1 << 20, out_size=INFLATE_OUT_SIZE):
+    """
+    (uncompressed data, strm.data_type, offset of the next compressed byte) after every inflate call.
+    infile is positioned at the start of a gzip member (or of raw deflate data with raw set, primed with
+    prime=(bits, value) and window dictionary); following gzip members are inflated too
+    """
+    strm = _ZStream()
+    _check(libz.inflateInit2_(strm, _RAW_WBITS if raw else _GZIP_WBITS, libz.zlibVersion(),
+                              ctypes.sizeof(strm)), strm)
+    try:
+        if prime:
+            _check(libz.inflatePrime(strm, *prime), strm)
+        if window:
+            _check(libz.inflateSetDictionary(strm, window, len(window)), strm)
+        out = ctypes.create_string_buffer(out_size)
+        out_addr = ctypes.addressof(out)
+        pos, data, skip, full = infile.tell(), b"", 0, False
+        while True:
+            if not strm.avail_in and not full:
+                data = infile.read(read_size)
+                if not data:
+                    return
+                pos += len(data)
+                if skip:  # trailer of a member inflated as raw data
+                    data, skip = data[skip:], max(skip - len(data), 0)
+                    if not data:
+                        continue
+                strm.next_in = ctypes.cast(ctypes.c_char_p(data), ctypes.c_void_p)
+                strm.avail_in = len(data)
+            strm.next_out, strm.avail_out = out_addr, out_size
+            ret = _check(libz.inflate(strm, flush), strm)
+            full = not strm.avail_out
+            yield ctypes.string_at(out_addr, out_size - strm.avail_out), strm.data_type, pos - strm.avail_in
+            if ret == Z_STREAM_END:
+                if raw:
+                    raw, skip = False, _GZIP_TRAILER_SIZE
+                    cut = min(skip, strm.avail_in)
+                    strm.next_in, strm.avail_in, skip = strm.next_in + cut, strm.avail_in - cut, skip - cut
+                    _check(libz.inflateReset2(strm, _GZIP_WBITS), strm)
+                else:
+                    _check(libz.inflateReset(strm), strm)
+                full = False
+    finally:
+        libz.inflateEnd(strm)
+
+
+class GzipIndex(object):
+    """
+    access points of gzipped log with given identity, size: uncompressed size.
+    line_start of access point: offset of the first line starting at or after it
+    """
+    def __init__(self, identity, span, size, points):
+        self.version = INDEX_VERSION
+        self.identity = identity
+        self.span = span
+        self.size = size
+        self.points = points
+
+    def point_before(self, offset):
+        """
+        the last access point at or before uncompressed offset (None: start of file)
+        """
+        idx = bisect_right([point.out for point in self.points], offset)
+        return self.points[idx - 1] if idx else None
+
+    def ranges(self, start=0):
+        """
+        ranges of lines from uncompressed offset start (a line boundary) to the end split at access points
+        """
+        bounds = [start] + [point.line_start for point in self.points if start < point.line_start < self.size]
+        return zip(bounds, bounds[1:] + [self.size]) if start < self.size else []
+
+
+def index_file_for(filename, index_dir=None):
+    """
+    hidden sidecar file next to the log (or in index_dir), so that it never matches log templates
+    """
+    log_dir, name = os.path.split(filename)
+    return os.path.join(index_dir or log_dir, "." + name + INDEX_SUFFIX)
+
+
+def load_index(filename, index_dir=None):
+    """
+    index of gzipped log if it was built for this very file, None otherwise
+    """
+    index_file = index_file_for(filename, index_dir)
+    if libz is None or not os.path.isfile(index_file):
+        return None
+    try:
+        with open(index_file, "rb") as infile:
+            index = pickle.load(infile)
+    except (EOFError, IOError, pickle.UnpicklingError):
+        return None
+    if not isinstance(index, GzipIndex) or index.version != INDEX_VERSION or \
+            index.identity != file_identity(filename):
+        return None
+    return index
+
+
+def save_index(index, index_file):
+    tmp_file = "%s.%d.tmp" % (index_file, os.getpid())
+    try:
+        with open(tmp_file, "wb") as outfile:
+            pickle.dump(index, outfile, pickle.HIGHEST_PROTOCOL)
+        os.rename(tmp_file, index_file)
+    except (IOError, OSError) as e:
+        info("Can not save gzip index %s: %s" % (index_file, e))
+        try:
+            os.remove(tmp_file)
+        except OSError:
+            pass
+
+
+def _gen_indexing(filename, span, index_file, read_size):
+    """
+    uncompressed data of gzipped log, index is saved once all of it was read
+    """
+    identity = file_identity(filename)
+    points, pending, out, last, window = [], None, 0, 0, b""
+    with io.open(filename, "rb") as infile:
+        for data, data_type, offset in _gen_inflate(infile, flush=Z_BLOCK, read_size=read_size):
+            if data:
+                if pending is not None:
+                    nl = data.find(b"\n")
+                    if nl >= 0:
+                        points.append(pending._replace(line_start=out + nl + 1))
+                        pending = None
+                out += len(data)
+                window = data[-WINDOW_SIZE:] if len(data) >= WINDOW_SIZE else (window + data)[-WINDOW_SIZE:]
+                yield data
+            # end of deflate block which is not the last one of gzip member
+            if data_type & 128 and not data_type & 64 and out - last >= span and pending is None:
+                pending = AccessPoint(out, None, offset, data_type & 7, zlib.compress(window))
+                last = out
+    save_index(GzipIndex(identity, span, out, points), index_file)
+
+
+def _gen_from_point(filename, point, read_size):
+    with io.open(filename, "rb") as infile:
+        if point is None:
+            chunks = _gen_inflate(infile, read_size=read_size)
+        else:
+            infile.seek(point.offset - (1 if point.bits else 0))
+            prime = (point.bits, ord(infile.read(1)) >> (8 - point.bits)) if point.bits else None
+            chunks = _gen_inflate(infile, raw=True, prime=prime, window=zlib.decompress(point.window),
+                                  read_size=read_size)
+        for data, _, _ in chunks:
+            if data:
+                yield data
+
+
+def _gen_coalesced(chunks, size=CHUNK_SIZE):
+    parts, total = [], 0
+    for data in chunks:
+        parts.append(data)
+        total += len(data)
+        if total >= size:
+            yield b"".join(parts)
+            parts, total = [], 0
+    if parts:
+        yield b"".join(parts)
+
+
+def open_indexed(filename, start=0, span=INDEX_SPAN, index_dir=None, read_size=1 << 20):
+    """
+    (skip, chunks): chunks of uncompressed data of gzipped log starting skip bytes before offset start.
+    with a valid index inflating starts at the nearest access point, otherwise the whole log is inflated
+    and the index is built on the way
+    """
+    index = load_index(filename, index_dir)
+    if index is None:
+        return start, _gen_coalesced(_gen_indexing(filename, span, index_file_for(filename, index_dir), read_size))
+    point = index.point_before(start)
+    return start - (point.out if point else 0), _gen_coalesced(_gen_from_point(filename, point, read_size))
@@ -0,0 +1,127 @@
+# -*- coding: utf-8 -*-
+# Distinct clients per url estimated with HyperLogLog: 2^precision one-byte registers per url,
+# relative standard error 1.04 / sqrt(2^precision). Registers of workers and days are merged with max.
+import math
+import struct
+from hashlib import md5
+
+from logwiz.canon import OTHER_URL, capped_get
+
+
+MIN_PRECISION, MAX_PRECISION = 4, 16
+NO_VALUE = "-"
+_HASH_CACHE_SIZE = 1 << 16
+
+
+def _hash64(value):
+    if isinstance(value, unicode):
+        value = value.encode("utf-8")
+    return struct.unpack("<Q", md5(value).digest()[:8])[0]
+
+
+class HyperLogLog(object):
+    def __init__(self, precision=10, registers=None):
+        if not MIN_PRECISION <= precision <= MAX_PRECISION:
+            raise ValueError("HyperLogLog precision should be in [%d, %d], got %s" %
+                             (MIN_PRECISION, MAX_PRECISION, precision))
+        self.precision = precision
+        self.registers = bytearray(registers) if registers is not None else bytearray(1 << precision)
+
+    def position(self, value):
+        """
+        (register index, rank) of value
+        """
+        x = _hash64(value)
+        bits = 64 - self.precision
+        return x >> bits, bits - (x & ((1 << bits) - 1)).bit_length() + 1
+
+    def add_position(self, idx, rank):
+        if rank > self.registers[idx]:
+            self.registers[idx] = rank
+
+    def add(self, value):
+        self.add_position(*self.position(value))
+
+    def merge(self, other):
+        if other.precision != self.precision:
+            raise ValueError("Can not merge HyperLogLog with different precision (%s, %s)" %
+                             (self.precision, other.precision))
+        self.registers = bytearray(max(pair) for pair in zip(self.registers, other.registers))
+
+    def error(self):
+        """
+        relative standard error of estimate
+        """
+        return 1.04 / math.sqrt(len(self.registers))
+
+    def estimate(self):
+        m = len(self.registers)
+        alpha = {16: 0.673, 32: 0.697, 64: 0.709}.get(m, 0.7213 / (1 + 1.079 / m))
+        raw = alpha * m * m / sum(2.0 ** -r for r in self.registers)
+        zeros = self.registers.count(b"\0")
+        if raw <= 2.5 * m and zeros:
+            return m * math.log(float(m) / zeros)  # linear counting for small cardinalities
+        return raw
+
+
+class UrlClients(object):
+    """
+    url -> HyperLogLog of values of field (e.g. remote_addr or http_X_RB_USER), "-" values are skipped.
+    urls are the keys of url stats (urls which stats fold into OTHER_URL are counted there too),
+    urls over max_urls are folded into OTHER_URL
+    """
+    def __init__(self, field="remote_addr", precision=10, max_urls=10000):
+        HyperLogLog(precision)  # validate
+        self.field = field
+        self.precision = precision
+        self.max_urls = max_urls
+        self.counters = {}
+        self._positions = {}
+
+    def _url_counter(self, url):
+        return capped_get(self.counters, url, self.max_urls, lambda _: HyperLogLog(self.precision))[1]
+
+    def add(self, url, value):
+        if value == NO_VALUE:
+            return
+        counter = self.counters.get(url)
+        if counter is None:
+            counter = self._url_counter(url)
+        position = self._positions.get(value)  # clients repeat a lot, hashing them is the costly part
+        if position is None:
+            if len(self._positions) >= _HASH_CACHE_SIZE:
+                self._positions.clear()
+            position = self._positions[value] = counter.position(value)
+        counter.add_position(*position)
+
+    def update(self, other, folded=()):
+        """
+        folded: urls of other which url stats fold into OTHER_URL
+        """
+        for url, counter in other.counters.iteritems():
+            self._url_counter(OTHER_URL if url in folded else url).merge(counter)
+
+    def __getstate__(self):
+        state = dict(self.__dict__)
+        state["_positions"] = {}
+        return state
+
+
+def add_clients(url_stats, counters):
+    """
+    add distinct clients estimate (and its standard error) of url to every report row,
+    counters: url -> HyperLogLog, rows are left as is if it is empty (clients were not counted).
+    both are None for urls which were not tracked (folded into OTHER_URL over max_urls), so that all rows
+    have the same columns
+    """
+    if not counters:
+        return url_stats
+    for row in url_stats:
+        counter = counters.get(row["url"])
+        if counter is None:
+            row["clients"] = row["clients_err"] = None
+            continue
+        estimate = counter.estimate()
+        row["clients"] = int(round(estimate))
+        row["clients_err"] = int(math.ceil(estimate * counter.error()))
+    return url_stats
@@ -0,0 +1,101 @@
+# -*- coding: utf-8 -*-
+# Parsers compiled from nginx log_format specifications.
+# Straight-line python code is generated per format: every variable is delimited by str.find of the literal
+# text following it, only requested fields are sliced out of the line.
+import re
+
+
+_VARIABLE = re.compile(r"\$(?:\{(\w+)\}|(\w+))")
+_QUOTED = re.compile(r"'([^']*)'|\"([^\"]*)\"")
+_DIRECTIVE = re.compile(r"^\s*log_format\s+\S+\s+(.*?);?\s*$", flags=re.DOTALL)
+
+_PARSER_CACHE = {}
+
+
+class LogFormatError(ValueError):
+    pass
+
+
+def normalize_log_format(spec):
+    """
+    log_format string from nginx config: either the format itself or the whole
+    log_format directive / sequence of quoted strings as written in nginx.conf.
+    ASCII formats are converted to str, so compiled parsers work for both bytes and decoded lines
+    """
+    if isinstance(spec, unicode):
+        try:
+            spec = spec.encode("ascii")
+        except UnicodeError:
+            pass
+    match = _DIRECTIVE.match(spec)
+    if match:
+        spec = match.group(1)
+    if spec.strip()[:1] in ("'", '"'):
+        spec = "".join(single or double for single, double in _QUOTED.findall(spec))
+    return spec
+
+
+def tokenize(log_format):
+    """
+    list of (literal, variable) pairs, variable is None for the trailing literal
+    """
+    tokens, pos = [], 0
+    for match in _VARIABLE.finditer(log_format):
+        tokens.append((log_format[pos:match.start()], match.group(1) or match.group(2)))
+        pos = match.end()
+    tokens.append((log_format[pos:], None))
+    return tokens
+
+
+def _parser_source(tokens, fields):
+    code = ["def parse(line):", "    find = line.find"]
+    first_literal = tokens[0][0]
+    if first_literal:
+        code.append("    if not line.startswith(%r):" % first_literal)
+        code.append("        return None")
+    code.append("    pos = %d" % len(first_literal))
+    values = {}
+    for i, (_, variable) in enumerate(tokens[:-1]):
+        delimiter = tokens[i + 1][0]
+        needed = variable in fields and variable not in values
+        if needed:
+            values[variable] = "v%d" % i
+        if i == len(tokens) - 2 and not delimiter.strip():
+            # last variable runs up to the end of line
+            if needed:
+                code.append("    v%d = line[pos:].strip()" % i)
+                code.append("    if not v%d:" % i)
+                code.append("        return None")
+            continue
+        if not delimiter:
+            raise LogFormatError("Variables $%s and $%s are not delimited" % (variable, tokens[i + 1][1]))
+        code.append("    end = find(%r, pos)" % delimiter)
+        code.append("    if end < 0:")
+        code.append("        return None")
+        if needed:
+            code.append("    v%d = line[pos:end]" % i)
+        code.append("    pos = end + %d" % len(delimiter))
+    if len(tokens) > 1 and tokens[-1][0].strip():
+        code.append("    if line[pos:].strip():")
+        code.append("        return None")
+    code.append("    return {%s}" % ", ".join("%r: %s" % (field, values[field]) for field in sorted(values)))
+    return "\n".join(code) + "\n"
+
+
+def compile_parser(log_format, fields):
+    """
+    parser of lines written with nginx log_format returning dict of given fields (variable names
+    without $) or None for lines which do not match the format. parsers are cached per format and fields
+    """
+    fields = tuple(sorted(set(fields)))
+    key = (log_format, fields)
+    parser = _PARSER_CACHE.get(key)
+    if parser is None:
+        tokens = tokenize(normalize_log_format(log_format))
+        missing = set(fields) - set(variable for _, variable in tokens)
+        if missing:
+            raise LogFormatError("Fields %s are missing in log_format" % ", ".join(sorted(missing)))
+        namespace = {}
+        exec _parser_source(tokens, fields) in namespace
+        parser = _PARSER_CACHE[key] = namespace["parse"]
+    return parser
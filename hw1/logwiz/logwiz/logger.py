@@ -0,0 +1,17 @@
+# -*- coding: utf-8 -*-
+import os
+import sys
+import logging
+
+
+def init_logger(level, log_dir=None):
+    logfile = os.path.join(log_dir, "log-analyzer.log") if log_dir else None
+    if log_dir and not os.path.isdir(log_dir):
+        os.makedirs(log_dir)
+    logging.basicConfig(
+            format='[%(asctime)s] %(levelname).1s %(message)s',
+            datefmt="%Y.%m.%d %H:%M:%S",
+            stream=sys.stdout if not logfile else None,
+            filename=logfile,
+            level=level
+            )
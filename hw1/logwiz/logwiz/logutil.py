@@ -6,20 +6,58 @@ import os
 from collections import namedtuple
 from datetime import datetime
 
-LogWithDate = namedtuple("Log", "name date")
+try:
+    from os import scandir
+except ImportError:
+    try:
+        from scandir import scandir
+    except ImportError:
+        scandir = None
 
+LogWithDate = namedtuple("LogWithDate", "name date")
 
-def get_last_log(log_dir, log_template):
+
+def _list_files(path):
+    if scandir is None:
+        return os.listdir(path)
+    return [entry.name for entry in scandir(path)]
+
+
+def _gen_matching_logs(log_dir, log_template):
     log_re = re.compile(log_template)
+    for fname in _list_files(log_dir):
+        m = log_re.match(fname)
+        if m:
+            yield fname, m.group("DATE")
+
+
+def get_last_log(log_dir, log_template):
     if not os.path.exists(log_dir):
         return None
 
     last_log = last_log_date = None
-    for fname in os.listdir(log_dir):
-        m = log_re.match(fname)
-        if not m:
-            continue
-        dt = m.group("DATE")
+    for fname, dt in _gen_matching_logs(log_dir, log_template):
         if not last_log or dt > last_log_date:
             last_log, last_log_date = fname, dt
     return LogWithDate(last_log, datetime.strptime(last_log_date, "%Y%m%d")) if last_log else None
+
+
+def get_unreported_logs(log_dir, log_template, report_dir, report_template):
+    """
+    all logs (one per date) without report named by report_template in report_dir, sorted by date.
+    each directory is scanned only once
+    """
+    if not os.path.exists(log_dir):
+        return []
+    reports = set(_list_files(report_dir)) if os.path.isdir(report_dir) else set()
+
+    logs = {}
+    for fname, dt in _gen_matching_logs(log_dir, log_template):
+        if dt not in logs or fname < logs[dt]:
+            logs[dt] = fname
+    result = []
+    for dt in sorted(logs):
+        date = datetime.strptime(dt, "%Y%m%d")
+        if date.strftime(report_template) not in reports:
+            result.append(LogWithDate(logs[dt], date))
+    return result
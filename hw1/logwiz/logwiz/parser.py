@@ -6,11 +6,30 @@
 #                     '"$http_user_agent" "$http_x_forwarded_for" "$http_X_REQUEST_ID" "$http_X_RB_USER" '
 #                     '$request_time';
 import re
-import gzip
-from collections import defaultdict
+import os
 import io
+import time
+import heapq
+from collections import deque
+from contextlib import contextmanager
+from itertools import izip
+from multiprocessing import Pool
 
-from logwiz.logger import info, exception
+from logging import info, warning, exception
+
+from logwiz.sketch import StreamingStats, PERCENTILES
+from logwiz.checkpoint import Checkpointer, file_identity, load_checkpoint, remove_checkpoint
+from logwiz.columnar import ColumnarStats, calc_url_stats_columnar, check_numpy
+from logwiz.readers import split_ranges, gen_lines, gen_gzip_blocks, gen_threaded
+from logwiz.gzindex import load_index
+from logwiz.canon import UrlCanonicalizer, capped_get
+from logwiz.logformat import compile_parser
+from logwiz.sampling import SAMPLE_BLOCK_SIZE, sample_ranges, sampled_fraction, scale_row
+from logwiz.dimensions import load_dimensions
+from logwiz.exemplars import Exemplars, EXEMPLAR_FIELDS
+from logwiz.hll import UrlClients
+from logwiz.timeseries import TimeSeries, TimeLocalParser
+from logwiz.spill import SpilledStats, table_size, write_run, remove_runs
 
 
 _RE_PARTS = [
@@ -29,6 +48,16 @@ _RE_PARTS = [
     r'(?P<request_time>\S+)',
     ]
 REGEXP = re.compile(r'\s+'.join(_RE_PARTS) + r'\s*\Z', flags=re.UNICODE)
+BYTES_REGEXP = re.compile(r'\s+'.join(_RE_PARTS) + r'\s*\Z')
+
+
+ERROR_LINES_KEPT = 5  # malformed lines quoted in ParseError
+SPILL_CHECK_LINES = 10000  # memory budget of aggregation table is checked every SPILL_CHECK_LINES lines
+AGGREGATE_FIELDS = ("request", "request_time")  # fields parsers compiled from log_format extract
+UI_SHORT_FORMAT = ('$remote_addr $remote_user $http_x_real_ip [$time_local] "$request" '
+                   '$status $body_bytes_sent "$http_referer" '
+                   '"$http_user_agent" "$http_x_forwarded_for" "$http_X_REQUEST_ID" "$http_X_RB_USER" '
+                   '$request_time')
 
 
 class ParseError(Exception):
@@ -40,50 +69,700 @@ def parse_line(line):
     return match.groupdict() if match else None
 
 
-def _gen_parsed_lines(filename, encoding):
-    if filename.endswith("gz"):
-        with gzip.open(filename) as infile:
-            for line in infile:
-                yield parse_line(line.decode(encoding))
-    else:
-        with io.open(filename, encoding=encoding) as infile:
-            for line in infile:
-                yield parse_line(line)
+def parse_line_bytes(line):
+    """
+    parse_line for undecoded lines, field values are bytes
+    """
+    match = BYTES_REGEXP.match(line)
+    return match.groupdict() if match else None
 
 
-def do_aggregate(filename, encoding="utf-8", max_errors=None, max_errors_ratio=100.0):
+def _parse_ui_short_fast(line):
     """
-    apply custom aggregator class iteratively to log
-    max_errors: -1 -> parameter ignored
+    quote-aware split of ui_short line, extracts request and request_time only.
+    returns None for lines which do not surely have ui_short layout
     """
-    parsed_records = _gen_parsed_lines(filename, encoding)
-    stats = defaultdict(list)
-    errors_count = 0
-    count = 0
-    for rec in parsed_records:
+    parts = line.split('"')
+    if len(parts) != 13:
+        return None
+    head, request, codes, tail = parts[0], parts[1], parts[2], parts[12]
+    if not head[:1] or head[:1].isspace() or not head[-1:].isspace() or not head.rstrip().endswith("]"):
+        return None
+    fields = head.split(None, 3)
+    if len(fields) != 4 or not fields[3].startswith("[") or len(fields[3].rstrip()) < 3:
+        return None
+    codes_fields = codes.split()
+    if len(codes_fields) != 2 or not codes_fields[0].isdigit() or not codes[:1].isspace() or \
+            not codes[-1:].isspace():
+        return None
+    if not all(parts[i] for i in (1, 3, 5, 7, 9, 11)) or not all(parts[i].isspace() for i in (4, 6, 8, 10)):
+        return None
+    tail_fields = tail.split()
+    if len(tail_fields) != 1 or not tail[:1].isspace():
+        return None
+    return {"request": request, "request_time": tail_fields[0]}
+
+
+def parse_line_fast(line):
+    """
+    fast path for ui_short lines with fallback to full REGEXP for lines it rejects
+    """
+    return _parse_ui_short_fast(line) or parse_line(line)
+
+
+def parse_line_fast_bytes(line):
+    return _parse_ui_short_fast(line) or parse_line_bytes(line)
+
+
+PARSERS = {
+    "full": parse_line,
+    "fast": parse_line_fast
+    }
+BYTES_PARSERS = {
+    "full": parse_line_bytes,
+    "fast": parse_line_fast_bytes
+    }
+
+
+def is_ascii_compatible(encoding):
+    return u' "[]\n0123456789.'.encode(encoding) == b' "[]\n0123456789.'
+
+
+def _format_error_lines(agg):
+    return "\n".join(repr(line) for line in agg.error_lines)
+
+
+def check_errors_ratio(agg, pos, opts):
+    """
+    raise ParseError if errors ratio of the whole log will exceed max_errors_ratio even if all lines
+    after offset pos are good. agg: aggregate of all lines before pos, the number of lines left is estimated
+    from opts["log_size"] (uncompressed size, None if unknown: no check) and the average line length so far.
+    checked only when at least opts["errors_check_min_lines"] lines are seen
+    """
+    min_lines, size = opts["errors_check_min_lines"], opts["log_size"]
+    if not min_lines or size is None or agg.count < min_lines or not pos or opts["max_errors_ratio"] >= 100:
+        return
+    lines_left = max(size - pos, 0) * agg.count // pos
+    if 100 * agg.errors_count > opts["max_errors_ratio"] * (agg.count + lines_left):
+        raise ParseError("Max allowed parsing errors ratio %0.2f%% exceeded (%d errors out of %d lines, "
+                         "about %d lines left), first malformed lines:\n%s" % (
+                             opts["max_errors_ratio"], agg.errors_count, agg.count, lines_left,
+                             _format_error_lines(agg)))
+
+
+class Aggregate(object):
+    """
+    partial aggregation result: url -> request times plus parsing counters.
+    request times are kept as lists or, if sketch_accuracy is set, as StreamingStats.
+    with max_urls set urls over the limit are folded into OTHER_URL.
+    dimensions: Dimension plugins, dimension_stats: dimension name -> key -> request times
+    series: TimeSeries of url latency histograms or None
+    exemplars: Exemplars (slowest requests) of urls or None
+    clients: UrlClients (distinct clients estimates) of urls or None
+    with memory_budget (bytes) set url stats are spilled to run files in spill_dir (see logwiz.spill)
+    whenever estimated size of the table exceeds the budget, runs: paths of spilled run files,
+    spilled: number of spilled request times
+    timings: seconds spent per aggregation sub-stage, set only when profiling
+    error_lines: first ERROR_LINES_KEPT malformed lines
+    feature_errors: feature (dimensions, series, exemplars or clients) -> number of lines it failed on,
+    such lines are still aggregated in url stats and are not counted as parsing errors
+    """
+    timings = None
+    error_lines = ()
+    dimensions = ()
+    dimension_stats = {}
+    series = None
+    exemplars = None
+    clients = None
+    memory_budget = None
+    spill_dir = None
+    runs = ()
+    spilled = 0
+
+    def __init__(self, sketch_accuracy=None, max_urls=None, dimensions=(), series=None, memory_budget=None,
+                 spill_dir=None, exemplars=None, clients=None):
+        self.sketch_accuracy = sketch_accuracy
+        self.max_urls = max_urls
+        self.stats = {}
+        self.errors_count = 0
+        self.count = 0
+        self.feature_errors = {}
+        self.dimensions = list(dimensions)
+        self.dimension_stats = dict((dim.name, {}) for dim in self.dimensions)
+        self.series = series
+        self.exemplars = exemplars
+        self.clients = clients
+        self.memory_budget = memory_budget
+        self.spill_dir = spill_dir
+        self.runs = []
+
+    def _new_data(self):
+        return StreamingStats(self.sketch_accuracy) if self.sketch_accuracy else []
+
+    def _new_url(self, url):
+        return capped_get(self.stats, url, self.max_urls, lambda _: self._new_data())
+
+    def _key_stats(self, dim, key):
+        return capped_get(self.dimension_stats[dim.name], key, dim.max_keys, lambda _: self._new_data())[1]
+
+    def _url_stats(self, url):
+        data = self.stats.get(url)
+        return data if data is not None else self._new_url(url)[1]
+
+    def add(self, url, request_time):
+        """
+        returns the key request is aggregated under: url or OTHER_URL if it is folded
+        """
+        data = self.stats.get(url)
+        if data is None:
+            url, data = self._new_url(url)
+        data.append(request_time)
+        return url
+
+    def add_keys(self, keys, values):
+        """
+        keys, values: key and value of every dimension in order of self.dimensions
+        """
+        for dim, key, value in izip(self.dimensions, keys, values):
+            self._key_stats(dim, key).append(value)
+
+    def update(self, other):
+        for url, data in other.stats.iteritems():
+            self._url_stats(url).extend(data)
+        self._update_common(other, set(url for url in other.stats if url not in self.stats))
+        self.runs = list(self.runs) + list(other.runs)
+        self.spilled += other.spilled
+        self.check_memory()
+
+    def feature_error(self, feature, rec):
+        """
+        count failure of feature on rec, the first one is logged
+        """
+        if feature not in self.feature_errors:
+            exception("Error collecting %s of record %s" % (feature, rec))
+        self.feature_errors[feature] = self.feature_errors.get(feature, 0) + 1
+
+    def check_memory(self):
+        """
+        spill url stats to a new run file if they are over memory budget
+        """
+        if not self.memory_budget or not self.stats:
+            return
+        values = self.count - self.errors_count - self.spilled
+        if table_size(len(self.stats), values, bool(self.sketch_accuracy)) > self.memory_budget:
+            self.runs = list(self.runs) + [write_run(self.stats, self.spill_dir)]
+            self.spilled += values
+            self.stats = {}
+
+    def url_data(self):
+        """
+        url stats: self.stats or, if some of them were spilled, SpilledStats merging runs with them
+        """
+        return SpilledStats(self.runs, self.stats) if self.runs else self.stats
+
+    def close(self):
+        """
+        remove spilled run files
+        """
+        remove_runs(self.runs)
+        self.runs = []
+
+    def _update_common(self, other, folded):
+        """
+        folded: urls of other folded into OTHER_URL by url stats of self
+        """
+        for dim in self.dimensions:
+            for key, data in other.dimension_stats[dim.name].iteritems():
+                self._key_stats(dim, key).extend(data)
+        if self.series is not None:
+            self.series.update(other.series)
+        if self.exemplars is not None:
+            self.exemplars.update(other.exemplars)
+        if self.clients is not None:
+            self.clients.update(other.clients, folded)
+        self.errors_count += other.errors_count
+        self.count += other.count
+        for feature, count in other.feature_errors.iteritems():
+            self.feature_errors[feature] = self.feature_errors.get(feature, 0) + count
+        self.error_lines = (self.error_lines + other.error_lines)[:ERROR_LINES_KEPT]
+        self.add_timings(other.timings)
+
+    def add_timings(self, timings):
+        if timings:
+            merged = dict(self.timings or {})
+            for name, seconds in timings.iteritems():
+                merged[name] = merged.get(name, 0.0) + seconds
+            self.timings = merged
+
+
+class ColumnarAggregate(Aggregate):
+    """
+    partial aggregation result keeping request times in ColumnarStats
+    """
+    def __init__(self, max_urls=None, dimensions=(), series=None, exemplars=None, clients=None):
+        super(ColumnarAggregate, self).__init__(max_urls=max_urls, dimensions=dimensions, series=series,
+                                                exemplars=exemplars, clients=clients)
+        self.stats = ColumnarStats(max_urls)
+
+    def add(self, url, request_time):
+        return self.stats.append(url, request_time)
+
+    def update(self, other):
+        self.stats.extend(other.stats)
+        self._update_common(other, set(url for url in other.stats.urls if url not in self.stats.url_ids))
+
+
+def _new_aggregate(opts):
+    dimensions = load_dimensions(opts["dimensions"])
+    series = TimeSeries(opts["series_bucket"], opts["series_max_urls"]) if opts["series_bucket"] else None
+    exemplars = Exemplars(opts["exemplars"], opts["exemplars_max_urls"], opts["encoding"]) \
+        if opts["exemplars"] else None
+    clients = UrlClients(opts["clients_field"], opts["clients_precision"], opts["clients_max_urls"]) \
+        if opts["clients_field"] else None
+    if opts["columnar"]:
+        return ColumnarAggregate(opts["max_urls"], dimensions, series, exemplars, clients)
+    return Aggregate(opts["sketch_accuracy"], opts["max_urls"], dimensions, series, opts["memory_budget"],
+                     opts["spill_dir"], exemplars, clients)
+
+
+# options which change aggregation results: checkpoint is resumed only if all of them are the same
+CHECKPOINT_OPTIONS = ("encoding", "sketch_accuracy", "parser", "columnar", "url_rules", "max_urls", "log_format",
+                      "dimensions", "series_bucket", "series_max_urls", "exemplars", "exemplars_max_urls",
+                      "clients_field", "clients_precision", "clients_max_urls")
+
+
+def _checkpoint_options(opts):
+    return dict((name, opts[name]) for name in CHECKPOINT_OPTIONS)
+
+
+def _select_parser(opts, dimensions, bytes_mode):
+    """
+    parser extracting fields needed by url stats, dimensions, time series, exemplars and clients:
+    compiled from opts["log_format"] or ui_short parser selected by opts["parser"]
+    (fast ui_short parser extracts url stats fields only, so it is replaced with a compiled one for dimensions)
+    """
+    fields = set(AGGREGATE_FIELDS)
+    for dim in dimensions:
+        fields.update(dim.fields)
+    if opts["series_bucket"]:
+        fields.add("time_local")
+    if opts["exemplars"]:
+        fields.update(EXEMPLAR_FIELDS)
+    if opts["clients_field"]:
+        fields.add(opts["clients_field"])
+    if opts["log_format"]:
+        return compile_parser(opts["log_format"], fields)
+    if opts["parser"] == "fast" and len(fields) > len(AGGREGATE_FIELDS):
+        return compile_parser(UI_SHORT_FORMAT, fields)
+    return (BYTES_PARSERS if bytes_mode else PARSERS)[opts["parser"]]
+
+
+def _timed_lines(lines, timings):
+    clock = time.time
+    lines = iter(lines)
+    while True:
+        started = clock()
+        line = next(lines, None)
+        timings["read"] += clock() - started
+        if line is None:
+            return
+        yield line
+
+
+def _timed_parse(parse, timings):
+    clock = time.time
+
+    def timed(line):
+        started = clock()
+        try:
+            return parse(line)
+        finally:
+            timings["parse"] += clock() - started
+    return timed
+
+
+def _aggregate_lines(lines, opts, agg=None, pos=0, checkpoint=None, check_ratio=False):
+    """
+    aggregate lines into agg (new Aggregate by default), pos is offset of the first line.
+    checkpoint(offset, agg) is called every opts["checkpoint_interval"] bytes and at the end.
+    check_ratio: agg holds all lines of the log before pos, errors ratio is checked on every error
+    (see check_errors_ratio; results of workers are checked when merged instead).
+    with opts["profile"] set time spent reading (and decompressing) lines, parsing them
+    and collecting stats is added to agg.timings
+    """
+    max_errors = opts["max_errors"]
+    encoding = opts["encoding"]
+    bytes_mode = opts["mmap"] and is_ascii_compatible(encoding)
+    canonical = opts["canonical"]
+    agg = agg or _new_aggregate(opts)
+    dimensions = agg.dimensions
+    series = agg.series
+    exemplars = agg.exemplars
+    clients = agg.clients
+    parse_time = TimeLocalParser()
+    parse = _select_parser(opts, dimensions, bytes_mode)
+    if opts["profile"]:
+        timings, started = {"read": 0.0, "parse": 0.0}, time.time()
+        lines, parse = _timed_lines(lines, timings), _timed_parse(parse, timings)
+    next_checkpoint = pos + opts["checkpoint_interval"] if checkpoint else None
+    check_memory = opts["memory_budget"] is not None
+    for line in lines:
+        pos += len(line)
+        agg.count += 1
+        rec = parse(line if bytes_mode else line.decode(encoding))
         try:
             url = rec['request'].split()[1]
-            stats[url].append(float(rec['request_time']))
+            if bytes_mode:
+                url = url.decode(encoding)
+            if canonical:
+                url = canonical(url)
+            request_time = float(rec['request_time'])
+            url = agg.add(url, request_time)
         except Exception:
-            errors_count += 1
+            agg.errors_count += 1
+            if len(agg.error_lines) < ERROR_LINES_KEPT:
+                agg.error_lines += (line.rstrip(b"\r\n"),)
             exception("Error parsing record %s" % rec)
-            if max_errors is not None and errors_count > max_errors:
+            if max_errors is not None and agg.errors_count > max_errors:
                 raise
-        count += 1
+            if check_ratio:
+                check_errors_ratio(agg, pos, opts)
+        else:
+            # optional fields failing on a valid line (e.g. malformed time_local) do not make it malformed
+            if series is not None:
+                try:
+                    series.add(url, parse_time(rec['time_local']), request_time)
+                except Exception:
+                    agg.feature_error("series", rec)
+            if exemplars is not None:
+                try:
+                    exemplars.add(url, request_time, rec['http_X_REQUEST_ID'], rec['time_local'])
+                except Exception:
+                    agg.feature_error("exemplars", rec)
+            if clients is not None:
+                try:
+                    clients.add(url, rec[clients.field])
+                except Exception:
+                    agg.feature_error("clients", rec)
+            if dimensions:
+                try:
+                    keys = [dim.key(rec) for dim in dimensions]
+                    values = [dim.value(rec) for dim in dimensions]
+                    if bytes_mode:
+                        keys = [key.decode(encoding) if isinstance(key, bytes) else key for key in keys]
+                    agg.add_keys(keys, values)
+                except Exception:
+                    agg.feature_error("dimensions", rec)
+        if check_memory and not agg.count % SPILL_CHECK_LINES:
+            agg.check_memory()
+        if checkpoint and pos >= next_checkpoint:
+            checkpoint(pos, agg)
+            next_checkpoint = pos + opts["checkpoint_interval"]
+    if checkpoint:
+        checkpoint(pos, agg)
+    if opts["profile"]:
+        timings["collect"] = time.time() - started - timings["read"] - timings["parse"]
+        agg.add_timings(timings)
+    return agg
+
+
+def aggregate_lines(lines, agg, encoding="utf-8", parser="full", canonical=None, log_format=None):
+    """
+    aggregate lines (bytes) read elsewhere, e.g. appended to a live log (see logwiz.tail), into agg.
+    lines are parsed as bytes if encoding is ASCII-compatible, malformed ones are counted and never abort aggregation.
+    canonical: UrlCanonicalizer, should be reused between calls to keep its cache
+    """
+    opts = {"encoding": encoding, "max_errors": None, "parser": parser, "mmap": True, "canonical": canonical,
+            "log_format": log_format, "profile": False, "memory_budget": None, "errors_check_min_lines": None,
+            "max_errors_ratio": 100.0, "log_size": None, "series_bucket": None, "exemplars": None,
+            "clients_field": None}
+    return _aggregate_lines(lines, opts, agg)
 
-    parse_ratio = 100 * float(errors_count) / count
-    info("Got %d errors while parsing log (%0.2f%%)" % (errors_count, parse_ratio))
-    if parse_ratio > max_errors_ratio:
-        raise ParseError("Max allowed parsing errors ratio exceeded (%d error out of %d)" % (errors_count, count))
 
-    return stats
+def _aggregate_new(lines, opts, pos=0):
+    """
+    aggregate lines into a new Aggregate, its spilled runs are removed if aggregation fails
+    (results of failed workers are never merged)
+    """
+    agg = _new_aggregate(opts)
+    try:
+        return _aggregate_lines(lines, opts, agg, pos)
+    except BaseException:
+        agg.close()
+        raise
+
+
+def _aggregate_range(task, agg=None, checkpoint=None):
+    filename, start, end, opts = task
+    lines = gen_lines(filename, start, end, gzip_pipeline=opts["gzip_pipeline"], use_mmap=opts["mmap"],
+                      gzip_index_span=opts["gzip_index_span"], gzip_index_dir=opts["gzip_index_dir"])
+    if agg is None:
+        return _aggregate_new(lines, opts, start)
+    return _aggregate_lines(lines, opts, agg, start, checkpoint, check_ratio=True)
+
+
+def _aggregate_block(task):
+    block, opts = task
+    return _aggregate_new(io.BytesIO(block), opts)
+
+
+@contextmanager
+def _worker_pool(workers, pool=None):
+    """
+    new pool of workers processes, or given (warm) pool which is left running
+    """
+    if pool is not None:
+        yield pool
+        return
+    pool = Pool(workers)
+    try:
+        yield pool
+        pool.close()
+    except BaseException:
+        pool.terminate()
+        raise
+    finally:
+        pool.join()
+
+
+def _gen_async_results(pool, func, tasks, max_pending):
+    """
+    (key, func(task)) for (key, task) in tasks in order, at most max_pending tasks are submitted at once.
+    if the generator is closed early, finished results which were not yielded are closed (their spilled runs removed)
+    """
+    pending = deque()
+    try:
+        for key, task in tasks:
+            pending.append((key, pool.apply_async(func, (task,))))
+            if len(pending) >= max_pending:
+                key, res = pending.popleft()
+                yield key, res.get()
+        while pending:
+            key, res = pending.popleft()
+            yield key, res.get()
+    finally:
+        for _, res in pending:
+            if res.ready() and res.successful():
+                res.get().close()
+
+
+def _merge_results(results, opts, agg, checkpoint=None):
+    """
+    merge (end offset, partial aggregate) results into agg in order of offsets, errors ratio
+    of every merged prefix is checked (see check_errors_ratio).
+    checkpoint(offset, agg) is called every opts["checkpoint_interval"] bytes and at the end
+    """
+    end, next_checkpoint = None, 0
+    for end, res in results:
+        agg.update(res)
+        if opts["max_errors"] is not None and agg.errors_count > opts["max_errors"]:
+            raise ParseError("Max allowed parsing errors exceeded (%d errors), first malformed lines:\n%s" % (
+                agg.errors_count, _format_error_lines(agg)))
+        check_errors_ratio(agg, end, opts)
+        if checkpoint and end >= next_checkpoint:
+            checkpoint(end, agg)
+            next_checkpoint = end + opts["checkpoint_interval"]
+    if checkpoint and end is not None:
+        checkpoint(end, agg)
+    return agg
+
+
+def _aggregate_parallel(filename, start, workers, opts, agg, checkpoint=None, pool=None):
+    """
+    aggregate plain log from offset start in a pool of workers, merging range results into agg in order.
+    with checkpoint ranges are not longer than opts["checkpoint_interval"]
+    """
+    end = os.path.getsize(filename)
+    parts = workers
+    if checkpoint:
+        parts = max(parts, -(-(end - start) // opts["checkpoint_interval"]))
+    return _aggregate_ranges(filename, split_ranges(filename, parts, start, end), workers, opts, agg, checkpoint,
+                             pool)
+
+
+def _aggregate_ranges(filename, ranges, workers, opts, agg, checkpoint=None, pool=None):
+    """
+    aggregate byte ranges of plain log (or uncompressed ranges of indexed gzipped log)
+    in a pool of workers, merging range results into agg in order
+    """
+    tasks = [(range_end, (filename, range_start, range_end, opts)) for range_start, range_end in ranges]
+    workers = min(workers, len(tasks)) or 1
+    with _worker_pool(workers, pool) as pool:
+        results = _gen_async_results(pool, _aggregate_range, tasks, 2 * workers)
+        try:
+            return _merge_results(results, opts, agg, checkpoint)
+        finally:
+            results.close()
+
+
+def _aggregate_gzip_parallel(filename, start, workers, opts, agg, checkpoint=None, pool=None):
+    """
+    gzipped log is decompressed in a separate thread of this process,
+    blocks of lines are aggregated in a pool of workers and merged into agg in order.
+    if the log has a seek index, workers decompress and aggregate ranges between its access points instead
+    """
+    if opts["gzip_index_span"]:
+        index = load_index(filename, opts["gzip_index_dir"])
+        if index is not None:
+            return _aggregate_ranges(filename, index.ranges(start), workers, opts, agg, checkpoint, pool)
+
+    def gen_tasks():
+        pos = start
+        for block in gen_threaded(gen_gzip_blocks(filename, start, index_span=opts["gzip_index_span"],
+                                                  index_dir=opts["gzip_index_dir"])):
+            pos += len(block)
+            yield pos, (block, opts)
+
+    with _worker_pool(workers, pool) as pool:
+        results = _gen_async_results(pool, _aggregate_block, gen_tasks(), 2 * workers)
+        try:
+            return _merge_results(results, opts, agg, checkpoint)
+        finally:
+            results.close()
+
+
+def _log_size(filename, ranges, gzip_index_span, gzip_index_dir):
+    """
+    uncompressed size of log for the errors ratio check, None if it is unknown
+    (gzipped log without seek index) or only byte ranges are aggregated
+    """
+    if ranges is not None:
+        return None
+    if filename.endswith("gz"):
+        index = load_index(filename, gzip_index_dir) if gzip_index_span else None
+        return index.size if index is not None else None
+    return os.path.getsize(filename)
+
+
+def aggregate_log(filename, encoding="utf-8", max_errors=None, max_errors_ratio=100.0, workers=1,
+                  sketch_accuracy=None, parser="full", checkpoint_file=None, checkpoint_interval=None,
+                  checkpoint_max_overhead=0.1, columnar=False,
+                  gzip_pipeline=True, use_mmap=False, url_rules=None, max_urls=None, profiler=None,
+                  errors_check_min_lines=1000, ranges=None, log_format=None,
+                  dimensions=None, series_bucket=None, series_max_urls=1000, pool=None, memory_budget=None,
+                  spill_dir=None, gzip_index_span=None, gzip_index_dir=None, exemplars=None,
+                  exemplars_max_urls=10000, clients_field=None, clients_precision=10, clients_max_urls=10000):
+    """
+    apply custom aggregator class iteratively to log, returns Aggregate
+    max_errors: -1 -> parameter ignored
+    workers: number of processes aggregating byte ranges of a plain log
+    or blocks of lines of a gzipped log (requires gzip_pipeline) in parallel
+    sketch_accuracy: if set, keep StreamingStats with given relative quantile error per url
+    instead of lists of all request times
+    parser: "full" (REGEXP) or "fast" (ui_short tokenizer with REGEXP fallback), see PARSERS
+    checkpoint_file: if set, partial aggregate is saved there every checkpoint_interval bytes
+    (and at the end), but checkpoints take at most checkpoint_max_overhead of aggregation time (see Checkpointer).
+    aggregation resumes from a checkpoint of the same untouched file, checkpoint is removed once it succeeds
+    columnar: keep request times in ColumnarStats (url ids + float64 times), requires numpy
+    gzip_pipeline: decompress gzipped logs in a separate thread, overlapping with parsing
+    use_mmap: memory-map plain logs and parse lines as bytes, only urls are decoded
+    (gzipped logs are parsed as bytes too; ignored for encodings which are not ASCII-compatible)
+    url_rules: dict of UrlCanonicalizer arguments, urls are aggregated by their canonical form
+    max_urls: limit of distinct urls, requests of other urls are aggregated as OTHER_URL
+    errors_check_min_lines: once this number of lines is parsed, aggregation is aborted as soon as errors ratio
+    of the whole log would exceed max_errors_ratio even if all lines left are good (their number is estimated
+    from the log size, unknown for gzipped logs without seek index), None or 0 disables the online check
+    profiler: logwiz.profiling.Profiler, gets read/parse/collect sub-stages of aggregation
+    (summed over workers) and the number of lines processed
+    ranges: aggregate only these byte ranges of plain log (aligned to line boundaries, see sample_ranges)
+    log_format: nginx log_format of the log, lines are parsed with a parser compiled from it
+    instead of the built-in ui_short parser
+    dimensions: specs of Dimension plugins (see load_dimension) aggregated in the same pass
+    series_bucket: if set, latency histograms of series_max_urls urls are collected
+    in time buckets of series_bucket seconds, see TimeSeries
+    pool: warm multiprocessing pool used when workers > 1 instead of starting a new one
+    memory_budget: bytes of url stats table (per worker) kept in memory, over the budget stats are spilled
+    to run files in spill_dir (temp dir by default) and merged when iterated, see SpilledStats.
+    run files are removed by agg.close() (or closing agg.url_data()), or when aggregation fails
+    (unless checkpoint_file is set: the checkpoint refers to them)
+    gzip_index_span: if set, gzipped logs (with gzip_pipeline) are read using a seek index with access points
+    every gzip_index_span uncompressed bytes stored next to the log (or in gzip_index_dir); index is built
+    by the first full read and lets workers decompress parts of the log in parallel, see logwiz.gzindex
+    exemplars: if set, this number of the slowest requests (with request id and time_local)
+    of exemplars_max_urls urls is kept, see Exemplars
+    clients_field: if set (remote_addr, http_X_RB_USER or another field of log_format), distinct values
+    of the field are counted for clients_max_urls urls with HyperLogLog of given precision, see UrlClients
+    """
+    if ranges is not None and (checkpoint_file or filename.endswith("gz")):
+        raise ValueError("Byte ranges can be aggregated only for plain logs without checkpoints")
+    if columnar:
+        check_numpy()
+        if sketch_accuracy or memory_budget:
+            raise ValueError("Columnar stats can not be combined with sketch_accuracy or memory_budget")
+    if clients_field and not log_format and clients_field not in REGEXP.groupindex:
+        raise ValueError("Field %s is missing in ui_short log format" % clients_field)
+    opts = {"encoding": encoding, "max_errors": max_errors, "sketch_accuracy": sketch_accuracy, "parser": parser,
+            "checkpoint_interval": checkpoint_interval or float("inf"), "columnar": columnar,
+            "gzip_pipeline": gzip_pipeline, "mmap": use_mmap, "url_rules": url_rules, "max_urls": max_urls,
+            "canonical": UrlCanonicalizer(**url_rules) if url_rules else None,
+            "profile": bool(profiler and profiler.enabled), "max_errors_ratio": max_errors_ratio,
+            "errors_check_min_lines": errors_check_min_lines,
+            "log_size": _log_size(filename, ranges, gzip_index_span, gzip_index_dir), "log_format": log_format,
+            "dimensions": dimensions or [], "series_bucket": series_bucket, "series_max_urls": series_max_urls,
+            "memory_budget": memory_budget, "spill_dir": spill_dir, "gzip_index_span": gzip_index_span,
+            "gzip_index_dir": gzip_index_dir, "exemplars": exemplars, "exemplars_max_urls": exemplars_max_urls,
+            "clients_field": clients_field, "clients_precision": clients_precision,
+            "clients_max_urls": clients_max_urls}
+    start, agg, checkpoint = 0, _new_aggregate(opts), None
+    if checkpoint_file:
+        identity = file_identity(filename)
+        ckpt = load_checkpoint(checkpoint_file, filename, identity)
+        options = _checkpoint_options(opts)
+        if ckpt and ckpt.options == options and all(os.path.isfile(run) for run in ckpt.aggregate.runs):
+            info("Resuming %s from checkpoint at offset %d" % (filename, ckpt.offset))
+            start, agg = ckpt.offset, ckpt.aggregate
+            agg.timings = None
+        checkpoint = Checkpointer(checkpoint_file, filename, identity, options, checkpoint_max_overhead)
+
+    try:
+        if ranges is not None and workers > 1:
+            agg = _aggregate_ranges(filename, ranges, workers, opts, agg, pool=pool)
+        elif ranges is not None:
+            for range_start, range_end in ranges:
+                agg = _aggregate_range((filename, range_start, range_end, opts), agg)
+        elif workers > 1 and not filename.endswith("gz"):
+            agg = _aggregate_parallel(filename, start, workers, opts, agg, checkpoint, pool)
+        elif workers > 1 and gzip_pipeline:
+            agg = _aggregate_gzip_parallel(filename, start, workers, opts, agg, checkpoint, pool)
+        else:
+            agg = _aggregate_range((filename, start, None, opts), agg, checkpoint)
+        errors_count, count = agg.errors_count, agg.count
+        if opts["profile"]:
+            profiler.lines = count
+            for name in ("read", "parse", "collect"):
+                profiler.add("aggregate:" + name, (agg.timings or {}).get(name, 0.0), lines=count)
+
+        parse_ratio = 100 * float(errors_count) / count
+        info("Got %d errors while parsing log (%0.2f%%)" % (errors_count, parse_ratio))
+        for feature, feature_errors in sorted(agg.feature_errors.iteritems()):
+            warning("Failed to collect %s of %d lines" % (feature, feature_errors))
+        if parse_ratio > max_errors_ratio:
+            raise ParseError("Max allowed parsing errors ratio exceeded (%d error out of %d), "
+                             "first malformed lines:\n%s" % (errors_count, count, _format_error_lines(agg)))
+    except BaseException:
+        if not checkpoint_file:
+            agg.close()  # spilled runs of a checkpointed aggregate are kept for resuming
+        raise
+    if checkpoint_file:
+        remove_checkpoint(checkpoint_file)
+    return agg
+
+
+def do_aggregate(filename, **kwargs):
+    """
+    url -> request times of log, kwargs: aggregation options, see aggregate_log.
+    with memory_budget set result may be SpilledStats, closing it removes spilled run files
+    """
+    return aggregate_log(filename, **kwargs).url_data()
 
 
 def calc_stats(data):
     """
-    data: array of floats
-    output: basic statistics - sum, avg, median, max, count
+    data: array of floats or StreamingStats
+    output: basic statistics - sum, avg, median, max, count (+ percentiles for StreamingStats)
     """
+    if isinstance(data, StreamingStats):
+        return data.stats()
     if not data:
         return {}
 
@@ -102,36 +781,126 @@ def calc_stats(data):
             }
 
 
-def calc_url_stats(url_data, top=None):
+def _gen_url_stats(url_data, totals, sumsq=False):
     """
-    url_data: dict url -> time stats
-    output: list of dicts with url name and time stats.
-    only top urls by avg time are returned.
+    (url, calc_stats of its times) of non-empty urls, totals [count, time] are accumulated.
+    with sumsq set stats also get sum of squared times
     """
-    url_stats = {}
-    total_time = 0
-    total_count = 0
     for url, data in url_data.iteritems():
-        url_stats[url] = calc_stats(data)
-        total_time += url_stats[url]["sum"]
-        total_count += url_stats[url]["count"]
+        stats = calc_stats(data)
+        if not stats:
+            continue
+        totals[0] += stats["count"]
+        totals[1] += stats["sum"]
+        if sumsq:
+            stats["sumsq"] = data.sumsq if isinstance(data, StreamingStats) else sum(t * t for t in data)
+        yield url, stats
+
+
+def calc_url_stats(url_data, top=None, sample_fraction=None):
+    """
+    url_data: dict url -> time stats, SpilledStats or ColumnarStats
+    sample_fraction: if url_data is aggregated from a sample of log, counts and sums are scaled
+    and confidence intervals are added, see scale_row
+    output: list of dicts with url name and time stats.
+    only top urls by avg time are returned, url stats are computed one by one
+    and only top ones are kept (heapq.nlargest)
+    """
+    if isinstance(url_data, ColumnarStats):
+        return calc_url_stats_columnar(url_data, top=top, sample_fraction=sample_fraction)
+
+    totals = [0, 0]
+    url_stats = _gen_url_stats(url_data, totals, sumsq=bool(sample_fraction))
+    by_avg = lambda item: item[1]["avg"]
+    if top is None:
+        url_stats = sorted(url_stats, key=by_avg, reverse=True)
+    else:
+        url_stats = heapq.nlargest(top, url_stats, key=by_avg)
+    total_count, total_time = totals
 
     result = []
-    for url in sorted(url_stats, key=lambda url: url_stats[url]['avg'], reverse=True)[:top]:
-        result.append({
+    for url, stats in url_stats:
+        row = {
             "url": url,
-            "count": url_stats[url]["count"],
-            "time_avg": round(url_stats[url]["avg"], 3),
-            "time_sum": round(url_stats[url]["sum"], 3),
-            "time_max": round(url_stats[url]["max"], 3),
-            "time_med": round(url_stats[url]["med"], 3),
-            "count_perc": round(100 * float(url_stats[url]["count"]) / total_count, 3),
-            "time_perc": round(100 * float(url_stats[url]["sum"]) / total_time, 3)
-            })
+            "count": stats["count"],
+            "time_avg": round(stats["avg"], 3),
+            "time_sum": round(stats["sum"], 3),
+            "time_max": round(stats["max"], 3),
+            "time_med": round(stats["med"], 3),
+            "count_perc": round(100 * float(stats["count"]) / total_count, 3),
+            "time_perc": round(100 * float(stats["sum"]) / total_time, 3)
+            }
+        for name, _ in PERCENTILES:
+            if name in stats:
+                row["time_" + name] = round(stats[name], 3)
+        if sample_fraction:
+            scale_row(row, stats["count"], stats["sum"], stats["sumsq"], sample_fraction)
+        result.append(row)
     return result
 
 
-def parse_otus_log(filename, encoding="utf-8", top=None, max_errors=None, max_errors_ratio=100.0):
-    url_data = do_aggregate(filename, encoding=encoding, max_errors=max_errors, max_errors_ratio=max_errors_ratio)
-    url_stats = calc_url_stats(url_data, top=top)
+def calc_dimension_stats(agg, top=None, sample_fraction=None):
+    """
+    report sections of agg dimensions: list of dicts with dimension name and rows of value stats,
+    rows have the same fields as calc_url_stats ones with dimension name instead of url
+    (and dim.value_name instead of time in names of stats fields)
+    """
+    sections = []
+    for dim in agg.dimensions:
+        rows = calc_url_stats(agg.dimension_stats[dim.name], sample_fraction=sample_fraction)
+        prefix = dim.value_name + "_"
+        for i, row in enumerate(rows):
+            if prefix != "time_":
+                row = rows[i] = dict((prefix + name[5:] if name.startswith("time_") else name, value)
+                                     for name, value in row.iteritems())
+            row[dim.name] = row.pop("url")
+        if dim.sort_by:
+            rows.sort(key=lambda row: row[dim.sort_by], reverse=True)
+        else:
+            rows.sort(key=lambda row: row[dim.name])
+        sections.append({"name": dim.name, "rows": rows[:dim.top or top]})
+    return sections
+
+
+def calc_heatmap(agg, url_stats, top=20):
+    """
+    latency heatmap data of top urls by time_sum among report rows, None if time series are not collected.
+    top urls without series (over series max_urls) are listed as untracked, see TimeSeries.heatmap
+    """
+    if agg.series is None:
+        return None
+    urls = [row["url"] for row in sorted(url_stats, key=lambda row: row["time_sum"], reverse=True)[:top]]
+    return agg.series.heatmap(urls)
+
+
+def add_exemplars(agg, url_stats):
+    """
+    add the slowest requests of url to every report row (as "slowest"), if exemplars are collected.
+    "slowest" is None for urls which were not tracked (folded into OTHER_URL), see Exemplars
+    """
+    if agg.exemplars is not None:
+        for row in url_stats:
+            url = row["url"]
+            row["slowest"] = agg.exemplars.slowest(url) if agg.exemplars.tracked(url) else None
     return url_stats
+
+
+def parse_otus_log(filename, top=None, sample=None, sample_mode="stride", sample_block_size=SAMPLE_BLOCK_SIZE,
+                   sample_seed=None, **kwargs):
+    """
+    sample: if set, only about this fraction of plain log is read (blocks of sample_block_size bytes
+    taken with sample_mode "stride" or "random"), counts and sums are scaled
+    and rows get 95% confidence intervals count_ci, time_sum_ci and time_avg_ci
+    kwargs: aggregation options, see do_aggregate
+    """
+    fraction = None
+    if sample is not None and sample < 1:
+        ranges = sample_ranges(filename, sample, sample_mode, sample_block_size, sample_seed)
+        fraction = sampled_fraction(filename, ranges)
+        info("Sampling %0.2f%% of %s in %d ranges" % (100 * fraction, filename, len(ranges)))
+        kwargs["ranges"] = ranges
+    agg = aggregate_log(filename, **kwargs)
+    try:
+        return calc_url_stats(agg.url_data(), top=top, sample_fraction=fraction)
+    finally:
+        agg.close()
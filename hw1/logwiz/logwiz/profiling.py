@@ -0,0 +1,109 @@
+# -*- coding: utf-8 -*-
+# Per-stage timings of log_analyzer run: wall and CPU time, lines processed, peak RSS of the run so far.
+# Summary is rendered as a table for the log and in Prometheus textfile collector format.
+import os
+import time
+import resource
+from collections import OrderedDict
+from contextlib import contextmanager
+
+
+def cpu_time():
+    """
+    user + system time of this process and its finished children (pool workers)
+    """
+    times = os.times()
+    return times[0] + times[1] + times[2] + times[3]
+
+
+def max_rss():
+    """
+    memory high-water mark of this process or its largest child in bytes
+    """
+    return 1024 * max(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+                      resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss)
+
+
+class Profiler(object):
+    """
+    stages are recorded in order of completion.
+    lines: number of log lines processed by the run (set by aggregate_log), only stages which process lines
+    (aggregation) are attributed with it, so lines/s is not computed for stages after it (store, stats, render).
+    peak_rss of stage: memory high-water mark of the whole run at the end of the stage, not of the stage itself.
+    disabled profiler records nothing, so stages may be wrapped unconditionally
+    """
+    def __init__(self, enabled=True):
+        self.enabled = enabled
+        self.stages = OrderedDict()
+        self.lines = None
+
+    def add(self, name, wall, cpu=None, lines=None):
+        """
+        lines: number of log lines processed by the stage, None if it does not process lines
+        """
+        if self.enabled:
+            self.stages[name] = {"wall": wall, "cpu": cpu, "lines": lines, "peak_rss": max_rss()}
+
+    @contextmanager
+    def stage(self, name, counts_lines=False):
+        """
+        counts_lines: the stage processes self.lines lines (known once it is over)
+        """
+        if not self.enabled:
+            yield
+            return
+        started, cpu_started = time.time(), cpu_time()
+        try:
+            yield
+        finally:
+            self.add(name, time.time() - started, cpu_time() - cpu_started, self.lines if counts_lines else None)
+
+    def summary(self):
+        """
+        table of stages, peak rss column is the high-water mark of the run by the end of stage
+        """
+        rows = ["%-20s %10s %10s %12s %12s %12s" % ("stage", "wall, s", "cpu, s", "lines", "lines/s", "peak rss, MB")]
+        for name, st in self.stages.iteritems():
+            rows.append("%-20s %10.3f %10s %12s %12s %12.1f" % (
+                name, st["wall"],
+                "%.3f" % st["cpu"] if st["cpu"] is not None else "-",
+                st["lines"] if st["lines"] is not None else "-",
+                "%.0f" % (st["lines"] / st["wall"]) if st["lines"] and st["wall"] else "-",
+                st["peak_rss"] / float(1 << 20)))
+        return "\n".join(rows)
+
+    def prometheus(self, prefix="logwiz"):
+        metrics = [
+            ("stage_wall_seconds", "Wall time of log analyzer stage", "wall"),
+            ("stage_cpu_seconds", "CPU time of log analyzer stage (including pool workers)", "cpu"),
+            ("stage_lines", "Lines processed by log analyzer stage", "lines"),
+            ]
+        out = []
+        for metric, help_text, key in metrics:
+            out.append("# HELP %s_%s %s" % (prefix, metric, help_text))
+            out.append("# TYPE %s_%s gauge" % (prefix, metric))
+            for name, st in self.stages.iteritems():
+                if st[key] is not None:
+                    out.append('%s_%s{stage="%s"} %s' % (prefix, metric, name, repr(float(st[key]))))
+        out.append("# HELP %s_stage_lines_per_second Throughput of log analyzer stage" % prefix)
+        out.append("# TYPE %s_stage_lines_per_second gauge" % prefix)
+        for name, st in self.stages.iteritems():
+            if st["lines"] and st["wall"]:
+                out.append('%s_stage_lines_per_second{stage="%s"} %r' % (prefix, name, st["lines"] / st["wall"]))
+        out.append("# HELP %s_max_rss_bytes Memory high-water mark of log analyzer run" % prefix)
+        out.append("# TYPE %s_max_rss_bytes gauge" % prefix)
+        out.append("%s_max_rss_bytes %d" % (prefix, max_rss()))
+        out.append("# HELP %s_last_run_timestamp_seconds End time of profiled log analyzer run" % prefix)
+        out.append("# TYPE %s_last_run_timestamp_seconds gauge" % prefix)
+        out.append("%s_last_run_timestamp_seconds %r" % (prefix, time.time()))
+        return "\n".join(out) + "\n"
+
+    def write_prometheus(self, filename):
+        tmp_file = filename + ".tmp"  # textfile collector should never see partially written file
+        with open(tmp_file, "w") as outfile:
+            outfile.write(self.prometheus())
+        os.rename(tmp_file, filename)
+
+
+def metrics_file_for(timestamp_file):
+    return os.path.splitext(timestamp_file)[0] + ".prom"
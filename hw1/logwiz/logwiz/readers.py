@@ -0,0 +1,188 @@
+# -*- coding: utf-8 -*-
+# Line readers for plain and gzipped logs.
+# Offsets are byte offsets in the file for plain logs and in uncompressed data for gzipped ones.
+import os
+import io
+import sys
+import gzip
+import mmap
+import zlib
+from threading import Thread, Event
+from Queue import Queue, Full
+
+from logwiz import gzindex
+
+
+GZIP_READ_SIZE = 1 << 20  # compressed bytes per read
+GZIP_QUEUE_SIZE = 8  # decompressed blocks waiting for parser
+
+
+def _find_line_start(infile, offset):
+    """
+    position of the first line starting at or after offset
+    """
+    if offset == 0:
+        return 0
+    infile.seek(offset - 1)
+    infile.readline()
+    return infile.tell()
+
+
+def split_ranges(filename, parts, start=0, end=None):
+    """
+    split [start, end) of plain log into at most parts byte ranges aligned to line boundaries
+    start should be a line boundary itself
+    """
+    end = os.path.getsize(filename) if end is None else end
+    with io.open(filename, "rb") as infile:
+        bounds = sorted(set([start] + [_find_line_start(infile, start + (end - start) * i // parts)
+                                       for i in range(1, parts)]))
+    bounds = [b for b in bounds if b < end] + [end]
+    return zip(bounds[:-1], bounds[1:])
+
+
+def _gen_zlib_chunks(filename, read_size=GZIP_READ_SIZE):
+    """
+    uncompressed data of gzipped log (multi-member files are supported)
+    """
+    decomp = zlib.decompressobj(16 + zlib.MAX_WBITS)
+    with io.open(filename, "rb") as infile:
+        while True:
+            raw = infile.read(read_size)
+            if not raw:
+                break
+            data = decomp.decompress(raw)
+            while decomp.unused_data:
+                unused = decomp.unused_data
+                decomp = zlib.decompressobj(16 + zlib.MAX_WBITS)
+                data += decomp.decompress(unused)
+            yield data
+    yield decomp.flush()
+
+
+def _gen_line_blocks(chunks, skip=0):
+    """
+    blocks of complete lines of uncompressed data chunks, first skip bytes are skipped
+    """
+    tail = b""
+    for data in chunks:
+        if skip:
+            data, skip = data[skip:], max(skip - len(data), 0)
+        cut = data.rfind(b"\n") + 1
+        if not cut:
+            tail += data
+            continue
+        yield tail + data[:cut]
+        tail = data[cut:]
+    if tail:
+        yield tail
+
+
+def gen_gzip_blocks(filename, start=0, read_size=GZIP_READ_SIZE, index_span=None, index_dir=None):
+    """
+    blocks of complete lines of gzipped log (multi-member files are supported),
+    uncompressed data before offset start is skipped.
+    with index_span set a seek index is used or built on the way (see logwiz.gzindex)
+    """
+    if index_span and gzindex.libz is not None:
+        skip, chunks = gzindex.open_indexed(filename, start, index_span, index_dir, read_size)
+    else:
+        skip, chunks = start, _gen_zlib_chunks(filename, read_size)
+    return _gen_line_blocks(chunks, skip)
+
+
+def gen_threaded(gen, queue_size=GZIP_QUEUE_SIZE):
+    """
+    runs generator in a separate thread, items are passed through a bounded queue.
+    zlib releases GIL, so decompression overlaps with parsing in the consumer thread
+    """
+    queue, stop, done = Queue(queue_size), Event(), object()
+
+    def put(item):
+        while not stop.is_set():
+            try:
+                queue.put(item, timeout=0.1)
+                return
+            except Full:
+                pass
+
+    def produce():
+        try:
+            for item in gen:
+                put((item, None))
+                if stop.is_set():
+                    return
+        except BaseException:
+            put((done, sys.exc_info()))
+        else:
+            put((done, None))
+
+    thread = Thread(target=produce)
+    thread.daemon = True
+    thread.start()
+    try:
+        while True:
+            item, exc_info = queue.get()
+            if item is done:
+                if exc_info:
+                    raise exc_info[0], exc_info[1], exc_info[2]
+                return
+            yield item
+    finally:
+        stop.set()
+
+
+def _gen_gzip_lines(filename, start=0, index_span=None, index_dir=None):
+    for block in gen_threaded(gen_gzip_blocks(filename, start, index_span=index_span, index_dir=index_dir)):
+        for line in io.BytesIO(block):
+            yield line
+
+
+def _gen_mmap_lines(filename, start=0):
+    with io.open(filename, "rb") as infile:
+        size = os.fstat(infile.fileno()).st_size
+        if not size:
+            return
+        mm = mmap.mmap(infile.fileno(), size, access=mmap.ACCESS_READ)
+        try:
+            find = mm.find
+            pos = start
+            while pos < size:
+                nxt = find(b"\n", pos) + 1 or size
+                yield mm[pos:nxt]
+                pos = nxt
+        finally:
+            mm.close()
+
+
+def gen_lines(filename, start=0, end=None, gzip_pipeline=True, use_mmap=False, gzip_index_span=None,
+              gzip_index_dir=None):
+    """
+    lines of log starting at offset start up to the line containing offset end.
+    gzipped logs are decompressed in a separate thread if gzip_pipeline is set (using seek index
+    with gzip_index_span set), plain logs are memory-mapped if use_mmap is set
+    """
+    if filename.endswith("gz"):
+        if gzip_pipeline:
+            lines = _gen_gzip_lines(filename, start, gzip_index_span, gzip_index_dir)
+        else:
+            lines = _gen_file_lines(gzip.open, filename, start)
+    elif use_mmap:
+        lines = _gen_mmap_lines(filename, start)
+    else:
+        lines = _gen_file_lines(io.open, filename, start)
+
+    pos = start
+    for line in lines:
+        if end is not None and pos >= end:
+            break
+        pos += len(line)
+        yield line
+
+
+def _gen_file_lines(opener, filename, start):
+    with opener(filename, "rb") as infile:
+        if start:
+            infile.seek(start)
+        for line in infile:
+            yield line
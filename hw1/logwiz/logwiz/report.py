@@ -1,11 +1,14 @@
 # -*- coding: utf-8 -*-
 import os
 import io
+import glob
+import gzip
 import json
 from string import Template
 
 
 TEMPLATE = "report.html"
+PAGE_SUFFIX = ".page-%04d.json"
 _ROOT = os.path.abspath(os.path.dirname(__file__))
 
 
@@ -13,12 +16,96 @@ def _get_static_data_path(filename):
     return os.path.join(_ROOT, "static", filename)
 
 
-def render_report(data, outfilename, sort_by, encoding="utf-8", template_file=None):
+def page_file_for(outfilename, page):
+    return os.path.splitext(outfilename)[0] + PAGE_SUFFIX % page
+
+
+def remove_pages(outfilename):
+    """
+    remove page files (and their gzipped copies) of report
+    """
+    for page_file in glob.glob(os.path.splitext(outfilename)[0] + PAGE_SUFFIX.split("%")[0] + "*"):
+        try:
+            os.remove(page_file)
+        except OSError:
+            pass
+
+
+def remove_report(outfilename):
+    """
+    remove possibly malformed report and its page files
+    """
+    try:
+        os.remove(outfilename)
+    except OSError:
+        pass
+    remove_pages(outfilename)
+
+
+def columnar_page(rows):
+    """
+    compact layout of rows: column names (union of keys of all rows) and list of values of every column,
+    None for rows without the column
+    """
+    columns = sorted(set(column for row in rows for column in row))
+    return {"columns": columns, "values": [[row.get(column) for row in rows] for column in columns]}
+
+
+def write_pages(rows, outfilename, page_size, encoding="utf-8", gzip_pages=False):
+    """
+    write rows after the first page_size ones to page files of page_size rows (columnar json),
+    with gzip_pages set also to their gzipped copies (for gzip_static). returns page file names
+    """
+    remove_pages(outfilename)
+    pages = []
+    for start in xrange(page_size, len(rows), page_size):
+        page_file = page_file_for(outfilename, len(pages) + 1)
+        dump = json.dumps(columnar_page(rows[start:start + page_size]), encoding=encoding)
+        with open(page_file, "wb") as outfile:
+            outfile.write(dump)
+        if gzip_pages:
+            with gzip.open(page_file + ".gz", "wb") as outfile:
+                outfile.write(dump)
+        pages.append(os.path.basename(page_file))
+    return pages
+
+
+def _gen_json_rows(rows, encoding, chunk_size=1000):
+    """
+    json list of rows encoded chunk by chunk (C encoder, unlike JSONEncoder.iterencode)
+    """
+    yield "["
+    for start in xrange(0, len(rows), chunk_size):
+        yield (", " if start else "") + json.dumps(rows[start:start + chunk_size], encoding=encoding)[1:-1]
+    yield "]"
+
+
+def render_report(data, outfilename, sort_by, encoding="utf-8", template_file=None, sections=None, heatmap=None,
+                  page_size=None, gzip_pages=False):
     """
     data: list of url time stats (dicts)
+    sections: list of additional tables (dicts with name and rows), e.g. parser.calc_dimension_stats
+    heatmap: url latency histograms in time buckets, see TimeSeries.heatmap
+    page_size: if set, only the first page_size rows are embedded in report (as columnar json),
+    others are written to page files next to it (see write_pages) which are loaded by the report on scroll.
+    rows are encoded and written one page at a time
     """
-    dump = json.dumps(sorted(data, key=lambda r: r[sort_by], reverse=True), encoding=encoding)
+    rows = sorted(data, key=lambda r: r[sort_by], reverse=True)
+    pages = []
+    if page_size:
+        pages = write_pages(rows, outfilename, page_size, encoding, gzip_pages)
+        table = [json.dumps(columnar_page(rows[:page_size]), encoding=encoding)]
+    else:
+        table = _gen_json_rows(rows, encoding)
     template_filename = template_file or _get_static_data_path(TEMPLATE)
+    with io.open(template_filename, encoding=encoding) as templ:
+        text = Template(templ.read()).safe_substitute(sections_json=json.dumps(sections or [], encoding=encoding),
+                                                      heatmap_json=json.dumps(heatmap, encoding=encoding),
+                                                      pages_json=json.dumps(pages))
+    head, placeholder, tail = text.partition("$table_json")
     with io.open(outfilename, "w", encoding=encoding) as outfile:
-        with io.open(template_filename, encoding=encoding) as templ:
-            outfile.write(Template(templ.read()).safe_substitute(table_json=dump))
+        outfile.write(head)
+        if placeholder:
+            for chunk in table:
+                outfile.write(unicode(chunk))
+        outfile.write(tail)
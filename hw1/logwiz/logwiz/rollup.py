@@ -0,0 +1,67 @@
+# -*- coding: utf-8 -*-
+# Multi-day reports built from stored per-day aggregates (see store.py)
+import os
+from datetime import datetime, timedelta
+from logging import info
+
+from logwiz.parser import calc_stats, calc_url_stats
+from logwiz.store import aggregate_file_for, merge_aggregates, merge_clients
+from logwiz.hll import add_clients
+
+
+def last_aggregate_date(aggregate_dir, template):
+    last_date = None
+    for fname in os.listdir(aggregate_dir):
+        try:
+            date = datetime.strptime(fname, template)
+        except ValueError:
+            continue
+        if not last_date or date > last_date:
+            last_date = date
+    return last_date
+
+
+def aggregate_files(aggregate_dir, template, start, end):
+    """
+    existing aggregate files for dates in [start, end]
+    """
+    files = []
+    date = start
+    while date <= end:
+        fname = aggregate_file_for(aggregate_dir, date, template)
+        if os.path.isfile(fname):
+            files.append(fname)
+        else:
+            info("No aggregate for %s" % date.strftime("%Y.%m.%d"))
+        date += timedelta(days=1)
+    return files
+
+
+def rollup_url_data(aggregate_dir, template, end, days):
+    """
+    merged url data for days ending at end (inclusive)
+    """
+    return merge_aggregates(aggregate_files(aggregate_dir, template, end - timedelta(days=days - 1), end))
+
+
+def compare_url_stats(url_stats, previous_url_data):
+    """
+    adds count and time_avg changes against previous_url_data to rows of url_stats
+    """
+    for row in url_stats:
+        prev = calc_stats(previous_url_data[row["url"]]) if row["url"] in previous_url_data else {}
+        row["count_delta"] = row["count"] - prev.get("count", 0)
+        row["time_avg_delta"] = round(row["time_avg"] - prev["avg"], 3) if prev else None
+    return url_stats
+
+
+def rollup_url_stats(aggregate_dir, template, end, days, top=None, compare=False):
+    """
+    url stats of days ending at end, with distinct clients estimates if they were stored
+    """
+    files = aggregate_files(aggregate_dir, template, end - timedelta(days=days - 1), end)
+    url_stats = add_clients(calc_url_stats(merge_aggregates(files), top=top), merge_clients(files))
+    if compare:
+        previous = rollup_url_data(aggregate_dir, template, end - timedelta(days=days), days)
+        compare_url_stats(url_stats, previous)
+    return url_stats
@@ -0,0 +1,64 @@
+# -*- coding: utf-8 -*-
+# Approximate aggregation over a sample of byte ranges of a plain log.
+# Only sampled blocks are read, counts and sums are scaled by inverse sampled fraction.
+import io
+import os
+import math
+import random
+
+from logwiz.readers import _find_line_start
+
+
+SAMPLE_BLOCK_SIZE = 1 << 20
+SAMPLE_MODES = ("stride", "random")
+CI_Z = 1.96  # 95% confidence intervals
+
+
+def sample_ranges(filename, fraction, mode="stride", block_size=SAMPLE_BLOCK_SIZE, seed=None):
+    """
+    byte ranges aligned to line boundaries covering about fraction of plain log.
+    log is split into blocks of block_size bytes, every 1/fraction-th block (stride)
+    or random blocks are taken
+    """
+    if mode not in SAMPLE_MODES:
+        raise ValueError("Unknown sampling mode %s" % mode)
+    size = os.path.getsize(filename)
+    blocks = -(-size // block_size)
+    n = min(int(math.ceil(blocks * fraction)), blocks)
+    if mode == "stride":
+        chosen = sorted(set(int(i / fraction) for i in range(n)))
+    else:
+        chosen = sorted(random.Random(seed).sample(range(blocks), n))
+
+    ranges = []
+    with io.open(filename, "rb") as infile:
+        for block in chosen:
+            start = _find_line_start(infile, block * block_size)
+            end = _find_line_start(infile, min((block + 1) * block_size, size))
+            if start >= end:
+                continue  # single line spans the whole block, it belongs to a previous one
+            if ranges and ranges[-1][1] == start:
+                ranges[-1] = (ranges[-1][0], end)
+            else:
+                ranges.append((start, end))
+    return ranges
+
+
+def sampled_fraction(filename, ranges):
+    size = os.path.getsize(filename)
+    return float(sum(end - start for start, end in ranges)) / size if size else 1.0
+
+
+def scale_row(row, count, time_sum, time_sumsq, fraction):
+    """
+    scale count and time_sum of report row by inverse sampled fraction and add half-widths of
+    their 95% confidence intervals (count_ci, time_sum_ci, time_avg_ci).
+    requests are treated as sampled independently, so intervals are optimistic for bursty urls
+    """
+    variance = max(time_sumsq / count - (time_sum / count) ** 2, 0.0)
+    row["count"] = int(round(count / fraction))
+    row["time_sum"] = round(time_sum / fraction, 3)
+    row["count_ci"] = round(CI_Z * math.sqrt(count * (1 - fraction)) / fraction, 3)
+    row["time_sum_ci"] = round(CI_Z * math.sqrt(time_sumsq * (1 - fraction)) / fraction, 3)
+    row["time_avg_ci"] = round(CI_Z * math.sqrt(variance / count), 3)
+    return row
@@ -3,33 +3,34 @@
 import sys
 import os
 import time
-import logging
-from logging import info, exception
+import signal
+import cProfile
+from logging import info, error, exception
 from argparse import ArgumentParser
+from multiprocessing import Pool
+from threading import Event
 
-from logwiz.conf import read_config, DEFAULT_CONFIG_LOCATION, DEFAULT_LOGGING_LEVEL
-from logwiz.report import render_report
-from logwiz.parser import parse_otus_log
-from logwiz.logutil import get_last_log
+from logwiz.conf import read_config, service_configs, DEFAULT_CONFIG_LOCATION, DEFAULT_LOGGING_LEVEL
+from logwiz.logger import init_logger
+from logwiz.report import render_report, remove_report
+from logwiz.hll import add_clients
+from logwiz.parser import aggregate_log, aggregate_lines, calc_url_stats, calc_dimension_stats, calc_heatmap, \
+    add_exemplars
+from logwiz.logutil import get_last_log, get_unreported_logs
+from logwiz.checkpoint import checkpoint_file_for
+from logwiz.store import aggregate_file_for, write_aggregate
+from logwiz.profiling import Profiler, metrics_file_for
+from logwiz.watch import make_watcher, health_file_for, write_health
+from logwiz.canon import UrlCanonicalizer
+from logwiz.tail import LogFollower, SlidingWindows, SnapshotServer, render_windows
 
 
 def prepare_env(conf):
     info("Preparing environment")
     if not os.path.isdir(conf["REPORT_DIR"]):
         os.makedirs(conf["REPORT_DIR"])
-
-
-def init_logger(level, log_dir=None):
-    logfile = os.path.join(log_dir, "log-analyzer.log") if log_dir else None
-    if log_dir and not os.path.isdir(log_dir):
-        os.makedirs(log_dir)
-    logging.basicConfig(
-            format='[%(asctime)s] %(levelname).1s %(message)s',
-            datefmt="%Y.%m.%d %H:%M:%S",
-            stream=sys.stdout if not logfile else None,
-            filename=logfile,
-            level=level
-            )
+    if conf["AGGREGATE_DIR"] and not os.path.isdir(conf["AGGREGATE_DIR"]):
+        os.makedirs(conf["AGGREGATE_DIR"])
 
 
 def report_to_create(path, date, template):
@@ -44,6 +45,296 @@ def write_timestamp(fname):
         os.utime(fname, (timestamp, timestamp))
 
 
+def url_rules(conf):
+    rules = dict(strip_query=conf["URL_STRIP_QUERY"], numeric_ids=conf["URL_NUMERIC_IDS"],
+                 rewrites=conf["URL_REWRITES"])
+    return rules if any(rules.values()) else None
+
+
+def clients_counters(agg):
+    return agg.clients.counters if agg.clients is not None else {}
+
+
+def megabytes(value):
+    return int(value * (1 << 20)) if value else None
+
+
+def process_log(conf, log, report_file, workers=None, checkpoint=True, profiler=None, pool=None):
+    info("Processing logfile %s with date %s" % (log.name, log.date))
+    profiler = profiler or Profiler(enabled=False)
+    checkpoint_file = checkpoint_file_for(conf["TIMESTAMP_FILE"]) \
+        if checkpoint and conf["CHECKPOINT_INTERVAL"] else None
+    with profiler.stage("aggregate", counts_lines=True):
+        agg = aggregate_log(os.path.join(conf["LOG_DIR"], log.name), encoding=conf["LOG_ENCODING"],
+                            max_errors=conf["MAX_ERRORS"], max_errors_ratio=conf["MAX_ERRORS_RATIO"],
+                            workers=workers or conf["WORKERS"], sketch_accuracy=conf["SKETCH_ACCURACY"],
+                            parser=conf["PARSER"], checkpoint_file=checkpoint_file,
+                            checkpoint_interval=conf["CHECKPOINT_INTERVAL"],
+                            checkpoint_max_overhead=conf["CHECKPOINT_MAX_OVERHEAD"], columnar=conf["COLUMNAR"],
+                            use_mmap=conf["MMAP"], url_rules=url_rules(conf), max_urls=conf["MAX_URLS"],
+                            errors_check_min_lines=conf["ERRORS_CHECK_MIN_LINES"], log_format=conf["LOG_FORMAT"],
+                            dimensions=conf["DIMENSIONS"], series_bucket=conf["SERIES_BUCKET"],
+                            series_max_urls=conf["SERIES_MAX_URLS"], profiler=profiler, pool=pool,
+                            memory_budget=megabytes(conf["MEMORY_BUDGET_MB"]), spill_dir=conf["SPILL_DIR"],
+                            gzip_index_span=megabytes(conf["GZIP_INDEX_SPAN_MB"]),
+                            gzip_index_dir=conf["GZIP_INDEX_DIR"], exemplars=conf["EXEMPLARS"],
+                            exemplars_max_urls=conf["EXEMPLARS_MAX_URLS"], clients_field=conf["CLIENTS_FIELD"],
+                            clients_precision=conf["CLIENTS_PRECISION"], clients_max_urls=conf["CLIENTS_MAX_URLS"])
+    try:
+        url_data = agg.url_data()
+        if conf["AGGREGATE_DIR"]:
+            aggregate_file = aggregate_file_for(conf["AGGREGATE_DIR"], log.date, conf["AGGREGATE_DATE_TEMPLATE"])
+            info("Saving aggregate %s" % aggregate_file)
+            with profiler.stage("store"):
+                write_aggregate(aggregate_file, url_data, conf["SKETCH_ACCURACY"], clients_counters(agg))
+        with profiler.stage("stats"):
+            url_stats = add_exemplars(agg, calc_url_stats(url_data, top=conf["REPORT_SIZE"]))
+            add_clients(url_stats, clients_counters(agg))
+            sections = calc_dimension_stats(agg, top=conf["REPORT_SIZE"])
+            heatmap = calc_heatmap(agg, url_stats, top=conf["HEATMAP_URLS"])
+    finally:
+        agg.close()
+    info("Rendering report %s" % report_file)
+    with profiler.stage("render"):
+        render_report(url_stats, report_file, conf["SORT_FIELD"], conf["REPORT_ENCODING"], sections=sections,
+                      heatmap=heatmap, page_size=conf["REPORT_PAGE_SIZE"], gzip_pages=conf["REPORT_GZIP_PAGES"])
+
+
+def report_profile(conf, profiler, cprofile=None, cprofile_file=None):
+    info("Profile of log analyzer run:\n%s" % profiler.summary())
+    metrics_file = metrics_file_for(conf["TIMESTAMP_FILE"])
+    info("Writing metrics %s" % metrics_file)
+    profiler.write_prometheus(metrics_file)
+    if cprofile:
+        info("Writing cProfile stats %s" % cprofile_file)
+        cprofile.dump_stats(cprofile_file)
+
+
+def _backfill_job(task):
+    conf, log, report_file = task
+    try:
+        # pool workers can not start nested pools, checkpoint file is shared between runs
+        process_log(conf, log, report_file, workers=1, checkpoint=False)
+    except Exception:
+        exception("Error parsing and processing log %s" % log.name)
+        remove_report(report_file)
+        return conf.get("NAME"), log, False
+    return conf.get("NAME"), log, True
+
+
+def backfill(conf):
+    """
+    process all logs from LOG_DIR without reports in a pool of BACKFILL_WORKERS processes
+    returns exit code
+    """
+    logs = get_unreported_logs(conf["LOG_DIR"], conf["LOG_TEMPLATE"], conf["REPORT_DIR"],
+                               conf["REPORT_DATE_TEMPLATE"])
+    if not logs:
+        info("No logs to backfill")
+        return 0
+    info("Backfilling %d logs" % len(logs))
+
+    tasks = [(conf, log, os.path.join(conf["REPORT_DIR"], log.date.strftime(conf["REPORT_DATE_TEMPLATE"])))
+             for log in logs]
+    failed = []
+    pool = Pool(min(conf["BACKFILL_WORKERS"], len(tasks)))
+    try:
+        for _, log, ok in pool.imap_unordered(_backfill_job, tasks):
+            info("Log %s %s" % (log.name, "processed" if ok else "failed"))
+            if not ok:
+                failed.append(log)
+        pool.close()
+    except BaseException:
+        pool.terminate()
+        raise
+    finally:
+        pool.join()
+
+    if len(failed) < len(tasks):
+        write_timestamp(conf["TIMESTAMP_FILE"])
+    if failed:
+        error("Failed to process %d logs: %s" % (len(failed), ", ".join(sorted(log.name for log in failed))))
+        return 1
+    return 0
+
+
+def _service_jobs(conf, backfill):
+    """
+    (log size, job) for logs of service to process: all logs without reports with backfill, otherwise the last one
+    """
+    if backfill:
+        logs = get_unreported_logs(conf["LOG_DIR"], conf["LOG_TEMPLATE"], conf["REPORT_DIR"],
+                                   conf["REPORT_DATE_TEMPLATE"])
+    else:
+        last_log = get_last_log(conf["LOG_DIR"], conf["LOG_TEMPLATE"])
+        logs = [last_log] if last_log and report_to_create(conf["REPORT_DIR"], last_log.date,
+                                                           conf["REPORT_DATE_TEMPLATE"]) else []
+    return [(os.path.getsize(os.path.join(conf["LOG_DIR"], log.name)),
+             (conf, log, os.path.join(conf["REPORT_DIR"], log.date.strftime(conf["REPORT_DATE_TEMPLATE"]))))
+            for log in logs]
+
+
+def run_services(conf, backfill=False):
+    """
+    process logs of all SERVICES in one pool of SERVICE_WORKERS processes, the largest logs first
+    (so that the longest jobs do not start last and the whole batch finishes sooner).
+    failure of a service (preparing its environment, searching its logs, processing a log) does not affect others,
+    every service writes its own TIMESTAMP_FILE if some of its logs were processed.
+    returns exit code
+    """
+    jobs, failed, processed = [], set(), set()
+    for service_conf in service_configs(conf):
+        try:
+            prepare_env(service_conf)
+            jobs.extend(_service_jobs(service_conf, backfill))
+        except Exception:
+            exception("Error searching logs of service %s" % service_conf["NAME"])
+            failed.add(service_conf["NAME"])
+    if not jobs:
+        info("No logs to process")
+        return 1 if failed else 0
+    jobs.sort(key=lambda job: job[0], reverse=True)
+    tasks = [task for _, task in jobs]
+    info("Processing %d logs of %d services" % (len(tasks), len(set(task[0]["NAME"] for task in tasks))))
+
+    pool = Pool(min(conf["SERVICE_WORKERS"], len(tasks)))
+    try:
+        for name, log, ok in pool.imap_unordered(_backfill_job, tasks):  # tasks are handed out in order
+            info("Service %s: log %s %s" % (name, log.name, "processed" if ok else "failed"))
+            (processed if ok else failed).add(name)
+        pool.close()
+    except BaseException:
+        pool.terminate()
+        raise
+    finally:
+        pool.join()
+
+    timestamp_files = dict((service_conf["NAME"], service_conf["TIMESTAMP_FILE"]) for service_conf, _, _ in tasks)
+    for name in processed:
+        write_timestamp(timestamp_files[name])
+    if failed:
+        error("Failed services: %s" % ", ".join(sorted(failed)))
+        return 1
+    return 0
+
+
+def _settled_logs(conf, since, seen, failed):
+    """
+    logs without reports dated since or later which did not change since the previous call
+    and were not modified for WATCH_SETTLE seconds (rotated log may still be written or compressed).
+    seen and failed: log name -> (size, mtime) of the last check and of the failed processing attempt
+    returns (logs to process, whether some logs are still settling)
+    """
+    logs, settling = [], False
+    for log in get_unreported_logs(conf["LOG_DIR"], conf["LOG_TEMPLATE"], conf["REPORT_DIR"],
+                                   conf["REPORT_DATE_TEMPLATE"]):
+        if since and log.date < since:
+            continue
+        try:
+            st = os.stat(os.path.join(conf["LOG_DIR"], log.name))
+        except OSError:
+            continue  # rotated away
+        identity = (st.st_size, st.st_mtime)
+        if failed.get(log.name) == identity:
+            continue
+        if seen.get(log.name) != identity or time.time() - st.st_mtime < conf["WATCH_SETTLE"]:
+            seen[log.name] = identity
+            settling = True
+            continue
+        logs.append((log, identity))
+    return logs, settling
+
+
+def watch(conf, stop):
+    """
+    daemon mode: logs appearing in LOG_DIR are processed as soon as they are settled,
+    with a warm pool of WORKERS processes. the last log is processed at start if it has no report.
+    status is written to WATCH_HEALTH_FILE (next to TIMESTAMP_FILE by default) on every check
+    """
+    last_log = get_last_log(conf["LOG_DIR"], conf["LOG_TEMPLATE"])
+    since = last_log.date if last_log else None
+    health_file = conf["WATCH_HEALTH_FILE"] or health_file_for(conf["TIMESTAMP_FILE"])
+    watcher = make_watcher(conf["LOG_DIR"], conf["WATCH_POLL_INTERVAL"])
+    info("Watching %s with %s watcher" % (conf["LOG_DIR"], watcher.name))
+    status = {"pid": os.getpid(), "watcher": watcher.name, "state": "watching", "processed": 0, "failed": 0,
+              "last_log": None, "last_error": None}
+    seen, failed = {}, {}
+    pool = Pool(conf["WORKERS"]) if conf["WORKERS"] > 1 else None
+    try:
+        while not stop.is_set():
+            logs, settling = _settled_logs(conf, since, seen, failed)
+            for log, identity in logs:
+                report_file = os.path.join(conf["REPORT_DIR"], log.date.strftime(conf["REPORT_DATE_TEMPLATE"]))
+                status.update(state="processing", last_log=log.name)
+                write_health(health_file, status)
+                try:
+                    process_log(conf, log, report_file, pool=pool)
+                    write_timestamp(conf["TIMESTAMP_FILE"])
+                    status["processed"] += 1
+                except Exception as e:
+                    exception("Error parsing and processing log %s" % log.name)
+                    remove_report(report_file)
+                    failed[log.name] = identity  # retried only if the log changes
+                    status["failed"] += 1
+                    status["last_error"] = "%s: %s" % (log.name, e)
+                if stop.is_set():
+                    break
+            status["state"] = "watching"
+            write_health(health_file, status)
+            watcher.wait(conf["WATCH_POLL_INTERVAL"] if settling else conf["WATCH_HEARTBEAT"], stop)
+    finally:
+        watcher.close()
+        if pool is not None:
+            pool.close()
+            pool.join()
+        status["state"] = "stopped"
+        write_health(health_file, status)
+    info("Stopped watching %s" % conf["LOG_DIR"])
+    return 0
+
+
+def tail(conf, stop):
+    """
+    follow live TAIL_LOG (in LOG_DIR) from its end: lines are aggregated into TAIL_SLOT seconds slots
+    of TAIL_WINDOWS sliding windows, every TAIL_REFRESH seconds TAIL_TOP urls of every window by SORT_FIELD
+    are published as json on TAIL_HTTP_PORT of localhost and/or rendered to TAIL_REPORT_FILE
+    """
+    if not conf["TAIL_HTTP_PORT"] and not conf["TAIL_REPORT_FILE"]:
+        raise ValueError("Tail mode requires TAIL_HTTP_PORT or TAIL_REPORT_FILE")
+    follower = LogFollower(os.path.join(conf["LOG_DIR"], conf["TAIL_LOG"]))
+    windows = SlidingWindows(conf["TAIL_WINDOWS"], conf["TAIL_SLOT"], conf["SKETCH_ACCURACY"] or 0.01,
+                             conf["TAIL_MAX_URLS"])
+    server = SnapshotServer(conf["TAIL_HTTP_PORT"]) if conf["TAIL_HTTP_PORT"] else None
+    info("Following %s" % follower.filename)
+    rules = url_rules(conf)
+    canonical = UrlCanonicalizer(**rules) if rules else None  # one cache for the whole run
+    next_refresh = time.time() + conf["TAIL_REFRESH"]
+    try:
+        while not stop.is_set():
+            lines = follower.read()
+            now = time.time()
+            windows.advance(now)
+            if lines:
+                aggregate_lines(lines, windows.current, conf["LOG_ENCODING"], conf["PARSER"], canonical,
+                                conf["LOG_FORMAT"])
+            if now >= next_refresh:
+                snapshot = windows.snapshot(conf["TAIL_TOP"], conf["SORT_FIELD"])
+                if server is not None:
+                    server.publish(snapshot)
+                if conf["TAIL_REPORT_FILE"]:
+                    render_windows(snapshot, conf["TAIL_REPORT_FILE"], conf["SORT_FIELD"], conf["REPORT_ENCODING"])
+                next_refresh = now + conf["TAIL_REFRESH"]
+            if not lines:
+                stop.wait(conf["TAIL_POLL_INTERVAL"])
+    finally:
+        follower.close()
+        if server is not None:
+            server.close()
+    info("Stopped following %s (%d rotations, %d truncations)" % (follower.filename, follower.rotations,
+                                                                  follower.truncations))
+    return 0
+
+
 class NothingToProcess(Exception):
     pass
 
@@ -52,18 +343,79 @@ def main():
     argparser = ArgumentParser()
     argparser.add_argument("--config", dest="config", type=str, default=DEFAULT_CONFIG_LOCATION,
                            help="config file")
+    argparser.add_argument("--backfill", dest="backfill", action="store_true",
+                           help="process all logs without reports instead of the last one")
+    argparser.add_argument("--watch", dest="watch", action="store_true",
+                           help="run as a daemon processing logs as soon as they appear in LOG_DIR")
+    argparser.add_argument("--tail", dest="tail", action="store_true",
+                           help="follow the live log and publish top urls of sliding windows")
+    argparser.add_argument("--profile", dest="profile", action="store_true",
+                           help="log per-stage timings and write them as metrics next to timestamp file")
+    argparser.add_argument("--profile-dump", dest="profile_dump", type=str, default=None,
+                           help="with --profile, dump cProfile stats of the run to this file")
     args = argparser.parse_args()
     conf = read_config(args.config)
     init_logger(log_dir=conf.get("LOGGER_DIR", None), level=DEFAULT_LOGGING_LEVEL)
 
+    if conf["SERVICES"]:
+        if args.watch or args.tail:
+            error("--watch and --tail do not support SERVICES, run a daemon per service")
+            sys.exit(1)
+        try:
+            sys.exit(run_services(conf, backfill=args.backfill))
+        except SystemExit:
+            raise
+        except BaseException:
+            exception("Error processing services")
+            sys.exit(1)
+
     try:
         prepare_env(conf)
     except BaseException:
         exception("Error preparing environment")
         sys.exit(1)
 
+    if args.tail:
+        stop = Event()
+        for signum in (signal.SIGTERM, signal.SIGINT):
+            signal.signal(signum, lambda signum, frame: stop.set())
+        try:
+            sys.exit(tail(conf, stop))
+        except SystemExit:
+            raise
+        except BaseException:
+            exception("Error following log")
+            sys.exit(1)
+
+    if args.watch:
+        stop = Event()
+        for signum in (signal.SIGTERM, signal.SIGINT):
+            signal.signal(signum, lambda signum, frame: stop.set())
+        try:
+            sys.exit(watch(conf, stop))
+        except SystemExit:
+            raise
+        except BaseException:
+            exception("Error watching logs")
+            sys.exit(1)
+
+    if args.backfill:
+        try:
+            sys.exit(backfill(conf))
+        except SystemExit:
+            raise
+        except BaseException:
+            exception("Error backfilling logs")
+            sys.exit(1)
+
+    profiler = Profiler(enabled=args.profile)
+    cprofile = cProfile.Profile() if args.profile and args.profile_dump else None
+    if cprofile:
+        cprofile.enable()
+
     try:
-        last_log = get_last_log(conf["LOG_DIR"], conf["LOG_TEMPLATE"])
+        with profiler.stage("find_log"):
+            last_log = get_last_log(conf["LOG_DIR"], conf["LOG_TEMPLATE"])
         if not last_log:
             info("No logs to process")
             raise NothingToProcess
@@ -79,21 +431,21 @@ def main():
         sys.exit(1)
 
     try:
-        info("Processing logfile %s with date %s" % (last_log.name, last_log.date))
-        url_stats = parse_otus_log(os.path.join(conf["LOG_DIR"], last_log.name), encoding=conf["LOG_ENCODING"],
-                                   top=conf["REPORT_SIZE"], max_errors=conf["MAX_ERRORS"],
-                                   max_errors_ratio=conf["MAX_ERRORS_RATIO"])
-        info("Rendering report %s" % report_file)
-        render_report(url_stats, report_file, conf["SORT_FIELD"], conf["REPORT_ENCODING"])
+        process_log(conf, last_log, report_file, profiler=profiler)
         write_timestamp(conf["TIMESTAMP_FILE"])
     except BaseException:
         exception("Error parsing and processing log")
-        try:
-            os.remove(report_file)  # remove possibly malformed file
-        except OSError:
-            pass
+        remove_report(report_file)
         sys.exit(1)
 
+    if args.profile:
+        if cprofile:
+            cprofile.disable()
+        try:
+            report_profile(conf, profiler, cprofile, args.profile_dump)
+        except Exception:
+            exception("Error writing profile")
+
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,60 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+import sys
+import os
+from datetime import datetime, timedelta
+from logging import info, exception
+from argparse import ArgumentParser
+
+from logwiz.conf import read_config, DEFAULT_CONFIG_LOCATION, DEFAULT_LOGGING_LEVEL
+from logwiz.logger import init_logger
+from logwiz.report import render_report, remove_report
+from logwiz.rollup import rollup_url_stats, last_aggregate_date
+
+
+def main():
+    argparser = ArgumentParser(description="Build report for several days from stored aggregates")
+    argparser.add_argument("--config", dest="config", type=str, default=DEFAULT_CONFIG_LOCATION,
+                           help="config file")
+    argparser.add_argument("--date", dest="date", type=lambda s: datetime.strptime(s, "%Y%m%d"), default=None,
+                           help="last day of the period (YYYYMMDD), latest stored aggregate by default")
+    argparser.add_argument("--days", dest="days", type=int, default=7,
+                           help="period length in days (7 - weekly, 30 - monthly report)")
+    argparser.add_argument("--compare", dest="compare", action="store_true",
+                           help="add changes against the previous period of the same length")
+    args = argparser.parse_args()
+    conf = read_config(args.config)
+    init_logger(log_dir=conf.get("LOGGER_DIR", None), level=DEFAULT_LOGGING_LEVEL)
+
+    report_file = None
+    try:
+        aggregate_dir, template = conf["AGGREGATE_DIR"], conf["AGGREGATE_DATE_TEMPLATE"]
+        if not aggregate_dir or not os.path.isdir(aggregate_dir):
+            info("No aggregates to roll up")
+            sys.exit(0)
+        end = args.date or last_aggregate_date(aggregate_dir, template)
+        if not end:
+            info("No aggregates to roll up")
+            sys.exit(0)
+        start = end - timedelta(days=args.days - 1)
+
+        info("Rolling up aggregates from %s to %s" % (start.date(), end.date()))
+        url_stats = rollup_url_stats(aggregate_dir, template, end, args.days, top=conf["REPORT_SIZE"],
+                                     compare=args.compare)
+        if not os.path.isdir(conf["REPORT_DIR"]):
+            os.makedirs(conf["REPORT_DIR"])
+        report_file = os.path.join(conf["REPORT_DIR"], conf["ROLLUP_REPORT_TEMPLATE"].format(start=start, end=end))
+        info("Rendering report %s" % report_file)
+        render_report(url_stats, report_file, conf["SORT_FIELD"], conf["REPORT_ENCODING"],
+                      page_size=conf["REPORT_PAGE_SIZE"], gzip_pages=conf["REPORT_GZIP_PAGES"])
+    except SystemExit:
+        raise
+    except BaseException:
+        exception("Error rolling up aggregates")
+        if report_file:
+            remove_report(report_file)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,131 @@
+# -*- coding: utf-8 -*-
+# Bounded-memory statistics for request times.
+# QuantileSketch keeps counts in logarithmic buckets (as in DDSketch), so any quantile
+# is estimated with relative error <= accuracy and sketches of any size can be merged.
+import math
+
+
+PERCENTILES = [("p90", 0.90), ("p95", 0.95), ("p99", 0.99)]
+
+
+class QuantileSketch(object):
+    def __init__(self, accuracy=0.01):
+        if not 0 < accuracy < 1:
+            raise ValueError("Sketch accuracy should be in (0, 1), got %s" % accuracy)
+        self.accuracy = accuracy
+        self.gamma = (1 + accuracy) / (1 - accuracy)
+        self._log_gamma = math.log(self.gamma)
+        self.buckets = {}  # bucket index i -> number of values in (gamma^(i-1), gamma^i]
+        self.zeros = 0
+        self.count = 0
+
+    def add(self, value, count=1):
+        if value <= 0:
+            self.zeros += count
+        else:
+            idx = int(math.ceil(math.log(value) / self._log_gamma))
+            self.buckets[idx] = self.buckets.get(idx, 0) + count
+        self.count += count
+
+    def merge(self, other):
+        if other.accuracy != self.accuracy:
+            raise ValueError("Can not merge sketches with different accuracy (%s, %s)" %
+                             (self.accuracy, other.accuracy))
+        for idx, cnt in other.buckets.iteritems():
+            self.buckets[idx] = self.buckets.get(idx, 0) + cnt
+        self.zeros += other.zeros
+        self.count += other.count
+
+    def subtract(self, other):
+        """
+        remove values of other (merged into this sketch before), e.g. when they leave a sliding window
+        """
+        if other.accuracy != self.accuracy:
+            raise ValueError("Can not subtract sketches with different accuracy (%s, %s)" %
+                             (self.accuracy, other.accuracy))
+        for idx, cnt in other.buckets.iteritems():
+            left = self.buckets.get(idx, 0) - cnt
+            if left > 0:
+                self.buckets[idx] = left
+            else:
+                self.buckets.pop(idx, None)
+        self.zeros -= other.zeros
+        self.count -= other.count
+
+    def quantile(self, q):
+        """
+        value of rank int(q * count) in sorted data (same convention as calc_stats median)
+        """
+        if not self.count:
+            return None
+        rank = min(int(q * self.count), self.count - 1)
+        seen = self.zeros
+        if rank < seen:
+            return 0.0
+        for idx in sorted(self.buckets):
+            seen += self.buckets[idx]
+            if seen > rank:
+                return 2 * self.gamma ** idx / (self.gamma + 1)
+
+
+class StreamingStats(object):
+    """
+    list-like accumulator of request times: count, sum, sum of squares and max are exact,
+    median and percentiles come from QuantileSketch
+    """
+    sumsq = 0.0
+
+    def __init__(self, accuracy=0.01):
+        self.count = 0
+        self.sum = 0.0
+        self.sumsq = 0.0
+        self.max = None
+        self.sketch = QuantileSketch(accuracy)
+
+    def __len__(self):
+        return self.count
+
+    def append(self, value):
+        self.count += 1
+        self.sum += value
+        self.sumsq += value * value
+        if self.max is None or value > self.max:
+            self.max = value
+        self.sketch.add(value)
+
+    def extend(self, other):
+        if not other.count:
+            return
+        self.count += other.count
+        self.sum += other.sum
+        self.sumsq += other.sumsq
+        if self.max is None or other.max > self.max:
+            self.max = other.max
+        self.sketch.merge(other.sketch)
+
+    def subtract(self, other):
+        """
+        remove values of other (extended with before), max is kept as an upper bound: it can not be subtracted
+        """
+        self.count -= other.count
+        self.sum -= other.sum
+        self.sumsq -= other.sumsq
+        self.sketch.subtract(other.sketch)
+
+    def quantile(self, q):
+        return min(self.sketch.quantile(q), self.max)
+
+    def stats(self):
+        if not self.count:
+            return {}
+
+        res = {
+            "count": self.count,
+            "sum": self.sum,
+            "avg": self.sum / self.count,
+            "med": self.quantile(0.5),
+            "max": self.max
+            }
+        for name, q in PERCENTILES:
+            res[name] = self.quantile(q)
+        return res
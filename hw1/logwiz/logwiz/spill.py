@@ -0,0 +1,93 @@
+# -*- coding: utf-8 -*-
+# External aggregation: url stats over memory budget are spilled to run files sorted by url,
+# runs are merged with a k-way merge when stats are iterated.
+import os
+import heapq
+import tempfile
+import cPickle as pickle
+from array import array
+from itertools import groupby
+
+from logwiz.sketch import StreamingStats
+
+
+# rough memory estimates of aggregation table entries (bytes), measured on CPython 2.7 x86_64
+URL_COST = 400
+VALUE_COST = 48
+SKETCH_URL_COST = 1700
+
+
+def table_size(urls, values, sketches=False):
+    """
+    estimated memory of aggregation table with given numbers of urls and stored request times
+    """
+    if sketches:
+        return urls * SKETCH_URL_COST
+    return urls * URL_COST + values * VALUE_COST
+
+
+def write_run(stats, spill_dir=None):
+    """
+    write url -> request times (list or StreamingStats) sorted by url to a new run file, returns its path.
+    lists are stored as arrays of doubles
+    """
+    fd, path = tempfile.mkstemp(prefix="logwiz-", suffix=".run", dir=spill_dir)
+    with os.fdopen(fd, "wb") as outfile:
+        pickler = pickle.Pickler(outfile, pickle.HIGHEST_PROTOCOL)
+        pickler.fast = True  # records are independent, memo would keep all of them alive
+        for url in sorted(stats):
+            data = stats[url]
+            pickler.dump((url, data if isinstance(data, StreamingStats) else array("d", data)))
+    return path
+
+
+def read_run(path):
+    with open(path, "rb") as infile:
+        unpickler = pickle.Unpickler(infile)
+        while True:
+            try:
+                yield unpickler.load()
+            except EOFError:
+                return
+
+
+def remove_runs(paths):
+    for path in paths:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+
+def _merge_data(items):
+    data = None
+    for item in items:
+        if data is None:
+            data = StreamingStats(item.sketch.accuracy) if isinstance(item, StreamingStats) else array("d")
+        data.extend(item)
+    return data
+
+
+class SpilledStats(object):
+    """
+    url -> request times partly spilled to run files and partly kept in memory (dict).
+    dict-like iteritems merges all of them in order of urls, only one url is in memory at a time.
+    run files are removed by close()
+    """
+    def __init__(self, runs, stats):
+        self.runs = list(runs)
+        self.stats = stats
+
+    def _gen_sorted(self, source, items):
+        for url, data in items:
+            yield url, source, data
+
+    def iteritems(self):
+        sources = [self._gen_sorted(i, read_run(path)) for i, path in enumerate(self.runs)]
+        sources.append(self._gen_sorted(len(self.runs), ((url, self.stats[url]) for url in sorted(self.stats))))
+        for url, group in groupby(heapq.merge(*sources), key=lambda item: item[0]):
+            yield url, _merge_data(data for _, _, data in group)
+
+    def close(self):
+        remove_runs(self.runs)
+        self.runs = []
@@ -0,0 +1,174 @@
+# -*- coding: utf-8 -*-
+# Persistent per-day aggregates: url dictionary, count/sum/max columns and latency sketches
+# in a compact zlib-compressed binary file. Aggregates of several days are merged without reparsing logs.
+# Optional HyperLogLog registers of distinct clients follow the sketches (files without them are still valid).
+import io
+import os
+import struct
+import zlib
+from array import array
+
+from logwiz.sketch import StreamingStats
+from logwiz.hll import HyperLogLog
+
+
+MAGIC = b"LWAG"
+VERSION = 1
+_HEADER = struct.Struct("<4sHdQ")  # magic, version, sketch accuracy, number of urls
+DEFAULT_SKETCH_ACCURACY = 0.01
+
+
+class StoreError(Exception):
+    pass
+
+
+def aggregate_file_for(aggregate_dir, date, template):
+    return os.path.join(aggregate_dir, date.strftime(template))
+
+
+def _to_streaming(data, accuracy):
+    if isinstance(data, StreamingStats):
+        return data
+    stream = StreamingStats(accuracy)
+    for value in data:
+        stream.append(value)
+    return stream
+
+
+def write_aggregate(filename, url_data, sketch_accuracy=None, clients=None):
+    """
+    url_data: dict url -> list of request times or StreamingStats (or ColumnarStats)
+    lists are converted to sketches with sketch_accuracy (DEFAULT_SKETCH_ACCURACY by default)
+    clients: dict url -> HyperLogLog (of the same precision), e.g. UrlClients.counters
+    """
+    urls, counts, sums, maxs, zeros, sizes = [], array("l"), array("d"), array("d"), array("l"), array("l")
+    bucket_ids, bucket_counts = array("l"), array("l")
+    clients_precision, clients_urls, clients_registers = array("l"), array("l"), []
+    accuracy = None
+    for url, data in url_data.iteritems():
+        stream = _to_streaming(data, sketch_accuracy or DEFAULT_SKETCH_ACCURACY)
+        if not stream.count:
+            continue
+        if accuracy is None:
+            accuracy = stream.sketch.accuracy
+        elif accuracy != stream.sketch.accuracy:
+            raise StoreError("Can not store sketches with different accuracy")
+        if clients and url in clients:
+            if not clients_precision:
+                clients_precision.append(clients[url].precision)
+            elif clients_precision[0] != clients[url].precision:
+                raise StoreError("Can not store HyperLogLog with different precision")
+            clients_urls.append(len(urls))
+            clients_registers.append(bytes(clients[url].registers))
+        urls.append(url.encode("utf-8"))
+        counts.append(stream.count)
+        sums.append(stream.sum)
+        maxs.append(stream.max)
+        zeros.append(stream.sketch.zeros)
+        sizes.append(len(stream.sketch.buckets))
+        for idx in sorted(stream.sketch.buckets):
+            bucket_ids.append(idx)
+            bucket_counts.append(stream.sketch.buckets[idx])
+
+    body = b"".join(
+        struct.pack("<Q", len(blob)) + blob for blob in
+        [b"\0".join(urls)] + [column.tostring() for column in
+                              (counts, sums, maxs, zeros, sizes, bucket_ids, bucket_counts)] +
+        ([clients_precision.tostring(), clients_urls.tostring(), b"".join(clients_registers)]
+         if clients_precision else [])
+        )
+    tmp_file = filename + ".tmp"
+    with io.open(tmp_file, "wb") as outfile:
+        outfile.write(_HEADER.pack(MAGIC, VERSION, accuracy or sketch_accuracy or DEFAULT_SKETCH_ACCURACY,
+                                   len(urls)))
+        outfile.write(zlib.compress(body, 6))
+    os.rename(tmp_file, filename)
+
+
+def _read_blobs(body):
+    pos = 0
+    while pos < len(body):
+        size, = struct.unpack_from("<Q", body, pos)
+        pos += 8
+        yield body[pos:pos + size]
+        pos += size
+
+
+def _column(typecode, blob):
+    column = array(typecode)
+    column.fromstring(blob)
+    return column
+
+
+def _read_body(filename):
+    with io.open(filename, "rb") as infile:
+        header = infile.read(_HEADER.size)
+        if len(header) != _HEADER.size:
+            raise StoreError("Truncated aggregate file %s" % filename)
+        magic, version, accuracy, size = _HEADER.unpack(header)
+        if magic != MAGIC or version != VERSION:
+            raise StoreError("Unsupported aggregate file %s" % filename)
+        blobs = list(_read_blobs(zlib.decompress(infile.read())))
+    return accuracy, (blobs[0].split(b"\0") if size else []), blobs[1:]
+
+
+def read_aggregate(filename):
+    """
+    returns dict url -> StreamingStats
+    """
+    accuracy, urls, blobs = _read_body(filename)
+    counts, sums, maxs, zeros, sizes, bucket_ids, bucket_counts = [
+        _column(typecode, blob) for typecode, blob in zip("lddllll", blobs)]
+
+    result = {}
+    pos = 0
+    for i, url in enumerate(urls):
+        stream = StreamingStats(accuracy)
+        stream.count, stream.sum, stream.max = counts[i], sums[i], maxs[i]
+        sketch = stream.sketch
+        sketch.zeros, sketch.count = zeros[i], counts[i]
+        sketch.buckets = dict(zip(bucket_ids[pos:pos + sizes[i]], bucket_counts[pos:pos + sizes[i]]))
+        pos += sizes[i]
+        result[url.decode("utf-8")] = stream
+    return result
+
+
+def read_clients(filename):
+    """
+    returns dict url -> HyperLogLog of distinct clients (empty if they were not stored)
+    """
+    _, urls, blobs = _read_body(filename)
+    if len(blobs) < 10:
+        return {}
+    precision, = _column("l", blobs[7])
+    size = 1 << precision
+    return dict((urls[idx].decode("utf-8"), HyperLogLog(precision, blobs[9][i * size:(i + 1) * size]))
+                for i, idx in enumerate(_column("l", blobs[8])))
+
+
+def merge_clients(filenames):
+    """
+    merged dict url -> HyperLogLog of several aggregate files
+    """
+    merged = {}
+    for filename in filenames:
+        for url, counter in read_clients(filename).iteritems():
+            if url in merged:
+                merged[url].merge(counter)
+            else:
+                merged[url] = counter
+    return merged
+
+
+def merge_aggregates(filenames):
+    """
+    merged dict url -> StreamingStats of several aggregate files
+    """
+    merged = {}
+    for filename in filenames:
+        for url, stream in read_aggregate(filename).iteritems():
+            if url in merged:
+                merged[url].extend(stream)
+            else:
+                merged[url] = stream
+    return merged
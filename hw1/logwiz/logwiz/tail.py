@@ -0,0 +1,237 @@
+# -*- coding: utf-8 -*-
+# Tail mode: lines appended to a live log are aggregated into fixed-width time slots kept in a ring buffer,
+# per url stats of sliding windows (e.g. the last 1, 5 and 15 minutes) are updated incrementally
+# when a slot is closed: its stats are added to every window and stats of the slot leaving a window
+# are subtracted (counts, sums and sketch buckets are additive), so a line is aggregated only once.
+import os
+import json
+import heapq
+import threading
+from collections import deque
+from BaseHTTPServer import HTTPServer, BaseHTTPRequestHandler
+
+from logwiz.sketch import StreamingStats
+from logwiz.parser import Aggregate, calc_url_stats
+from logwiz.report import render_report
+
+
+READ_SIZE = 4 << 20
+
+
+class LogFollower(object):
+    """
+    reads lines appended to a live log. the log is reopened when it is rotated (path refers to another inode),
+    the rest of the rotated file is read first; reading restarts from the beginning when the log is truncated
+    (copytruncate). the last incomplete line is kept until its end is written.
+    from_end: skip lines written before start, a log created later is always read from the beginning
+    """
+    def __init__(self, filename, from_end=True, read_size=READ_SIZE):
+        self.filename = filename
+        self.read_size = read_size
+        self.rotations = 0
+        self.truncations = 0
+        self._file = None
+        self._identity = None
+        self._tail = b""
+        self._open(from_end)
+
+    def _open(self, from_end):
+        try:
+            infile = open(self.filename, "rb")
+        except IOError:
+            return False
+        st = os.fstat(infile.fileno())
+        self._identity = (st.st_dev, st.st_ino)
+        if from_end:
+            infile.seek(0, os.SEEK_END)
+        self._file, self._tail = infile, b""
+        return True
+
+    def _path_identity(self):
+        try:
+            st = os.stat(self.filename)
+        except OSError:
+            return None  # rotated away, new log is not created yet
+        return st.st_dev, st.st_ino
+
+    def read(self):
+        """
+        complete lines (without line ends) appended since the previous call, at most about read_size bytes
+        """
+        if self._file is None and not self._open(False):
+            return []
+        data = self._file.read(self.read_size)
+        if not data:
+            identity = self._path_identity()
+            if identity is not None and identity != self._identity:
+                rest = [self._tail] if self._tail else []
+                self.close()
+                self.rotations += 1
+                return rest + (self.read() if self._open(False) else [])
+            if os.fstat(self._file.fileno()).st_size < self._file.tell():
+                self._file.seek(0)
+                self._tail = b""
+                self.truncations += 1
+                data = self._file.read(self.read_size)
+        data = self._tail + data
+        end = data.rfind(b"\n") + 1
+        self._tail = data[end:]
+        return data[:end - 1].split(b"\n") if end else []
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+
+def window_name(seconds):
+    return "%dm" % (seconds // 60) if not seconds % 60 else "%ds" % seconds
+
+
+class SlidingWindows(object):
+    """
+    ring buffer of Aggregates of the last slot-wide time slots covering the longest of windows (seconds)
+    and url -> StreamingStats of every window. lines are added to self.current, closed slots
+    are added to windows, so windows lag behind by less than a slot.
+    urls over max_urls are folded into OTHER_URL in every slot (window may have more urls, as different ones
+    may be seen in different slots)
+    """
+    def __init__(self, windows=(60, 300, 900), slot=5, sketch_accuracy=0.01, max_urls=10000):
+        if not sketch_accuracy:
+            raise ValueError("Sliding windows require sketch_accuracy")
+        if not windows or any(seconds <= 0 or seconds % slot for seconds in windows):
+            raise ValueError("Windows should be positive multiples of slot %s, got %s" % (slot, windows))
+        self.windows = sorted(windows)
+        self.slot = slot
+        self.sketch_accuracy = sketch_accuracy
+        self.max_urls = max_urls
+        self.slots = deque(maxlen=self.windows[-1] // slot)  # closed slots (None if empty), the newest last
+        self.stats = dict((seconds, {}) for seconds in self.windows)
+        self.totals = dict((seconds, [0, 0]) for seconds in self.windows)  # lines, errors
+        self.current = self._new_slot()
+        self.current_start = None
+
+    def _new_slot(self):
+        return Aggregate(self.sketch_accuracy, self.max_urls)
+
+    def advance(self, now):
+        """
+        close current slot (and add empty ones for slots without lines) if now is past its end
+        """
+        start = now - now % self.slot
+        if self.current_start is None or start < self.current_start:
+            self.current_start = start
+            return
+        passed = int((start - self.current_start) // self.slot)
+        if not passed:
+            return
+        self._close(self.current if self.current.count else None)
+        for _ in xrange(min(passed, self.slots.maxlen) - 1):
+            self._close(None)
+        self.current, self.current_start = self._new_slot(), start
+
+    def _close(self, agg):
+        for seconds in self.windows:
+            size = seconds // self.slot
+            if len(self.slots) >= size:
+                self._apply(seconds, self.slots[-size], -1)
+            self._apply(seconds, agg, 1)
+        self.slots.append(agg)
+
+    def _apply(self, seconds, agg, sign):
+        if agg is None:
+            return
+        stats, totals = self.stats[seconds], self.totals[seconds]
+        totals[0] += sign * agg.count
+        totals[1] += sign * agg.errors_count
+        for url, data in agg.stats.iteritems():
+            window_data = stats.get(url)
+            if sign > 0:
+                if window_data is None:
+                    window_data = stats[url] = StreamingStats(self.sketch_accuracy)
+                window_data.extend(data)
+            else:
+                window_data.subtract(data)
+                if window_data.count <= 0:
+                    del stats[url]
+
+    def top(self, seconds, top=50, sort_by="time_sum"):
+        """
+        report rows of top urls of window by sort_by. only top urls get stats (and exact max)
+        if sort_by is count, time_sum or time_avg, all urls of the window otherwise
+        """
+        stats = self.stats[seconds]
+        key = {"count": lambda url: stats[url].count, "time_sum": lambda url: stats[url].sum,
+               "time_avg": lambda url: stats[url].sum / stats[url].count}.get(sort_by)
+        urls = heapq.nlargest(top, stats, key=key) if key else list(stats)
+        total_count, total_time = 0, 0.0
+        for data in stats.itervalues():
+            total_count += data.count
+            total_time += data.sum
+        slots = [agg for agg in list(self.slots)[-(seconds // self.slot):] if agg is not None]
+        for url in urls:
+            stats[url].max = max(agg.stats[url].max for agg in slots if url in agg.stats)
+        rows = calc_url_stats(dict((url, stats[url]) for url in urls))
+        for row in rows:
+            row["count_perc"] = round(100 * float(row["count"]) / total_count, 3)
+            row["time_perc"] = round(100 * row["time_sum"] / total_time, 3) if total_time else 0.0
+        return sorted(rows, key=lambda row: row[sort_by], reverse=True)[:top]
+
+    def snapshot(self, top=50, sort_by="time_sum"):
+        """
+        top rows, lines and errors of every window
+        """
+        return [{"window": window_name(seconds), "seconds": seconds, "lines": self.totals[seconds][0],
+                 "errors": self.totals[seconds][1], "rows": self.top(seconds, top, sort_by)}
+                for seconds in self.windows]
+
+
+def render_windows(snapshot, outfilename, sort_by, encoding="utf-8"):
+    """
+    report with top urls of the shortest window and sections of the other ones, file is replaced atomically
+    """
+    sections = []
+    for window in snapshot[1:]:
+        name = "url, last %s" % window["window"]
+        rows = [dict(row, **{name: row["url"]}) for row in window["rows"]]
+        for row in rows:
+            del row["url"]
+        sections.append({"name": name, "rows": rows})
+    tmp_file = outfilename + ".tmp"
+    render_report(snapshot[0]["rows"] if snapshot else [], tmp_file, sort_by, encoding, sections=sections)
+    os.rename(tmp_file, outfilename)
+
+
+class _SnapshotHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?")[0] != "/":
+            self.send_error(404)
+            return
+        body = self.server.snapshot
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class SnapshotServer(HTTPServer):
+    """
+    serves the latest snapshot (json) on GET / from a daemon thread, snapshot is replaced with publish
+    """
+    def __init__(self, port, host="127.0.0.1"):
+        HTTPServer.__init__(self, (host, port), _SnapshotHandler)
+        self.snapshot = json.dumps({})
+        self._thread = threading.Thread(target=self.serve_forever)
+        self._thread.daemon = True
+        self._thread.start()
+
+    def publish(self, snapshot):
+        self.snapshot = json.dumps(snapshot)
+
+    def close(self):
+        self.shutdown()
+        self.server_close()
@@ -0,0 +1,101 @@
+# -*- coding: utf-8 -*-
+# Per url time series of request counts and latency histograms in fixed-width time buckets.
+# Memory is bounded by max_urls x buckets x histogram bins counters.
+import calendar
+from array import array
+from bisect import bisect_left
+
+from logwiz.canon import capped_get
+
+
+LATENCY_BINS = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)  # upper bounds, last bin is open
+_MONTHS = dict((name, i + 1) for i, name in enumerate(
+    ["Jan", "Feb", "Mar", "Apr", "May", "Jun", "Jul", "Aug", "Sep", "Oct", "Nov", "Dec"]))
+
+
+def parse_time_local(value):
+    """
+    unix timestamp of nginx $time_local (dd/Mon/yyyy:HH:MM:SS +zzzz)
+    """
+    if len(value) != 26 or value[2] != "/" or value[6] != "/" or value[11] != ":" or value[21] not in "+-":
+        raise ValueError("Malformed time_local %s" % value)
+    timestamp = calendar.timegm((int(value[7:11]), _MONTHS[value[3:6]], int(value[0:2]),
+                                 int(value[12:14]), int(value[15:17]), int(value[18:20])))
+    offset = 3600 * int(value[22:24]) + 60 * int(value[24:26])
+    return timestamp - offset if value[21] == "+" else timestamp + offset
+
+
+class TimeLocalParser(object):
+    """
+    parse_time_local with a cache of recent values: consecutive lines mostly share the second
+    """
+    def __init__(self, cache_size=64):
+        self.cache_size = cache_size
+        self._cache = {}
+
+    def __call__(self, value):
+        timestamp = self._cache.get(value)
+        if timestamp is None:
+            if len(self._cache) >= self.cache_size:
+                self._cache.clear()
+            timestamp = self._cache[value] = parse_time_local(value)
+        return timestamp
+
+
+class TimeSeries(object):
+    """
+    url -> bucket start timestamp -> counters of requests per latency bin (array of len(bins) + 1).
+    urls over max_urls are folded into OTHER_URL
+    """
+    def __init__(self, bucket_width=300, max_urls=1000, bins=LATENCY_BINS):
+        self.bucket_width = bucket_width
+        self.max_urls = max_urls
+        self.bins = tuple(bins)
+        self.series = {}
+
+    def _url_series(self, url):
+        series = self.series.get(url)
+        return series if series is not None else capped_get(self.series, url, self.max_urls, lambda _: {})[1]
+
+    def _counters(self, series, bucket):
+        counters = series.get(bucket)
+        if counters is None:
+            counters = series[bucket] = array("l", [0] * (len(self.bins) + 1))
+        return counters
+
+    def add(self, url, timestamp, request_time):
+        series = self._url_series(url)
+        counters = self._counters(series, timestamp - timestamp % self.bucket_width)
+        counters[bisect_left(self.bins, request_time)] += 1
+
+    def update(self, other):
+        for url, other_series in other.series.iteritems():
+            series = self._url_series(url)
+            for bucket, other_counters in other_series.iteritems():
+                counters = self._counters(series, bucket)
+                for i, count in enumerate(other_counters):
+                    counters[i] += count
+
+    def heatmap(self, urls):
+        """
+        report data for given urls: buckets are aligned to the common time range of all series,
+        missing buckets are filled with zeros. urls without series (folded into OTHER_URL over max_urls)
+        are listed as untracked instead of being drawn as urls without requests
+        """
+        tracked = [url for url in urls if url in self.series]
+        untracked = [url for url in urls if url not in self.series]
+        buckets = set()
+        for url in tracked:
+            buckets.update(self.series[url])
+        if not buckets:
+            return {"bucket_width": self.bucket_width, "bins": list(self.bins), "start": None, "urls": [],
+                    "untracked": untracked}
+        start, end = min(buckets), max(buckets)
+        empty = [0] * (len(self.bins) + 1)
+        rows = []
+        for url in tracked:
+            series = self.series[url]
+            rows.append({"url": url, "buckets": [list(series.get(bucket, empty))
+                                                 for bucket in xrange(start, end + 1, self.bucket_width)]})
+        return {"bucket_width": self.bucket_width, "bins": list(self.bins), "start": start, "urls": rows,
+                "untracked": untracked}
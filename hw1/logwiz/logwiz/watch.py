@@ -0,0 +1,103 @@
+# -*- coding: utf-8 -*-
+# Watching log directory for rotated logs in daemon mode: inotify (requires pyinotify)
+# or polling of directory mtime, which changes whenever a file is created, renamed or removed in it.
+import os
+import json
+import time
+
+try:
+    import pyinotify
+except ImportError:
+    pyinotify = None
+
+
+HEALTH_SUFFIX = ".health"
+
+
+class PollingWatcher(object):
+    name = "polling"
+
+    def __init__(self, path, interval=1.0):
+        self.path = path
+        self.interval = interval
+        self._mtime = self._dir_mtime()
+
+    def _dir_mtime(self):
+        try:
+            return os.stat(self.path).st_mtime
+        except OSError:
+            return None
+
+    def wait(self, timeout, stop=None):
+        """
+        True as soon as directory is changed, False after timeout or when stop event is set
+        """
+        deadline = time.time() + timeout
+        while True:
+            mtime = self._dir_mtime()
+            if mtime != self._mtime:
+                self._mtime = mtime
+                return True
+            left = deadline - time.time()
+            if left <= 0 or (stop is not None and stop.is_set()):
+                return False
+            time.sleep(min(self.interval, left))
+
+    def close(self):
+        pass
+
+
+if pyinotify is not None:
+    class _IgnoreEvents(pyinotify.ProcessEvent):
+        def process_default(self, event):
+            pass
+
+
+class InotifyWatcher(object):
+    name = "inotify"
+    MASK = (pyinotify.IN_CREATE | pyinotify.IN_MOVED_TO | pyinotify.IN_CLOSE_WRITE | pyinotify.IN_DELETE
+            if pyinotify is not None else 0)
+
+    def __init__(self, path, interval=1.0):
+        self.interval = interval
+        self._manager = pyinotify.WatchManager()
+        self._notifier = pyinotify.Notifier(self._manager, default_proc_fun=_IgnoreEvents())
+        self._manager.add_watch(path, self.MASK)
+
+    def wait(self, timeout, stop=None):
+        deadline = time.time() + timeout
+        while True:
+            left = deadline - time.time()
+            if left <= 0 or (stop is not None and stop.is_set()):
+                return False
+            if self._notifier.check_events(timeout=int(1000 * min(self.interval, left))):
+                self._notifier.read_events()
+                self._notifier.process_events()
+                return True
+
+    def close(self):
+        self._notifier.stop()
+
+
+def make_watcher(path, interval=1.0):
+    """
+    inotify watcher if pyinotify is installed, polling one otherwise.
+    interval: polling period, also the longest delay of noticing stop event
+    """
+    if pyinotify is not None:
+        return InotifyWatcher(path, interval)
+    return PollingWatcher(path, interval)
+
+
+def health_file_for(timestamp_file):
+    return os.path.splitext(timestamp_file)[0] + HEALTH_SUFFIX
+
+
+def write_health(health_file, status):
+    """
+    status dict is dumped as json with update time, file is replaced atomically
+    """
+    tmp_file = health_file + ".tmp"
+    with open(tmp_file, "w") as outfile:
+        json.dump(dict(status, updated=time.time()), outfile, sort_keys=True)
+    os.rename(tmp_file, health_file)
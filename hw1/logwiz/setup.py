@@ -5,7 +5,7 @@ setup(name='logwiz',
       author='fram',
       author_email='pavel.sht(gav-gav-gav)yandex.ru',
       packages=find_packages(),
-      scripts=['logwiz/scripts/log_analyzer.py'],
+      scripts=['logwiz/scripts/log_analyzer.py', 'logwiz/scripts/log_rollup.py'],
       package_data={'logwiz': ['static/*.html']},
       test_suite='tests'
       )
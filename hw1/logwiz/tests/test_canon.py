@@ -0,0 +1,73 @@
+# -*- coding: utf-8 -*-
+import unittest
+import os
+
+from logwiz.canon import UrlCanonicalizer, OTHER_URL, fold_key, capped_get
+from logwiz.parser import Aggregate, do_aggregate
+
+FIXTURE_PATH = os.path.join(os.path.dirname(__file__), "fixtures")
+LOG_PATH = os.path.join(FIXTURE_PATH, "do_aggregate")
+
+
+class UrlCanonicalizerTest(unittest.TestCase):
+    def test_rules(self):
+        canonical = UrlCanonicalizer(strip_query=True, numeric_ids=True)
+        self.assertEquals(canonical(u"/api/v2/banner/25019354"), u"/api/v2/banner/{id}")
+        self.assertEquals(canonical(u"/api/1/photogenic_banners/list/?server_name=WIN7RB4"),
+                          u"/api/{id}/photogenic_banners/list/")
+        self.assertEquals(canonical(u"/api/v2/banner/123abc"), u"/api/v2/banner/123abc")
+
+    def test_numeric_ids_keep_query(self):
+        canonical = UrlCanonicalizer(numeric_ids=True)
+        self.assertEquals(canonical(u"/banner/12/?id=34"), u"/banner/{id}/?id=34")
+
+    def test_rewrites(self):
+        canonical = UrlCanonicalizer(rewrites=[(r"^/export/\w+\.csv", u"/export/{file}")], strip_query=True)
+        self.assertEquals(canonical(u"/export/report_1.csv?x=1"), u"/export/{file}")
+
+    def test_interned(self):
+        canonical = UrlCanonicalizer(numeric_ids=True, cache_size=1)
+        self.assertIs(canonical(u"/banner/1"), canonical(u"/banner/2"))
+
+    def test_bounded(self):
+        canonical = UrlCanonicalizer(strip_query=True, cache_size=1000)
+        for i in xrange(200000):
+            canonical(u"/crawler/%d?q=%d" % (i, i))
+        self.assertLessEqual(len(canonical._cache), 1000)
+        self.assertLessEqual(len(canonical._keys), 1000)
+
+
+class MaxUrlsTest(unittest.TestCase):
+    def test_capped_get(self):
+        table = {}
+        self.assertEquals(capped_get(table, u"/a", 1, lambda key: [key]), (u"/a", [u"/a"]))
+        self.assertEquals(capped_get(table, u"/b", 1, lambda key: [key]), (OTHER_URL, [OTHER_URL]))
+        self.assertEquals(capped_get(table, u"/c", 1, lambda key: [key]), (OTHER_URL, [OTHER_URL]))
+        self.assertEquals(capped_get(table, u"/a", 1, lambda key: [key]), (u"/a", [u"/a"]))
+        self.assertEquals(len(table), 2)
+        self.assertEquals(fold_key(table, u"/d", None), u"/d")
+        self.assertEquals(fold_key(table, OTHER_URL, 1), OTHER_URL)
+
+    def test_aggregate_max_urls(self):
+        agg = Aggregate(max_urls=2)
+        for i in range(4):
+            agg.add(u"/url%d" % i, 1.0)
+        self.assertEquals(agg.stats, {u"/url0": [1.0], u"/url1": [1.0], OTHER_URL: [1.0, 1.0]})
+
+        other = Aggregate(max_urls=2)
+        other.add(u"/url1", 2.0)
+        other.add(u"/url5", 2.0)
+        agg.update(other)
+        self.assertEquals(agg.stats, {u"/url0": [1.0], u"/url1": [1.0, 2.0], OTHER_URL: [1.0, 1.0, 2.0]})
+
+    def test_do_aggregate(self):
+        log1 = os.path.join(LOG_PATH, "nginx-access-ui.log-20170701_5")
+        res = do_aggregate(log1, url_rules={"numeric_ids": True, "strip_query": True}, max_urls=1)
+        self.assertEquals(res, {
+            u"/api/v2/banner/{id}": [0.390, 0.199],
+            OTHER_URL: [0.133, 0.704, 0.146]
+            })
+
+
+if __name__ == "__main__":
+    unittest.main()
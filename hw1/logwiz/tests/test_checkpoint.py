@@ -0,0 +1,113 @@
+# -*- coding: utf-8 -*-
+import unittest
+import os
+import gzip
+import shutil
+import tempfile
+
+from logwiz.parser import do_aggregate
+from logwiz.checkpoint import Checkpointer, file_identity, load_checkpoint
+
+FIXTURE_PATH = os.path.join(os.path.dirname(__file__), "fixtures")
+LOG_PATH = os.path.join(FIXTURE_PATH, "do_aggregate")
+
+
+class CheckpointTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.log = os.path.join(self.tmp_dir, "nginx-access-ui.log-20170701")
+        self.checkpoint_file = os.path.join(self.tmp_dir, "log_analyzer.ts.ckpt")
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def _append(self, fixture):
+        with open(os.path.join(LOG_PATH, fixture), "rb") as infile:
+            with open(self.log, "ab") as outfile:
+                outfile.write(infile.read())
+
+    def _fail(self, log, workers=1):
+        self.assertRaises(TypeError, do_aggregate, log, max_errors=0, checkpoint_file=self.checkpoint_file,
+                          checkpoint_interval=1, checkpoint_max_overhead=None, workers=workers)
+
+    def test_checkpoint_removed(self):
+        self._append("nginx-access-ui.log-20170701_5")
+        res = do_aggregate(self.log, checkpoint_file=self.checkpoint_file, checkpoint_interval=100)
+        self.assertEquals(res, do_aggregate(self.log))
+        self.assertFalse(os.path.exists(self.checkpoint_file))
+
+    def test_resume_after_failure(self):
+        self._append("nginx-access-ui.log-20170701_2")
+        self._append("nginx-access-ui.log-20170701_2_3")
+        for workers in (1, 2):
+            self._fail(self.log, workers)
+            ckpt = load_checkpoint(self.checkpoint_file, self.log)
+            self.assertEquals(ckpt.aggregate.count, 3)
+
+            res = do_aggregate(self.log, checkpoint_file=self.checkpoint_file, checkpoint_interval=1,
+                               workers=workers)
+            self.assertEquals(res, do_aggregate(self.log))
+            self.assertFalse(os.path.exists(self.checkpoint_file))
+
+    def test_grown_log_ignored(self):
+        self._append("nginx-access-ui.log-20170701_2")
+        self._append("nginx-access-ui.log-20170701_2_3")
+        self._fail(self.log)
+        self._append("nginx-access-ui.log-20170701_2")
+        self.assertIsNone(load_checkpoint(self.checkpoint_file, self.log))
+
+    def test_checkpoints_throttled(self):
+        self._append("nginx-access-ui.log-20170701_5")
+        identity = file_identity(self.log)
+        checkpoint = Checkpointer(self.checkpoint_file, self.log, identity, {}, max_overhead=1e-9)
+        checkpoint(100, "first")
+        checkpoint(200, "second")  # saving took longer than 1e-9 of the time since the previous checkpoint
+        self.assertEquals(load_checkpoint(self.checkpoint_file, self.log, identity).aggregate, "first")
+
+        checkpoint = Checkpointer(self.checkpoint_file, self.log, identity, {})
+        checkpoint(200, "second")
+        self.assertEquals(load_checkpoint(self.checkpoint_file, self.log, identity).aggregate, "second")
+
+    def test_options_changed(self):
+        self._append("nginx-access-ui.log-20170701_2")
+        self._append("nginx-access-ui.log-20170701_2_3")
+        self._fail(self.log)
+        url_rules = {"strip_query": True, "numeric_ids": True, "rewrites": []}
+        res = do_aggregate(self.log, checkpoint_file=self.checkpoint_file, url_rules=url_rules)
+        self.assertEquals(res, do_aggregate(self.log, url_rules=url_rules))
+
+    def test_resume_gzip_after_failure(self):
+        with open(os.path.join(LOG_PATH, "nginx-access-ui.log-20170701_2"), "rb") as infile:
+            lines = infile.read() * 50
+        with open(os.path.join(LOG_PATH, "nginx-access-ui.log-20170701_2_3"), "rb") as infile:
+            lines += infile.read()
+        log = self.log + ".gz"
+        with gzip.open(log, "wb") as outfile:
+            outfile.write(lines)
+        self._fail(log)
+        ckpt = load_checkpoint(self.checkpoint_file, log)
+        self.assertEquals(ckpt.aggregate.count, 101)
+        self.assertGreater(ckpt.offset, os.path.getsize(log))  # offset in uncompressed data
+
+        st = os.stat(log)
+        os.utime(log, (0, 0))
+        self.assertIsNone(load_checkpoint(self.checkpoint_file, log))
+        os.utime(log, (st.st_atime, st.st_mtime))
+        res = do_aggregate(log, checkpoint_file=self.checkpoint_file, checkpoint_interval=1)
+        self.assertEquals(res, do_aggregate(log))
+
+    def test_rotated_log_ignored(self):
+        self._append("nginx-access-ui.log-20170701_2")
+        self._append("nginx-access-ui.log-20170701_2_3")
+        self._fail(self.log)
+        os.rename(self.log, self.log + ".1")
+        self._append("nginx-access-ui.log-20170701_2")
+        self._append("nginx-access-ui.log-20170701_2_3")
+        os.utime(self.log, (0, 0))
+
+        self.assertIsNone(load_checkpoint(self.checkpoint_file, self.log))
+        self.assertRaises(TypeError, do_aggregate, self.log, max_errors=0, checkpoint_file=self.checkpoint_file)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,45 @@
+# -*- coding: utf-8 -*-
+import unittest
+import os
+import random
+
+from logwiz.columnar import ColumnarStats, np
+from logwiz.parser import do_aggregate, calc_url_stats
+
+FIXTURE_PATH = os.path.join(os.path.dirname(__file__), "fixtures")
+LOG_PATH = os.path.join(FIXTURE_PATH, "do_aggregate")
+
+
+@unittest.skipIf(np is None, "numpy is not installed")
+class ColumnarStatsTest(unittest.TestCase):
+    def setUp(self):
+        rnd = random.Random(42)
+        self.url_data = {}
+        self.columnar = ColumnarStats()
+        for _ in range(5000):
+            url, value = "/url%d" % rnd.randint(0, 300), round(rnd.expovariate(2.0), 3)
+            self.url_data.setdefault(url, []).append(value)
+            self.columnar.append(url, value)
+
+    def test_calc_url_stats(self):
+        self.assertEquals(calc_url_stats(self.columnar), calc_url_stats(self.url_data))
+
+    def test_calc_url_stats_top(self):
+        self.assertEquals(calc_url_stats(self.columnar, top=10), calc_url_stats(self.url_data, top=10))
+
+    def test_extend(self):
+        merged = ColumnarStats()
+        merged.append("/url7", 1.0)
+        merged.extend(self.columnar)
+        self.url_data.setdefault("/url7", []).insert(0, 1.0)
+        self.assertEquals(calc_url_stats(merged), calc_url_stats(self.url_data))
+
+    def test_do_aggregate(self):
+        log1 = os.path.join(LOG_PATH, "nginx-access-ui.log-20170701_2_2")
+        etalon = calc_url_stats(do_aggregate(log1))
+        self.assertEquals(calc_url_stats(do_aggregate(log1, columnar=True)), etalon)
+        self.assertEquals(calc_url_stats(do_aggregate(log1, columnar=True, workers=2)), etalon)
+
+
+if __name__ == "__main__":
+    unittest.main()
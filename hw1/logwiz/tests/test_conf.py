@@ -0,0 +1,21 @@
+# -*- coding: utf-8 -*-
+import unittest
+
+from logwiz.conf import DEFAULT_CONFIG, service_configs
+
+
+class ServiceConfigsTest(unittest.TestCase):
+    def test_service_configs(self):
+        conf = dict(DEFAULT_CONFIG, TIMESTAMP_FILE="/var/tmp/log_analyzer.ts", SERVICES=[
+            {"NAME": "ui", "LOG_TEMPLATE": r"nginx-access-ui.log-(?P<DATE>\d{8})(\.gz)?", "REPORT_DIR": "./ui"},
+            {"NAME": "api", "REPORT_DIR": "./api", "TIMESTAMP_FILE": "/var/tmp/api.ts", "WORKERS": 2}])
+        ui, api = service_configs(conf)
+        self.assertEquals((ui["NAME"], ui["REPORT_DIR"], ui["TIMESTAMP_FILE"], ui["WORKERS"]),
+                          ("ui", "./ui", "/var/tmp/log_analyzer.ui.ts", 1))
+        self.assertEquals((api["NAME"], api["REPORT_DIR"], api["TIMESTAMP_FILE"], api["WORKERS"]),
+                          ("api", "./api", "/var/tmp/api.ts", 2))
+        self.assertEquals(api["LOG_TEMPLATE"], DEFAULT_CONFIG["LOG_TEMPLATE"])
+        self.assertNotIn("SERVICES", ui)
+        self.assertEquals(service_configs(dict(conf, SERVICES=[])), [])
+        for services in ([{"REPORT_DIR": "./ui"}], [{"NAME": "ui"}, {"NAME": "ui"}]):
+            self.assertRaises(ValueError, service_configs, dict(conf, SERVICES=services))
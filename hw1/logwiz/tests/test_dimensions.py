@@ -0,0 +1,120 @@
+# -*- coding: utf-8 -*-
+import unittest
+import os
+import shutil
+import tempfile
+
+from logwiz.canon import OTHER_URL
+from logwiz.dimensions import Dimension, load_dimension, load_dimensions
+from logwiz.parser import aggregate_log, calc_dimension_stats
+from logwiz.report import render_report
+
+FIXTURE_PATH = os.path.join(os.path.dirname(__file__), "fixtures")
+LOG_PATH = os.path.join(FIXTURE_PATH, "do_aggregate")
+
+
+class PathDepthDimension(Dimension):
+    name = "depth"
+    fields = ("request",)
+
+    def key(self, rec):
+        return rec["request"].split()[1].split("?")[0].count("/")
+
+
+class SlowRateDimension(Dimension):
+    name = "slow_by_status"
+    fields = ("status",)
+    value_name = "slow"
+
+    def key(self, rec):
+        return rec["status"]
+
+    def value(self, rec):
+        return 1.0 if float(rec["request_time"]) > 0.2 else 0.0
+
+
+class FailingDimension(Dimension):
+    name = "failing"
+    fields = ("request",)
+
+    def key(self, rec):
+        if float(rec["request_time"]) > 0.2:
+            raise ValueError("Plugin failure")
+        return "fast"
+
+
+class DimensionsTest(unittest.TestCase):
+    def setUp(self):
+        self.log = os.path.join(LOG_PATH, "nginx-access-ui.log-20170701_5")
+        self.dimensions = ["status", "hour", "client", "tests.test_dimensions:PathDepthDimension"]
+
+    def test_load(self):
+        self.assertEquals(load_dimension({"name": "real_ip", "field": "http_x_real_ip"}).fields,
+                          ("http_x_real_ip",))
+        self.assertRaises(ValueError, load_dimension, "weekday")
+        self.assertRaises(ValueError, load_dimensions, ["status", {"name": "status", "field": "http_referer"}])
+
+    def test_single_pass(self):
+        agg = aggregate_log(self.log, dimensions=self.dimensions)
+        self.assertEquals(agg.dimension_stats["status"].keys(), [u"200"])
+        self.assertEquals(len(agg.dimension_stats["status"][u"200"]), 5)
+        self.assertEquals(agg.dimension_stats["hour"].keys(), [u"03"])
+        self.assertEquals(len(agg.dimension_stats["client"]), 5)
+        self.assertEquals(sorted(agg.dimension_stats["depth"]), [4, 5, 6])
+        self.assertEquals(agg.stats, aggregate_log(self.log).stats)
+
+    def test_same_for_all_modes(self):
+        etalon = aggregate_log(self.log, dimensions=self.dimensions).dimension_stats
+        for kwargs in ({"parser": "fast"}, {"use_mmap": True}, {"workers": 2}, {"sketch_accuracy": 0.01}):
+            stats = aggregate_log(self.log, dimensions=self.dimensions, **kwargs).dimension_stats
+            for name in etalon:
+                self.assertEquals(sorted(stats[name]), sorted(etalon[name]))
+                for key in etalon[name]:
+                    self.assertEquals(len(stats[name][key]), len(etalon[name][key]))
+
+    def test_values(self):
+        dimensions = [{"name": "bytes_by_status", "field": "status", "value_field": "body_bytes_sent"},
+                      "tests.test_dimensions:SlowRateDimension"]
+        for kwargs in ({}, {"parser": "fast", "use_mmap": True}, {"workers": 2}):
+            agg = aggregate_log(self.log, dimensions=dimensions, **kwargs)
+            bytes_section, slow_section = calc_dimension_stats(agg)
+            self.assertEquals([(row["bytes_by_status"], row["count"], row["body_bytes_sent_sum"])
+                               for row in bytes_section["rows"]], [(u"200", 5, 23374.0)])
+            self.assertNotIn("time_sum", bytes_section["rows"][0])
+            self.assertEquals([(row["slow_by_status"], row["slow_avg"]) for row in slow_section["rows"]],
+                              [(u"200", 0.4)])
+
+    def test_failing_plugin(self):
+        for kwargs in ({}, {"workers": 2}):
+            agg = aggregate_log(self.log, max_errors=0, dimensions=["tests.test_dimensions:FailingDimension"],
+                                **kwargs)
+            self.assertEquals((agg.count, agg.errors_count), (5, 0))
+            self.assertEquals(agg.stats, aggregate_log(self.log).stats)
+            self.assertEquals(agg.feature_errors, {"dimensions": 2})
+            self.assertEquals(len(agg.dimension_stats["failing"]["fast"]), 3)
+
+    def test_max_keys(self):
+        agg = aggregate_log(self.log, dimensions=[{"name": "client", "field": "remote_addr", "max_keys": 2}])
+        self.assertEquals(len(agg.dimension_stats["client"]), 3)
+        self.assertEquals(len(agg.dimension_stats["client"][OTHER_URL]), 3)
+
+    def test_report_sections(self):
+        agg = aggregate_log(self.log, dimensions=["status", "client"])
+        sections = calc_dimension_stats(agg, top=2)
+        self.assertEquals([section["name"] for section in sections], ["status", "client"])
+        self.assertEquals(sections[0]["rows"][0]["status"], u"200")
+        self.assertEquals(sections[0]["rows"][0]["count"], 5)
+        self.assertEquals(len(sections[1]["rows"]), 2)
+        self.assertTrue(sections[1]["rows"][0]["time_sum"] >= sections[1]["rows"][1]["time_sum"])
+
+        tmp_dir = tempfile.mkdtemp()
+        try:
+            template = os.path.join(tmp_dir, "template.html")
+            with open(template, "w") as outfile:
+                outfile.write("var sections = $sections_json;")
+            report = os.path.join(tmp_dir, "report.html")
+            render_report([], report, "time_sum", template_file=template, sections=sections[:1])
+            with open(report) as infile:
+                self.assertIn('"status": "200"', infile.read())
+        finally:
+            shutil.rmtree(tmp_dir)
@@ -0,0 +1,93 @@
+# -*- coding: utf-8 -*-
+import unittest
+import os
+import shutil
+import tempfile
+
+from logwiz.canon import OTHER_URL
+from logwiz.exemplars import Exemplars
+from logwiz.parser import aggregate_log, calc_url_stats, add_exemplars
+from logwiz.columnar import np
+
+FIXTURE_PATH = os.path.join(os.path.dirname(__file__), "fixtures")
+LOG_PATH = os.path.join(FIXTURE_PATH, "do_aggregate")
+
+
+class ExemplarsTest(unittest.TestCase):
+    def test_add_update(self):
+        exemplars = Exemplars(k=2, max_urls=2)
+        for i, request_time in enumerate([0.5, 0.1, 0.9, 0.3]):
+            exemplars.add(u"/a", request_time, "id%d" % i, "29/Jun/2017:03:50:2%d +0300" % i)
+        exemplars.add(u"/b", 0.2, "idb", "29/Jun/2017:03:50:22 +0300")
+        exemplars.add(u"/c", 0.4, b"idc", b"29/Jun/2017:03:50:22 +0300")
+        other = Exemplars(k=2, max_urls=2)
+        other.add(u"/a", 0.7, "ida", "29/Jun/2017:03:50:29 +0300")
+        exemplars.update(other)
+        # /c is slower than /b, which is folded into OTHER_URL
+        self.assertEquals(sorted(exemplars.heaps), [u"/a", u"/c", OTHER_URL])
+        self.assertEquals(exemplars.slowest(u"/a"), [
+            {"request_time": 0.9, "request_id": "id2", "time_local": "29/Jun/2017:03:50:22 +0300"},
+            {"request_time": 0.7, "request_id": "ida", "time_local": "29/Jun/2017:03:50:29 +0300"}])
+        self.assertEquals(exemplars.slowest(u"/c"), [
+            {"request_time": 0.4, "request_id": u"idc", "time_local": u"29/Jun/2017:03:50:22 +0300"}])
+        self.assertEquals(exemplars.slowest(OTHER_URL), [
+            {"request_time": 0.2, "request_id": "idb", "time_local": "29/Jun/2017:03:50:22 +0300"}])
+        exemplars.add(u"/d", 0.1, "idd", "29/Jun/2017:03:50:22 +0300")
+        self.assertFalse(exemplars.tracked(u"/d"))
+        self.assertEquals(exemplars.slowest(u"/d"), [])
+
+    def test_slow_urls_tracked(self):
+        exemplars = Exemplars(k=1, max_urls=10)
+        for i in xrange(1000):
+            exemplars.add(u"/fast/%d" % i, 0.001 * (i % 100), "id%d" % i, "29/Jun/2017:03:50:22 +0300")
+        exemplars.add(u"/slow", 9.0, "slow", "29/Jun/2017:03:50:22 +0300")
+        other = Exemplars(k=1, max_urls=10)
+        other.add(u"/slower", 10.0, "slower", "29/Jun/2017:03:50:22 +0300")
+        exemplars.update(other)
+        self.assertTrue(exemplars.tracked(u"/slow") and exemplars.tracked(u"/slower"))
+        self.assertEquals(len(exemplars.heaps), 11)
+
+
+class AggregateExemplarsTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        with open(os.path.join(LOG_PATH, "nginx-access-ui.log-20170701_5")) as infile:
+            lines = infile.readlines()
+        self.log = os.path.join(self.tmp_dir, "nginx-access-ui.log-20170701")
+        with open(self.log, "w") as outfile:
+            for i in range(1, 4):
+                for line in lines:
+                    head, request_time = line.rsplit(" ", 1)
+                    outfile.write("%s %0.3f\n" % (head.replace("-4708-", "-%d-" % i), float(request_time) * i))
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_aggregate_log(self):
+        agg = aggregate_log(self.log, exemplars=2)
+        rows = dict((row["url"], row) for row in add_exemplars(agg, calc_url_stats(agg.stats)))
+        self.assertEquals(rows[u"/api/v2/banner/25019354"]["slowest"], [
+            {"request_time": 1.17, "request_id": u"1498697422-2190034393-3-9752759",
+             "time_local": u"29/Jun/2017:03:50:22 +0300"},
+            {"request_time": 0.78, "request_id": u"1498697422-2190034393-2-9752759",
+             "time_local": u"29/Jun/2017:03:50:22 +0300"}])
+        etalon = agg.exemplars.heaps
+        for kwargs in ({"parser": "fast"}, {"use_mmap": True}, {"workers": 2}) + (({"columnar": True},) if np else ()):
+            heaps = aggregate_log(self.log, exemplars=2, **kwargs).exemplars.heaps
+            self.assertEquals(dict((url, sorted(heap)) for url, heap in heaps.iteritems()),
+                              dict((url, sorted(heap)) for url, heap in etalon.iteritems()))
+        self.assertEquals(add_exemplars(aggregate_log(self.log), [{"url": u"/"}]), [{"url": u"/"}])
+        agg = aggregate_log(self.log, exemplars=2, exemplars_max_urls=1)
+        rows = add_exemplars(agg, calc_url_stats(agg.stats))
+        self.assertEquals([row["url"] for row in rows if row["slowest"] is not None], [u"/api/v2/slot/4705/groups"])
+
+    def test_log_encoding(self):
+        with open(self.log) as infile:
+            lines = infile.read().replace("-2190034393-", u"-запрос-".encode("cp1251"))
+        with open(self.log, "w") as outfile:
+            outfile.write(lines)
+        for kwargs in ({}, {"use_mmap": True}):
+            agg = aggregate_log(self.log, encoding="cp1251", exemplars=1, **kwargs)
+            rows = dict((row["url"], row) for row in add_exemplars(agg, calc_url_stats(agg.stats)))
+            self.assertEquals(rows[u"/api/v2/banner/25019354"]["slowest"][0]["request_id"],
+                              u"1498697422-запрос-3-9752759")
@@ -0,0 +1,86 @@
+# -*- coding: utf-8 -*-
+import unittest
+import os
+import gzip
+import random
+import shutil
+import tempfile
+
+from logwiz import gzindex
+from logwiz.gzindex import load_index, index_file_for
+from logwiz.readers import gen_gzip_blocks, gen_lines
+from logwiz.parser import do_aggregate
+
+FIXTURE_PATH = os.path.join(os.path.dirname(__file__), "fixtures")
+LOG_PATH = os.path.join(FIXTURE_PATH, "do_aggregate")
+SPAN = 100000
+
+
+@unittest.skipIf(gzindex.libz is None, "libz is not available")
+class GzipIndexTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        with open(os.path.join(LOG_PATH, "nginx-access-ui.log-20170701_2_3")) as infile:
+            line = infile.readline()
+        rnd = random.Random(1)
+        self.log = os.path.join(self.tmp_dir, "nginx-access-ui.log-20170701.gz")
+        self.data = b""
+        for _ in range(2):  # multi-member gzip
+            data = b"".join(line.replace("/api/v2/banner/25019354", "/api/%d?id=%x" % (rnd.randint(0, 1000),
+                                                                                      rnd.getrandbits(64)))
+                                .replace("0.390\n", "%0.3f\n" % rnd.random()) for _ in range(5000))
+            with gzip.open(self.log, "ab") as outfile:
+                outfile.write(data)
+            self.data += data
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_build(self):
+        self.assertIsNone(load_index(self.log))
+        self.assertEquals(b"".join(gen_gzip_blocks(self.log, index_span=SPAN)), self.data)
+        self.assertEquals(index_file_for(self.log), os.path.join(self.tmp_dir, ".nginx-access-ui.log-20170701.gz.idx"))
+        index = load_index(self.log)
+        self.assertEquals(index.size, len(self.data))
+        self.assertTrue(len(index.points) > 5)
+        self.assertTrue(all(self.data[point.line_start - 1] == b"\n" for point in index.points))
+
+        ranges = index.ranges()
+        self.assertEquals(ranges[0][0], 0)
+        self.assertEquals(ranges[-1][1], len(self.data))
+        for start, end in ranges:
+            self.assertEquals(b"".join(gen_lines(self.log, start, end, gzip_index_span=SPAN)), self.data[start:end])
+        start = self.data.index(b"\n", index.points[3].out + 100) + 1
+        self.assertEquals(b"".join(gen_gzip_blocks(self.log, start, index_span=SPAN)), self.data[start:])
+
+    def test_partial_read(self):
+        chunks = gzindex._gen_indexing(self.log, SPAN, index_file_for(self.log), read_size=1000)
+        next(chunks)
+        chunks.close()
+        self.assertIsNone(load_index(self.log))
+
+    def test_stale(self):
+        list(gen_gzip_blocks(self.log, index_span=SPAN))
+        with gzip.open(self.log, "ab") as outfile:
+            outfile.write(self.data[:1000])
+        self.assertIsNone(load_index(self.log))
+
+    def test_do_aggregate(self):
+        index_dir = os.path.join(self.tmp_dir, "index")
+        os.mkdir(index_dir)
+        etalon = do_aggregate(self.log)
+        self.assertEquals(do_aggregate(self.log, workers=2, gzip_index_span=SPAN, gzip_index_dir=index_dir), etalon)
+        self.assertIsNotNone(load_index(self.log, index_dir))
+        self.assertEquals(do_aggregate(self.log, workers=2, gzip_index_span=SPAN, gzip_index_dir=index_dir), etalon)
+        self.assertEquals(do_aggregate(self.log, gzip_index_span=SPAN, gzip_index_dir=index_dir), etalon)
+
+    def test_save_failed(self):
+        etalon = do_aggregate(self.log)
+        index_dir = os.path.join(self.tmp_dir, "missing")
+        self.assertEquals(do_aggregate(self.log, workers=2, gzip_index_span=SPAN, gzip_index_dir=index_dir), etalon)
+        self.assertFalse(os.path.exists(index_dir))
+
+        os.mkdir(index_file_for(self.log))  # index file can not be replaced
+        self.assertEquals(do_aggregate(self.log, workers=2, gzip_index_span=SPAN), etalon)
+        self.assertEquals(sorted(os.listdir(self.tmp_dir)), sorted([os.path.basename(self.log),
+                                                                    os.path.basename(index_file_for(self.log))]))
@@ -0,0 +1,96 @@
+# -*- coding: utf-8 -*-
+import unittest
+import os
+import shutil
+import tempfile
+from datetime import datetime
+
+from logwiz.hll import HyperLogLog, UrlClients, add_clients
+from logwiz.parser import aggregate_log, calc_url_stats
+from logwiz.canon import OTHER_URL
+from logwiz.report import render_report, page_file_for
+from logwiz.store import write_aggregate, read_clients, aggregate_file_for
+from logwiz.rollup import rollup_url_stats
+from logwiz.columnar import np
+
+FIXTURE_PATH = os.path.join(os.path.dirname(__file__), "fixtures")
+LOG_PATH = os.path.join(FIXTURE_PATH, "do_aggregate")
+TEMPLATE = "aggregate-%Y.%m.%d.bin"
+
+
+class HyperLogLogTest(unittest.TestCase):
+    def test_estimate(self):
+        for precision, size in [(12, 20000), (10, 100000), (10, 10)]:
+            hll = HyperLogLog(precision)
+            for i in xrange(size):
+                hll.add("10.0.%d.%d" % (i // 256, i % 256))
+            self.assertAlmostEqual(hll.estimate(), size, delta=3 * hll.error() * size + 1)
+        self.assertEquals(HyperLogLog(10).estimate(), 0)
+        self.assertRaises(ValueError, HyperLogLog, 20)
+
+    def test_merge(self):
+        first, second, union = HyperLogLog(8), HyperLogLog(8), HyperLogLog(8)
+        for i in xrange(1000):
+            (first if i % 3 else second).add(str(i))
+            union.add(unicode(i))
+        first.merge(second)
+        self.assertEquals(first.registers, union.registers)
+        self.assertRaises(ValueError, first.merge, HyperLogLog(9))
+
+    def test_url_clients(self):
+        clients = UrlClients(precision=8, max_urls=1)
+        for i in xrange(100):
+            clients.add(u"/a", str(i % 10))
+        clients.add(u"/b", "1.1.1.1")
+        clients.add(u"/a", "-")
+        rows = add_clients([{"url": u"/a"}, {"url": u"/c"}], clients.counters)
+        self.assertEquals(rows, [{"url": u"/a", "clients": 10, "clients_err": 1},
+                                 {"url": u"/c", "clients": None, "clients_err": None}])
+        self.assertEquals(add_clients([{"url": u"/a"}], {}), [{"url": u"/a"}])
+
+
+class AggregateClientsTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.log = os.path.join(LOG_PATH, "nginx-access-ui.log-20170701_5")
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_aggregate_log(self):
+        etalon = aggregate_log(self.log, clients_field="remote_addr").clients.counters
+        self.assertEquals(len(etalon), 5)
+        self.assertEquals([round(counter.estimate()) for counter in etalon.values()], [1] * 5)
+        for kwargs in ({"parser": "fast"}, {"use_mmap": True}, {"workers": 2}) + (({"columnar": True},) if np else ()):
+            counters = aggregate_log(self.log, clients_field="remote_addr", **kwargs).clients.counters
+            self.assertEquals(dict((url, counter.registers) for url, counter in counters.iteritems()),
+                              dict((url, counter.registers) for url, counter in etalon.iteritems()))
+        # requests without X-RB-USER are not counted
+        self.assertEquals(len(aggregate_log(self.log, clients_field="http_X_RB_USER").clients.counters), 4)
+        self.assertRaises(ValueError, aggregate_log, self.log, clients_field="http_cookie")
+
+    def test_max_urls(self):
+        for workers in (1, 2):
+            agg = aggregate_log(self.log, clients_field="remote_addr", max_urls=2, workers=workers)
+            self.assertEquals(set(agg.clients.counters), set(agg.stats))  # folded in step with url stats
+            self.assertEquals(round(agg.clients.counters[OTHER_URL].estimate()), 3)
+
+    def test_clients_max_urls_paging(self):
+        log = os.path.join(LOG_PATH, "nginx-access-ui.log-20170701")
+        agg = aggregate_log(log, clients_field="remote_addr", clients_max_urls=10)
+        rows = add_clients(calc_url_stats(agg.stats), agg.clients.counters)
+        self.assertTrue(any(row["clients"] is None for row in rows))
+        self.assertTrue(all("clients" in row and "clients_err" in row for row in rows))
+        report_file = os.path.join(self.tmp_dir, "report.html")
+        render_report(rows, report_file, "time_sum", page_size=10)
+        self.assertTrue(os.path.isfile(page_file_for(report_file, 1)))
+
+    def test_store_rollup(self):
+        agg = aggregate_log(self.log, clients_field="remote_addr", clients_precision=6)
+        fname = aggregate_file_for(self.tmp_dir, datetime(2017, 7, 1), TEMPLATE)
+        write_aggregate(fname, agg.stats, clients=agg.clients.counters)
+        self.assertEquals(dict((url, counter.registers) for url, counter in read_clients(fname).iteritems()),
+                          dict((url, counter.registers) for url, counter in agg.clients.counters.iteritems()))
+        write_aggregate(aggregate_file_for(self.tmp_dir, datetime(2017, 7, 2), TEMPLATE), agg.stats)
+        rows = rollup_url_stats(self.tmp_dir, TEMPLATE, datetime(2017, 7, 2), 2)
+        self.assertEquals([(row["count"], row["clients"]) for row in rows], [(2, 1)] * 5)
@@ -0,0 +1,129 @@
+# -*- coding: utf-8 -*-
+import unittest
+import os
+import imp
+import shutil
+import tempfile
+
+from logwiz.conf import DEFAULT_CONFIG
+
+FIXTURE_PATH = os.path.join(os.path.dirname(__file__), "fixtures")
+LOG_PATH = os.path.join(FIXTURE_PATH, "do_aggregate")
+SCRIPT_PATH = os.path.join(os.path.dirname(__file__), os.pardir, "logwiz", "scripts", "log_analyzer.py")
+
+log_analyzer = imp.load_source("log_analyzer", SCRIPT_PATH)
+
+
+class _InlinePool(object):
+    """
+    runs tasks in order in the current process, remembers them
+    """
+    tasks = []
+
+    def __init__(self, processes):
+        pass
+
+    def imap_unordered(self, func, tasks):
+        for task in tasks:
+            _InlinePool.tasks.append(task)
+            yield func(task)
+
+    def close(self):
+        pass
+
+    def terminate(self):
+        pass
+
+    def join(self):
+        pass
+
+
+class RunServicesTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.conf = dict(DEFAULT_CONFIG, TIMESTAMP_FILE=os.path.join(self.tmp_dir, "log_analyzer.ts"), MAX_ERRORS=0,
+                         SERVICES=[self._service("ui", "nginx-access-ui.log-20170701_5"),
+                                   self._service("api", "nginx-access-ui.log-20170701_2_3")])
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def _service(self, name, fixture):
+        log_dir = os.path.join(self.tmp_dir, name, "log")
+        os.makedirs(log_dir)
+        shutil.copy(os.path.join(LOG_PATH, fixture), os.path.join(log_dir, "nginx-access-ui.log-20170701"))
+        return {"NAME": name, "LOG_DIR": log_dir, "REPORT_DIR": os.path.join(self.tmp_dir, name, "reports")}
+
+    def _report_file(self, name):
+        return os.path.join(self.tmp_dir, name, "reports", "report-2017.07.01.html")
+
+    def _timestamp_file(self, name):
+        return os.path.join(self.tmp_dir, "log_analyzer.%s.ts" % name)
+
+    def test_failed_service(self):
+        self.assertEquals(log_analyzer.run_services(self.conf), 1)  # api log is broken
+        self.assertTrue(os.path.exists(self._report_file("ui")))
+        self.assertTrue(os.path.exists(self._timestamp_file("ui")))
+        self.assertFalse(os.path.exists(self._report_file("api")))
+        self.assertFalse(os.path.exists(self._timestamp_file("api")))
+        self.assertFalse(os.path.exists(self.conf["TIMESTAMP_FILE"]))
+
+        self.assertEquals(log_analyzer.run_services(self.conf), 1)  # ui report exists, api log is retried
+
+    def test_largest_first(self):
+        shutil.copy(os.path.join(LOG_PATH, "nginx-access-ui.log-20170701_2"),
+                    os.path.join(self.tmp_dir, "api", "log", "nginx-access-ui.log-20170702"))
+        _InlinePool.tasks = []
+        pool = log_analyzer.Pool
+        log_analyzer.Pool = _InlinePool
+        try:
+            self.assertEquals(log_analyzer.run_services(self.conf, backfill=True), 1)
+        finally:
+            log_analyzer.Pool = pool
+        self.assertEquals([(conf["NAME"], log.name) for conf, log, _ in _InlinePool.tasks],
+                          [("ui", "nginx-access-ui.log-20170701"), ("api", "nginx-access-ui.log-20170701"),
+                           ("api", "nginx-access-ui.log-20170702")])
+        self.assertTrue(os.path.exists(self._timestamp_file("api")))  # 20170702 is processed
+
+
+class BackfillTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.log_dir = os.path.join(self.tmp_dir, "log")
+        os.mkdir(self.log_dir)
+        for date, fixture in (("20170630", "nginx-access-ui.log-20170701_5"),
+                              ("20170701", "nginx-access-ui.log-20170701_2_3"),
+                              ("20170702", "nginx-access-ui.log-20170701_2")):
+            shutil.copy(os.path.join(LOG_PATH, fixture), os.path.join(self.log_dir, "nginx-access-ui.log-" + date))
+        self.conf = dict(DEFAULT_CONFIG, LOG_DIR=self.log_dir, REPORT_DIR=os.path.join(self.tmp_dir, "reports"),
+                         TIMESTAMP_FILE=os.path.join(self.tmp_dir, "log_analyzer.ts"), MAX_ERRORS=0,
+                         BACKFILL_WORKERS=2)
+        log_analyzer.prepare_env(self.conf)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_failed_date(self):
+        written = []
+
+        def write_timestamp(fname):
+            written.append((fname, sorted(os.listdir(self.conf["REPORT_DIR"]))))
+            write_timestamp_orig(fname)
+
+        write_timestamp_orig = log_analyzer.write_timestamp
+        log_analyzer.write_timestamp = write_timestamp
+        try:
+            self.assertEquals(log_analyzer.backfill(self.conf), 1)  # 20170701 is broken
+        finally:
+            log_analyzer.write_timestamp = write_timestamp_orig
+        reports = ["report-2017.06.30.html", "report-2017.07.02.html"]
+        self.assertEquals(written, [(self.conf["TIMESTAMP_FILE"], reports)])  # once, after all logs
+        self.assertEquals(sorted(os.listdir(self.conf["REPORT_DIR"])), reports)
+        self.assertTrue(os.path.exists(self.conf["TIMESTAMP_FILE"]))
+
+    def test_all_failed(self):
+        os.remove(os.path.join(self.log_dir, "nginx-access-ui.log-20170630"))
+        os.remove(os.path.join(self.log_dir, "nginx-access-ui.log-20170702"))
+        self.assertEquals(log_analyzer.backfill(self.conf), 1)
+        self.assertEquals(os.listdir(self.conf["REPORT_DIR"]), [])
+        self.assertFalse(os.path.exists(self.conf["TIMESTAMP_FILE"]))
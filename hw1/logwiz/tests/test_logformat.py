@@ -0,0 +1,60 @@
+# -*- coding: utf-8 -*-
+import unittest
+import os
+import gzip
+
+from logwiz.logformat import compile_parser, normalize_log_format, LogFormatError
+from logwiz.parser import do_aggregate, parse_line
+
+FIXTURE_PATH = os.path.join(os.path.dirname(__file__), "fixtures")
+LOG_PATH = os.path.join(FIXTURE_PATH, "do_aggregate")
+
+UI_SHORT = ('$remote_addr $remote_user $http_x_real_ip [$time_local] "$request" '
+            '$status $body_bytes_sent "$http_referer" '
+            '"$http_user_agent" "$http_x_forwarded_for" "$http_X_REQUEST_ID" "$http_X_RB_USER" '
+            '$request_time')
+
+
+class CompileParserTest(unittest.TestCase):
+    def _fixture_logs(self):
+        for root, _, files in os.walk(FIXTURE_PATH):
+            for fname in files:
+                if fname.startswith("nginx-access-ui.log"):
+                    yield os.path.join(root, fname)
+
+    def test_same_as_full_parser(self):
+        parse = compile_parser(UI_SHORT, ("request", "request_time", "status"))
+        for log in self._fixture_logs():
+            opener = gzip.open if log.endswith("gz") else open
+            with opener(log) as infile:
+                for line in infile:
+                    full = parse_line(line.decode("utf-8"))
+                    for rec in (parse(line), parse(line.decode("utf-8"))):
+                        if full is None:
+                            self.assertIsNone(rec)
+                        else:
+                            self.assertEquals(rec, {"request": full["request"], "status": full["status"],
+                                                    "request_time": full["request_time"]})
+
+    def test_cached(self):
+        self.assertIs(compile_parser(UI_SHORT, ("request_time", "request")),
+                      compile_parser(UI_SHORT, ("request", "request_time")))
+
+    def test_nginx_directive(self):
+        directive = ("log_format main '$remote_addr [$time_local] '\n"
+                     "                '\"$request\" $status $request_time';")
+        self.assertEquals(normalize_log_format(directive),
+                          '$remote_addr [$time_local] "$request" $status $request_time')
+        parse = compile_parser(directive, ("request", "status"))
+        self.assertEquals(parse('1.2.3.4 [29/Jun/2017:03:50:22 +0300] "GET / HTTP/1.1" 200 0.1\n'),
+                          {"request": "GET / HTTP/1.1", "status": "200"})
+        self.assertIsNone(parse('1.2.3.4 "GET / HTTP/1.1" 200 0.1\n'))
+
+    def test_errors(self):
+        self.assertRaises(LogFormatError, compile_parser, "$remote_addr $status", ("request",))
+        self.assertRaises(LogFormatError, compile_parser, "$remote_addr$status $request", ("request",))
+
+    def test_do_aggregate(self):
+        log = os.path.join(LOG_PATH, "nginx-access-ui.log-20170701_2_3")
+        self.assertEquals(do_aggregate(log, log_format=UI_SHORT), do_aggregate(log))
+        self.assertEquals(do_aggregate(log, log_format=UI_SHORT, use_mmap=True), do_aggregate(log))
@@ -3,7 +3,7 @@ import os
 import unittest
 from datetime import datetime
 
-from logwiz.logutil import get_last_log
+from logwiz.logutil import get_last_log, get_unreported_logs
 
 
 FIXTURE_PATH = os.path.join(os.path.dirname(__file__), "fixtures")
@@ -12,6 +12,7 @@ LOG_PATH_FILES = [
         (os.path.join(LOG_PATH, "nginx-access-ui.log-20170630.gz"), datetime(2017, 06, 30)),
         (os.path.join(LOG_PATH, "nginx-access-ui.log-20170701"), datetime(2017, 07, 01))
         ]
+REPORT_PATH = os.path.join(FIXTURE_PATH, "logs")
 
 
 class GetLastLogTest(unittest.TestCase):
@@ -23,5 +24,17 @@ class GetLastLogTest(unittest.TestCase):
         self.assertEqual((log.name, log.date), (etalon_name, etalon_date))
 
 
+class GetUnreportedLogsTest(unittest.TestCase):
+    def _unreported(self, report_dir):
+        return get_unreported_logs(LOG_PATH, r"nginx-access-ui.log-(?P<DATE>\d{8})(\.gz)?",
+                                   os.path.join(REPORT_PATH, report_dir), "report-%Y.%m.%d.html")
+
+    def test_unreported_logs(self):
+        etalon = [(os.path.basename(name), date) for name, date in sorted(LOG_PATH_FILES, key=lambda x: x[1])]
+        self.assertEqual(self._unreported("no_such_dir"), etalon)
+        self.assertEqual(self._unreported("report_last_20170630"), etalon[1:])
+        self.assertEqual(self._unreported("report_last_20170701"), etalon[:1])
+
+
 if __name__ == "__main__":
     unittest.main()
@@ -1,8 +1,12 @@
 # -*- coding: utf-8 -*-
 import unittest
 import os
+import gzip
+import shutil
+import tempfile
 
-from logwiz.parser import do_aggregate, parse_line, calc_stats, calc_url_stats, ParseError
+from logwiz.parser import do_aggregate, parse_line, parse_line_fast, calc_stats, calc_url_stats, split_ranges, \
+    ParseError
 
 FIXTURE_PATH = os.path.join(os.path.dirname(__file__), "fixtures")
 LOG_PATH = os.path.join(FIXTURE_PATH, "do_aggregate")
@@ -31,6 +35,37 @@ class ParseLineTest(unittest.TestCase):
         self.assertEquals(res, etalon)
 
 
+class ParseLineFastTest(unittest.TestCase):
+    def _fixture_logs(self):
+        for root, _, files in os.walk(FIXTURE_PATH):
+            for fname in files:
+                if fname.startswith("nginx-access-ui.log"):
+                    yield os.path.join(root, fname)
+
+    def test_same_as_full_parser(self):
+        for log in self._fixture_logs():
+            opener = gzip.open if log.endswith("gz") else open
+            with opener(log) as infile:
+                for line in infile:
+                    line = line.decode("utf-8")
+                    full = parse_line(line)
+                    fast = parse_line_fast(line)
+                    if full is None:
+                        self.assertIsNone(fast)
+                    else:
+                        self.assertEquals(fast["request"], full["request"])
+                        self.assertEquals(fast["request_time"], full["request_time"])
+
+    def test_do_aggregate_same_as_full_parser(self):
+        for log in self._fixture_logs():
+            self.assertEquals(do_aggregate(log, parser="fast"), do_aggregate(log, parser="full"))
+
+    def test_fallback(self):
+        record = u'1.196.116.32 - - [29/Jun/2017:03:50:22 +0300] "GET /x?q="y" HTTP/1.1" 200 927 "-" "-" "-" "-" "-" 0.390'
+        self.assertEquals(parse_line_fast(record), parse_line(record))
+        self.assertEquals(parse_line_fast(record)["request"], 'GET /x?q="y" HTTP/1.1')
+
+
 class DoAggregateTest(unittest.TestCase):
     def test_do_aggregate1(self):
         log1 = os.path.join(LOG_PATH, "nginx-access-ui.log-20170701_2")
@@ -73,6 +108,83 @@ class DoAggregateTest(unittest.TestCase):
             self.fail("Exceptions should be suppressed by max_errors_ratio")
 
 
+    def test_do_aggregate_parallel(self):
+        log1 = os.path.join(LOG_PATH, "nginx-access-ui.log-20170701_5")
+        self.assertEquals(do_aggregate(log1, workers=3), do_aggregate(log1))
+
+    def test_do_aggregate_parallel_parse_errors_count_above_thresh(self):
+        log1 = os.path.join(LOG_PATH, "nginx-access-ui.log-20170701_2_3")
+        self.assertRaises(ParseError, do_aggregate, log1, max_errors=1, workers=3)
+
+
+class ErrorsRatioCheckTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        with open(os.path.join(LOG_PATH, "nginx-access-ui.log-20170701_2_3")) as infile:
+            self.good_line, self.bad_line = infile.readlines()[:2]
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def write_log(self, lines):
+        log = os.path.join(self.tmp_dir, "nginx-access-ui.log-20170701")
+        with open(log, "w") as outfile:
+            outfile.writelines(lines)
+        return log
+
+    def test_early_abort(self):
+        log = self.write_log([self.bad_line] * 5000)
+        with self.assertRaisesRegexp(ParseError, "1000 errors out of 1000 lines") as ctx:
+            do_aggregate(log, max_errors_ratio=10.0)
+        self.assertEquals(str(ctx.exception).count(self.bad_line.strip()), 5)
+
+    def test_early_abort_parallel(self):
+        log = self.write_log([self.bad_line] * 5000)
+        self.assertRaisesRegexp(ParseError, "first malformed lines", do_aggregate, log, max_errors_ratio=10.0,
+                                workers=2)
+
+    def test_below_ratio(self):
+        log = self.write_log(([self.good_line] * 19 + [self.bad_line]) * 100)
+        self.assertEquals(len(do_aggregate(log, max_errors_ratio=10.0)), 1)
+
+    def test_burst(self):
+        log = self.write_log([self.good_line] * 10000 + [self.bad_line] * 1500 + [self.good_line] * 18500)
+        for workers in (1, 4):
+            self.assertEquals(len(do_aggregate(log, max_errors_ratio=10.0, workers=workers)), 1)
+
+    def test_burst_in_range(self):
+        log = self.write_log([self.good_line] * 500 + [self.bad_line] * 50 + [self.good_line] * 450)
+        for workers in (1, 4):
+            self.assertEquals(len(do_aggregate(log, max_errors_ratio=10.0, workers=workers,
+                                               errors_check_min_lines=10)), 1)
+
+    def test_burst_over_ratio(self):
+        log = self.write_log([self.good_line] * 1000 + [self.bad_line] * 1500 + [self.good_line] * 7500)
+        for workers in (1, 4):
+            with self.assertRaisesRegexp(ParseError, r"lines left\)") as ctx:
+                do_aggregate(log, max_errors_ratio=10.0, workers=workers)
+            errors = int(str(ctx.exception).split("(")[1].split()[0])
+            self.assertTrue(1000 < errors <= 1500, errors)  # by the end of burst (or of its worker range)
+
+    def test_disabled(self):
+        log = self.write_log([self.bad_line] * 1000 + [self.good_line] * 9000)
+        self.assertEquals(len(do_aggregate(log, max_errors_ratio=10.0, errors_check_min_lines=None)), 1)
+
+
+class SplitRangesTest(unittest.TestCase):
+    def test_split_ranges(self):
+        log1 = os.path.join(LOG_PATH, "nginx-access-ui.log-20170701_5")
+        with open(log1, "rb") as infile:
+            data = infile.read()
+        ranges = split_ranges(log1, 4)
+
+        self.assertEquals(ranges[0][0], 0)
+        self.assertEquals(ranges[-1][1], len(data))
+        for (_, end), (start, _) in zip(ranges[:-1], ranges[1:]):
+            self.assertEquals(end, start)
+            self.assertEquals(data[start - 1], "\n")
+
+
 class CalcStatsTest(unittest.TestCase):
 
     def test_calc_stats_empty(self):
@@ -0,0 +1,62 @@
+# -*- coding: utf-8 -*-
+import unittest
+import os
+import shutil
+import tempfile
+
+from logwiz.profiling import Profiler, metrics_file_for
+from logwiz.parser import do_aggregate
+
+FIXTURE_PATH = os.path.join(os.path.dirname(__file__), "fixtures")
+LOG_PATH = os.path.join(FIXTURE_PATH, "do_aggregate")
+
+
+class ProfilerTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_disabled(self):
+        profiler = Profiler(enabled=False)
+        with profiler.stage("stats"):
+            pass
+        do_aggregate(os.path.join(LOG_PATH, "nginx-access-ui.log-20170701_2"), profiler=profiler)
+        self.assertEquals(profiler.stages, {})
+
+    def test_do_aggregate_stages(self):
+        profiler = Profiler()
+        with profiler.stage("aggregate", counts_lines=True):
+            do_aggregate(os.path.join(LOG_PATH, "nginx-access-ui.log-20170701_5"), profiler=profiler)
+        self.assertEquals(list(profiler.stages),
+                          ["aggregate:read", "aggregate:parse", "aggregate:collect", "aggregate"])
+        self.assertEquals(profiler.stages["aggregate"]["lines"], 5)
+        self.assertTrue(profiler.stages["aggregate"]["peak_rss"] > 0)
+        with profiler.stage("render"):
+            pass
+        self.assertIsNone(profiler.stages["render"]["lines"])
+        self.assertIn("peak rss", profiler.summary())
+
+    def test_do_aggregate_parallel_stages(self):
+        profiler = Profiler()
+        do_aggregate(os.path.join(LOG_PATH, "nginx-access-ui.log-20170701_5"), workers=2, profiler=profiler)
+        self.assertEquals(profiler.stages["aggregate:parse"]["lines"], 5)
+
+    def test_prometheus(self):
+        profiler = Profiler()
+        profiler.add("find_log", 0.5, 0.25)
+        profiler.add("aggregate", 2.0, lines=10)
+        profiler.add("render", 1.0)
+        metrics_file = metrics_file_for(os.path.join(self.tmp_dir, "log_analyzer.ts"))
+        self.assertEquals(metrics_file, os.path.join(self.tmp_dir, "log_analyzer.prom"))
+        profiler.write_prometheus(metrics_file)
+        with open(metrics_file) as infile:
+            metrics = infile.read().splitlines()
+        self.assertIn('logwiz_stage_wall_seconds{stage="find_log"} 0.5', metrics)
+        self.assertIn('logwiz_stage_cpu_seconds{stage="find_log"} 0.25', metrics)
+        self.assertIn('logwiz_stage_lines{stage="aggregate"} 10.0', metrics)
+        self.assertIn('logwiz_stage_lines_per_second{stage="aggregate"} 5.0', metrics)
+        self.assertNotIn('stage="render"', " ".join(line for line in metrics if "_lines" in line))
+        self.assertNotIn('logwiz_stage_cpu_seconds{stage="render"}', " ".join(metrics))
+        self.assertEquals(os.listdir(self.tmp_dir), ["log_analyzer.prom"])
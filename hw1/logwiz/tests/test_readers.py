@@ -0,0 +1,77 @@
+# -*- coding: utf-8 -*-
+import unittest
+import os
+import gzip
+import shutil
+import tempfile
+
+from logwiz.readers import gen_lines, gen_gzip_blocks, gen_threaded
+from logwiz.parser import do_aggregate
+
+FIXTURE_PATH = os.path.join(os.path.dirname(__file__), "fixtures")
+LOG_PATH = os.path.join(FIXTURE_PATH, "do_aggregate")
+
+
+class GzipPipelineTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        with open(os.path.join(LOG_PATH, "nginx-access-ui.log-20170701_5"), "rb") as infile:
+            self.data = infile.read()
+        self.log = os.path.join(self.tmp_dir, "nginx-access-ui.log-20170701.gz")
+        for _ in range(3):  # multi-member gzip
+            with gzip.open(self.log, "ab") as outfile:
+                outfile.write(self.data * 20)
+        self.data *= 60
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_blocks(self):
+        blocks = list(gen_gzip_blocks(self.log, read_size=100))
+        self.assertEquals("".join(blocks), self.data)
+        self.assertTrue(all(block.endswith("\n") for block in blocks))
+
+    def test_lines(self):
+        self.assertEquals(list(gen_lines(self.log)), list(gen_lines(self.log, gzip_pipeline=False)))
+        self.assertEquals("".join(gen_lines(self.log, start=1000)), self.data[1000:])
+
+    def test_threaded_error(self):
+        def gen():
+            yield 1
+            raise ValueError
+        self.assertRaises(ValueError, list, gen_threaded(gen()))
+
+    def test_do_aggregate(self):
+        etalon = do_aggregate(self.log, gzip_pipeline=False)
+        self.assertEquals(do_aggregate(self.log), etalon)
+        self.assertEquals(do_aggregate(self.log, workers=2), etalon)
+
+
+if __name__ == "__main__":
+    unittest.main()
+
+
+class MmapReaderTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        with open(os.path.join(LOG_PATH, "nginx-access-ui.log-20170701_5"), "rb") as infile:
+            self.data = infile.read()
+        self.data += self.data.splitlines(True)[0].replace("/api/v2/banner/", u"/api/v2/баннер/".encode("utf-8"))
+        self.data += self.data.splitlines(True)[1].rstrip("\n")  # no trailing newline
+        self.log = os.path.join(self.tmp_dir, "nginx-access-ui.log-20170701")
+        with open(self.log, "wb") as outfile:
+            outfile.write(self.data)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_lines(self):
+        self.assertEquals(list(gen_lines(self.log, use_mmap=True)), list(gen_lines(self.log)))
+        self.assertEquals(list(gen_lines(self.log, 300, 600, use_mmap=True)), list(gen_lines(self.log, 300, 600)))
+
+    def test_do_aggregate(self):
+        etalon = do_aggregate(self.log)
+        self.assertIn(u"/api/v2/баннер/25019354", etalon)
+        for parser in ("full", "fast"):
+            self.assertEquals(do_aggregate(self.log, use_mmap=True, parser=parser), etalon)
+        self.assertEquals(do_aggregate(self.log, use_mmap=True, workers=2), etalon)
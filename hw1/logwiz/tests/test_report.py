@@ -1,10 +1,14 @@
 # -*- coding: utf-8 -*-
 import unittest
 import os
+import gzip
+import json
+import shutil
+import tempfile
 from tempfile import NamedTemporaryFile
 from textwrap import dedent
 
-from logwiz.report import render_report
+from logwiz.report import render_report, remove_pages, remove_report, columnar_page
 
 
 FIXTURE_PATH = os.path.join(os.path.dirname(__file__), "fixtures")
@@ -56,5 +60,49 @@ class RenderTest(unittest.TestCase):
         os.remove(output_file.name)
 
 
+class PagedRenderTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.template_file = os.path.join(self.tmp_dir, "template.html")
+        with open(self.template_file, "w") as outfile:
+            outfile.write("var table = $table_json;\nvar pages = $pages_json;\n")
+        self.report_file = os.path.join(self.tmp_dir, "report-2017.06.30.html")
+        self.data = [{"url": u"/api/%d" % i, "time": float(i)} for i in range(25)]
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_pages(self):
+        render_report(self.data, self.report_file, sort_by="time", template_file=self.template_file, page_size=10,
+                      gzip_pages=True)
+        with open(self.report_file) as infile:
+            result = infile.read()
+        pages = ["report-2017.06.30.page-0001.json", "report-2017.06.30.page-0002.json"]
+        self.assertEquals(result, "var table = %s;\nvar pages = %s;\n" % (
+            json.dumps({"columns": ["time", "url"], "values": [[float(i) for i in range(24, 14, -1)],
+                                                               ["/api/%d" % i for i in range(24, 14, -1)]]}),
+            json.dumps(pages)))
+        with open(os.path.join(self.tmp_dir, pages[1])) as infile:
+            last_page = json.load(infile)
+        self.assertEquals(last_page["values"][1], ["/api/%d" % i for i in range(4, -1, -1)])
+        with gzip.open(os.path.join(self.tmp_dir, pages[1] + ".gz")) as infile:
+            self.assertEquals(json.load(infile), last_page)
+
+        render_report(self.data, self.report_file, sort_by="time", template_file=self.template_file, page_size=20)
+        self.assertEquals(sorted(os.listdir(self.tmp_dir)), ["report-2017.06.30.html", pages[0], "template.html"])
+        remove_pages(self.report_file)
+        self.assertEquals(sorted(os.listdir(self.tmp_dir)), ["report-2017.06.30.html", "template.html"])
+
+        render_report(self.data, self.report_file, sort_by="time", template_file=self.template_file, page_size=10)
+        remove_report(self.report_file)
+        self.assertEquals(os.listdir(self.tmp_dir), ["template.html"])
+
+    def test_columnar_page(self):
+        rows = [{"url": u"/a", "time": 1.0}, {"url": u"/b", "time": 2.0, "clients": 3}]
+        self.assertEquals(columnar_page(rows), {"columns": ["clients", "time", "url"],
+                                                "values": [[None, 3], [1.0, 2.0], [u"/a", u"/b"]]})
+        self.assertEquals(columnar_page([]), {"columns": [], "values": []})
+
+
 if __name__ == "__main__":
     unittest.main()
@@ -0,0 +1,61 @@
+# -*- coding: utf-8 -*-
+import unittest
+import os
+import shutil
+import tempfile
+
+from logwiz.sampling import sample_ranges, sampled_fraction, scale_row
+from logwiz.parser import parse_otus_log
+from logwiz.columnar import np
+
+FIXTURE_PATH = os.path.join(os.path.dirname(__file__), "fixtures")
+LOG_PATH = os.path.join(FIXTURE_PATH, "do_aggregate")
+
+
+class SamplingTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        with open(os.path.join(LOG_PATH, "nginx-access-ui.log-20170701_2_3")) as infile:
+            line = infile.readline()
+        self.log = os.path.join(self.tmp_dir, "nginx-access-ui.log-20170701")
+        with open(self.log, "w") as outfile:
+            for i in range(20000):
+                outfile.write(line.replace("/api/v2/banner/25019354", "/api/%d" % (i % 4))
+                                  .replace("0.390\n", "%0.3f\n" % ((i % 4) + (i % 7) / 10.0)))
+        self.exact = dict((row["url"], row) for row in parse_otus_log(self.log))
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_sample_ranges(self):
+        for mode in ("stride", "random"):
+            ranges = sample_ranges(self.log, 0.1, mode, block_size=10000, seed=2)
+            with open(self.log, "rb") as infile:
+                for start, end in ranges:
+                    self.assertTrue(start < end)
+                    infile.seek(max(start - 1, 0))
+                    self.assertEquals(infile.read(1), "\n" if start else "1")
+            self.assertAlmostEqual(sampled_fraction(self.log, ranges), 0.1, delta=0.01)
+        self.assertEquals(sample_ranges(self.log, 1.0, block_size=10000), [(0, os.path.getsize(self.log))])
+        self.assertRaises(ValueError, sample_ranges, self.log, 0.1, "every_other")
+
+    def test_sample_estimates(self):
+        for kwargs in ({}, {"sketch_accuracy": 0.01}, {"workers": 2}, {"sample_mode": "random", "sample_seed": 3}):
+            rows = parse_otus_log(self.log, sample=0.2, sample_block_size=10000, **kwargs)
+            self.assertEquals(len(rows), 4)
+            for row in rows:
+                exact = self.exact[row["url"]]
+                self.assertTrue(abs(row["count"] - exact["count"]) <= 2 * row["count_ci"] + 1)
+                self.assertTrue(abs(row["time_sum"] - exact["time_sum"]) <= 2 * row["time_sum_ci"] + 1)
+                self.assertTrue(abs(row["time_avg"] - exact["time_avg"]) <= 2 * row["time_avg_ci"] + 0.01)
+
+    @unittest.skipIf(np is None, "numpy is not installed")
+    def test_sample_columnar(self):
+        rows = parse_otus_log(self.log, sample=0.2, sample_block_size=10000)
+        self.assertEquals(parse_otus_log(self.log, sample=0.2, sample_block_size=10000, columnar=True), rows)
+
+    def test_scale_row(self):
+        row = scale_row({}, 100, 50.0, 26.0, 0.5)
+        self.assertEquals(row["count"], 200)
+        self.assertEquals(row["time_sum"], 100.0)
+        self.assertEquals(row["time_avg_ci"], round(1.96 * 0.1 / 10, 3))
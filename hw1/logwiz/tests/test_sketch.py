@@ -0,0 +1,83 @@
+# -*- coding: utf-8 -*-
+import unittest
+import os
+import random
+
+from logwiz.sketch import QuantileSketch, StreamingStats
+from logwiz.parser import do_aggregate, calc_stats, calc_url_stats
+
+FIXTURE_PATH = os.path.join(os.path.dirname(__file__), "fixtures")
+LOG_PATH = os.path.join(FIXTURE_PATH, "do_aggregate")
+
+
+class QuantileSketchTest(unittest.TestCase):
+    def setUp(self):
+        rnd = random.Random(42)
+        self.data = [rnd.expovariate(5.0) for _ in range(10000)] + [0.0] * 100
+
+    def test_quantile_relative_error(self):
+        sketch = QuantileSketch(0.01)
+        for value in self.data:
+            sketch.add(value)
+
+        _sorted = sorted(self.data)
+        for q in (0.1, 0.5, 0.9, 0.99):
+            exact = _sorted[int(q * len(_sorted))]
+            self.assertLessEqual(abs(sketch.quantile(q) - exact), 0.01 * exact)
+
+    def test_merge(self):
+        whole, first, second = QuantileSketch(0.01), QuantileSketch(0.01), QuantileSketch(0.01)
+        for i, value in enumerate(self.data):
+            whole.add(value)
+            (first if i % 2 else second).add(value)
+        first.merge(second)
+
+        self.assertEquals(first.buckets, whole.buckets)
+        self.assertEquals((first.zeros, first.count), (whole.zeros, whole.count))
+
+    def test_merge_different_accuracy(self):
+        self.assertRaises(ValueError, QuantileSketch(0.01).merge, QuantileSketch(0.02))
+
+    def test_subtract(self):
+        first, second, merged = QuantileSketch(0.01), QuantileSketch(0.01), QuantileSketch(0.01)
+        for i, value in enumerate(self.data):
+            (first if i % 2 else second).add(value)
+            merged.add(value)
+        merged.subtract(second)
+        self.assertEquals(merged.buckets, first.buckets)
+        self.assertEquals((merged.zeros, merged.count), (first.zeros, first.count))
+
+
+class StreamingStatsTest(unittest.TestCase):
+    def test_stats(self):
+        data = [0.1, 0.2, 0.3, 0.4]
+        stream = StreamingStats(0.001)
+        for value in data:
+            stream.append(value)
+
+        res = calc_stats(stream)
+        etalon = calc_stats(data)
+        for key in ("count", "sum", "max"):
+            self.assertEquals(res[key], etalon[key])
+        self.assertAlmostEqual(res["avg"], etalon["avg"])
+        self.assertAlmostEqual(res["med"], etalon["med"], delta=0.001 * etalon["med"])
+        self.assertIn("p99", res)
+
+    def test_empty(self):
+        self.assertEquals(calc_stats(StreamingStats()), {})
+
+    def test_do_aggregate_sketch(self):
+        log1 = os.path.join(LOG_PATH, "nginx-access-ui.log-20170701_2_2")
+        exact = calc_url_stats(do_aggregate(log1))
+        approx = calc_url_stats(do_aggregate(log1, sketch_accuracy=0.001, workers=2))
+
+        self.assertEquals([r["url"] for r in approx], [r["url"] for r in exact])
+        for row, etalon in zip(approx, exact):
+            for key in ("count", "time_sum", "time_max", "count_perc"):
+                self.assertEquals(row[key], etalon[key])
+            self.assertAlmostEqual(row["time_med"], etalon["time_med"], delta=0.001)
+            self.assertIn("time_p95", row)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,77 @@
+# -*- coding: utf-8 -*-
+import unittest
+import os
+import gzip
+import shutil
+import tempfile
+
+from logwiz.spill import SpilledStats, write_run, read_run
+from logwiz.sketch import StreamingStats
+from logwiz.parser import aggregate_log, calc_url_stats, parse_otus_log
+
+FIXTURE_PATH = os.path.join(os.path.dirname(__file__), "fixtures")
+LOG_PATH = os.path.join(FIXTURE_PATH, "do_aggregate")
+
+
+class SpillTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.spill_dir = os.path.join(self.tmp_dir, "spill")
+        os.mkdir(self.spill_dir)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_runs(self):
+        sketch = StreamingStats(0.01)
+        sketch.append(1.0)
+        sketch.append(2.0)
+        run = write_run({u"/b": [0.5], u"/a": [1.0, 2.0]}, self.spill_dir)
+        self.assertEquals([(url, list(data)) for url, data in read_run(run)], [(u"/a", [1.0, 2.0]), (u"/b", [0.5])])
+        spilled = SpilledStats([run, write_run({u"/a": [3.0], u"/c": [1.0]}, self.spill_dir)], {u"/b": [0.1]})
+        self.assertEquals([(url, list(data)) for url, data in spilled.iteritems()],
+                          [(u"/a", [1.0, 2.0, 3.0]), (u"/b", [0.5, 0.1]), (u"/c", [1.0])])
+        spilled.close()
+        self.assertEquals(os.listdir(self.spill_dir), [])
+
+        spilled = SpilledStats([write_run({u"/a": sketch}, self.spill_dir)], {u"/a": sketch})
+        [(url, data)] = list(spilled.iteritems())
+        self.assertEquals((data.count, data.sum, data.sumsq), (4, 6.0, 10.0))
+        spilled.close()
+
+    def _write_log(self, malformed=False, opener=open, suffix=""):
+        with open(os.path.join(LOG_PATH, "nginx-access-ui.log-20170701_2_3")) as infile:
+            line = infile.readline()
+        log = os.path.join(self.tmp_dir, "nginx-access-ui.log-20170701" + suffix)
+        with opener(log, "w") as outfile:
+            for i in range(25000):
+                outfile.write(line.replace("/api/v2/banner/25019354", "/api/%d" % (i % 3001))
+                                  .replace("0.390\n", "%0.3f\n" % ((i % 4) + (i % 7) / 10.0)))
+            if malformed:
+                outfile.write("malformed line\n")
+        return log
+
+    def test_aggregate_log(self):
+        log = self._write_log()
+        # order of urls with equal time_avg depends on order of iteration, sketch sums may differ in last digit
+        by_url = lambda rows: sorted((row["url"], row["count"], row["time_max"], row["time_med"]) for row in rows)
+        for kwargs in ({}, {"workers": 2}, {"sketch_accuracy": 0.01}):
+            etalon = calc_url_stats(aggregate_log(log, **kwargs).url_data())
+            agg = aggregate_log(log, memory_budget=1, spill_dir=self.spill_dir, **kwargs)
+            self.assertTrue(agg.runs)
+            self.assertEquals(by_url(calc_url_stats(agg.url_data())), by_url(etalon))
+            self.assertEquals([row["time_sum"] for row in calc_url_stats(agg.url_data(), top=10)],
+                              [row["time_sum"] for row in etalon[:10]])
+            agg.close()
+            self.assertEquals(os.listdir(self.spill_dir), [])
+
+    def test_runs_removed(self):
+        rows = parse_otus_log(self._write_log(), top=10, memory_budget=1, spill_dir=self.spill_dir)
+        self.assertEquals(len(rows), 10)
+        self.assertEquals(os.listdir(self.spill_dir), [])
+        # failed aggregation, including failed workers
+        for log, workers in [(self._write_log(malformed=True), 1), (self._write_log(malformed=True), 2),
+                             (self._write_log(malformed=True, opener=gzip.open, suffix=".gz"), 2)]:
+            self.assertRaises(TypeError, aggregate_log, log, max_errors=0, workers=workers, memory_budget=1,
+                              spill_dir=self.spill_dir)
+            self.assertEquals(os.listdir(self.spill_dir), [])
@@ -0,0 +1,70 @@
+# -*- coding: utf-8 -*-
+import unittest
+import os
+import shutil
+import tempfile
+from datetime import datetime
+
+from logwiz.parser import do_aggregate, calc_url_stats
+from logwiz.store import write_aggregate, read_aggregate, merge_aggregates, aggregate_file_for
+from logwiz.rollup import rollup_url_stats, last_aggregate_date
+
+FIXTURE_PATH = os.path.join(os.path.dirname(__file__), "fixtures")
+LOG_PATH = os.path.join(FIXTURE_PATH, "do_aggregate")
+TEMPLATE = "aggregate-%Y.%m.%d.bin"
+
+
+class StoreTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.log1 = os.path.join(LOG_PATH, "nginx-access-ui.log-20170701_5")
+        self.log2 = os.path.join(LOG_PATH, "nginx-access-ui.log-20170701_2_2")
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def _store(self, log, date, **kwargs):
+        fname = aggregate_file_for(self.tmp_dir, date, TEMPLATE)
+        write_aggregate(fname, do_aggregate(log, **kwargs), sketch_accuracy=0.001)
+        return fname
+
+    def _assert_url_stats_close(self, result, etalon):
+        self.assertEquals([r["url"] for r in result], [r["url"] for r in etalon])
+        for row, etalon_row in zip(result, etalon):
+            for key in ("count", "time_sum", "time_max", "time_perc"):
+                self.assertEquals(row[key], etalon_row[key])
+            self.assertAlmostEqual(row["time_med"], etalon_row["time_med"], delta=0.001)
+
+    def test_write_read(self):
+        for kwargs in ({}, {"sketch_accuracy": 0.001}):
+            fname = self._store(self.log1, datetime(2017, 7, 1), **kwargs)
+            self._assert_url_stats_close(calc_url_stats(read_aggregate(fname)), calc_url_stats(do_aggregate(self.log1)))
+
+    def test_empty(self):
+        fname = os.path.join(self.tmp_dir, "empty.bin")
+        write_aggregate(fname, {})
+        self.assertEquals(read_aggregate(fname), {})
+
+    def test_merge(self):
+        files = [self._store(self.log1, datetime(2017, 7, 1)), self._store(self.log2, datetime(2017, 7, 2))]
+        etalon = do_aggregate(self.log1)
+        for url, data in do_aggregate(self.log2).iteritems():
+            etalon.setdefault(url, []).extend(data)
+        self._assert_url_stats_close(calc_url_stats(merge_aggregates(files)), calc_url_stats(etalon))
+
+    def test_rollup_compare(self):
+        self._store(self.log1, datetime(2017, 7, 1))
+        self._store(self.log2, datetime(2017, 7, 2))
+        end = last_aggregate_date(self.tmp_dir, TEMPLATE)
+        self.assertEquals(end, datetime(2017, 7, 2))
+
+        url_stats = rollup_url_stats(self.tmp_dir, TEMPLATE, end, 1, compare=True)
+        deltas = dict((row["url"], (row["count_delta"], row["time_avg_delta"])) for row in url_stats)
+        self.assertEquals(deltas, {
+            "/api/v2/banner/25019354": (0, 0.0),
+            "/api/1/photogenic_banners/list/?server_name=WIN7RB4": (1, 0.067)
+            })
+
+
+if __name__ == "__main__":
+    unittest.main()
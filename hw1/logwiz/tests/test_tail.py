@@ -0,0 +1,126 @@
+# -*- coding: utf-8 -*-
+import unittest
+import os
+import json
+import shutil
+import tempfile
+import urllib2
+
+from logwiz.tail import LogFollower, SlidingWindows, SnapshotServer, render_windows
+from logwiz.parser import Aggregate, aggregate_lines, calc_url_stats
+
+FIXTURE_PATH = os.path.join(os.path.dirname(__file__), "fixtures")
+LOG_PATH = os.path.join(FIXTURE_PATH, "do_aggregate")
+
+
+class LogFollowerTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.log = os.path.join(self.tmp_dir, "nginx-access-ui.log")
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def _write(self, data, mode="ab"):
+        with open(self.log, mode) as outfile:
+            outfile.write(data)
+
+    def test_follow(self):
+        self._write("old\n")
+        follower = LogFollower(self.log)
+        self.assertEquals(follower.read(), [])
+        self._write("first\nsec")
+        self.assertEquals(follower.read(), ["first"])
+        self._write("ond\n")
+        self.assertEquals(follower.read(), ["second"])
+        # rotation: the rest of the old log is read first
+        self._write("last")
+        os.rename(self.log, self.log + ".1")
+        self.assertEquals(follower.read(), [])
+        self._write("new\n")
+        self.assertEquals(follower.read(), ["last", "new"])
+        self.assertEquals(follower.read(), [])
+        # truncation
+        self._write("x\n", "wb")
+        self.assertEquals(follower.read(), ["x"])
+        self.assertEquals((follower.rotations, follower.truncations), (1, 1))
+        follower.close()
+
+    def test_missing_log(self):
+        follower = LogFollower(self.log)
+        self.assertEquals(follower.read(), [])
+        self._write("first\n")
+        self.assertEquals(follower.read(), ["first"])
+        follower.close()
+
+
+class SlidingWindowsTest(unittest.TestCase):
+    def setUp(self):
+        with open(os.path.join(LOG_PATH, "nginx-access-ui.log-20170701_5"), "rb") as infile:
+            self.lines = infile.read().splitlines()
+
+    def test_windows(self):
+        windows = SlidingWindows(windows=(10, 30), slot=5)
+        for second in xrange(0, 40, 5):
+            windows.advance(1000 + second)
+            aggregate_lines(self.lines, windows.current)
+        windows.advance(1040)
+        self.assertEquals([len(windows.slots), windows.totals[10], windows.totals[30]], [6, [10, 0], [30, 0]])
+
+        etalon = Aggregate()
+        for _ in xrange(6):
+            aggregate_lines(self.lines, etalon)
+        rows = windows.top(30, top=3)
+        etalon_rows = calc_url_stats(etalon.stats)
+        etalon_rows.sort(key=lambda row: row["time_sum"], reverse=True)
+        self.assertEquals([(row["url"], row["count"], row["time_sum"], row["time_max"], row["count_perc"])
+                           for row in rows],
+                          [(row["url"], row["count"], row["time_sum"], row["time_max"], row["count_perc"])
+                           for row in etalon_rows[:3]])
+        self.assertEquals(len(windows.top(30, top=10, sort_by="time_med")), 5)
+
+        # slots without lines expire windows
+        windows.advance(1060)
+        self.assertEquals([windows.totals[10], windows.totals[30], len(windows.stats[10]), len(windows.stats[30])],
+                          [[0, 0], [10, 0], 0, 5])
+        windows.advance(2000)
+        snapshot = windows.snapshot()
+        self.assertEquals([(window["window"], window["lines"], window["rows"]) for window in snapshot],
+                          [("10s", 0, []), ("30s", 0, [])])
+        self.assertRaises(ValueError, SlidingWindows, (60, 7), 5)
+
+
+class PublishTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        with open(os.path.join(LOG_PATH, "nginx-access-ui.log-20170701_5"), "rb") as infile:
+            lines = infile.read().splitlines()
+        windows = SlidingWindows(windows=(60, 300), slot=5)
+        windows.advance(1000)
+        aggregate_lines(lines, windows.current)
+        windows.advance(1005)
+        self.snapshot = windows.snapshot(top=2)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_server(self):
+        server = SnapshotServer(0)
+        try:
+            server.publish(self.snapshot)
+            url = "http://127.0.0.1:%d/" % server.server_address[1]
+            snapshot = json.load(urllib2.urlopen(url))
+            self.assertEquals([(window["window"], window["lines"], len(window["rows"])) for window in snapshot],
+                              [("1m", 5, 2), ("5m", 5, 2)])
+            self.assertRaises(urllib2.HTTPError, urllib2.urlopen, url + "other")
+        finally:
+            server.close()
+
+    def test_render(self):
+        report_file = os.path.join(self.tmp_dir, "tail.html")
+        render_windows(self.snapshot, report_file, "time_sum")
+        self.assertEquals(os.listdir(self.tmp_dir), ["tail.html"])
+        with open(report_file) as infile:
+            report = infile.read()
+        self.assertIn("url, last 5m", report)
+        self.assertIn(self.snapshot[0]["rows"][0]["url"], report)
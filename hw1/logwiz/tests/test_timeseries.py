@@ -0,0 +1,87 @@
+# -*- coding: utf-8 -*-
+import unittest
+import os
+import shutil
+import calendar
+import tempfile
+
+from logwiz.canon import OTHER_URL
+from logwiz.timeseries import TimeSeries, TimeLocalParser, parse_time_local
+from logwiz.parser import aggregate_log, calc_url_stats, calc_heatmap
+from logwiz.columnar import np
+
+FIXTURE_PATH = os.path.join(os.path.dirname(__file__), "fixtures")
+LOG_PATH = os.path.join(FIXTURE_PATH, "do_aggregate")
+
+
+class ParseTimeLocalTest(unittest.TestCase):
+    def test_parse(self):
+        self.assertEquals(parse_time_local("29/Jun/2017:03:50:22 +0300"),
+                          calendar.timegm((2017, 6, 29, 0, 50, 22)))
+        self.assertEquals(parse_time_local(u"01/Jan/2017:00:00:00 -0130"),
+                          calendar.timegm((2017, 1, 1, 1, 30, 0)))
+        self.assertRaises(ValueError, parse_time_local, "29/Jun/2017 03:50:22")
+        self.assertRaises(KeyError, parse_time_local, "29/Foo/2017:03:50:22 +0300")
+
+    def test_cache(self):
+        parse = TimeLocalParser(cache_size=2)
+        for value in ["29/Jun/2017:03:50:22 +0300", "29/Jun/2017:03:50:23 +0300", "29/Jun/2017:03:50:22 +0300"]:
+            self.assertEquals(parse(value), parse_time_local(value))
+        self.assertTrue(len(parse._cache) <= 2)
+
+
+class TimeSeriesTest(unittest.TestCase):
+    def test_add_update(self):
+        series = TimeSeries(bucket_width=60, max_urls=2, bins=(0.1, 1.0))
+        series.add(u"/a", 120, 0.05)
+        series.add(u"/a", 179, 0.5)
+        series.add(u"/b", 180, 5.0)
+        series.add(u"/c", 180, 0.1)
+        other = TimeSeries(bucket_width=60, max_urls=2, bins=(0.1, 1.0))
+        other.add(u"/a", 130, 0.05)
+        series.update(other)
+        self.assertEquals(sorted(series.series), [u"/a", u"/b", OTHER_URL])
+        self.assertEquals(list(series.series[u"/a"][120]), [2, 1, 0])
+        self.assertEquals(list(series.series[OTHER_URL][180]), [1, 0, 0])
+        heatmap = series.heatmap([u"/a", u"/b", u"/c"])
+        self.assertEquals(heatmap["start"], 120)
+        self.assertEquals(heatmap["urls"][1], {"url": u"/b", "buckets": [[0, 0, 0], [0, 0, 1]]})
+        self.assertEquals((len(heatmap["urls"]), heatmap["untracked"]), (2, [u"/c"]))
+        self.assertEquals(series.heatmap([u"/c"])["urls"], [])
+
+    def test_aggregate_log(self):
+        log = os.path.join(LOG_PATH, "nginx-access-ui.log-20170701_5")
+        etalon = aggregate_log(log, series_bucket=300).series.series
+        self.assertEquals(len(etalon), 5)
+        for kwargs in ({"parser": "fast"}, {"use_mmap": True}, {"workers": 2}) + (({"columnar": True},) if np else ()):
+            self.assertEquals(aggregate_log(log, series_bucket=300, **kwargs).series.series, etalon)
+
+    def test_optional_fields_errors(self):
+        tmp_dir = tempfile.mkdtemp()
+        try:
+            log = os.path.join(tmp_dir, "nginx-access-ui.log-20170701")
+            with open(log, "w") as outfile:
+                outfile.write('1.1.1.1 [29/Jun/2017:03:50:22 +0300] "GET /a HTTP/1.1" 0.5\n'
+                              '1.1.1.2 [yesterday] "GET /a HTTP/1.1" 0.25\n')
+            log_format = '$remote_addr [$time_local] "$request" $request_time'
+            agg = aggregate_log(log, max_errors=0, log_format=log_format, series_bucket=300,
+                                clients_field="remote_addr")
+            self.assertEquals((agg.count, agg.errors_count), (2, 0))  # bad time_local is not a parsing error
+            self.assertEquals(agg.stats, {u"/a": [0.5, 0.25]})
+            self.assertEquals(agg.feature_errors, {"series": 1})
+            self.assertEquals(round(agg.clients.counters[u"/a"].estimate()), 2)
+            self.assertEquals(sum(sum(sum(counts) for counts in buckets.itervalues())
+                                  for buckets in agg.series.series.itervalues()), 1)
+        finally:
+            shutil.rmtree(tmp_dir)
+
+    def test_heatmap(self):
+        log = os.path.join(LOG_PATH, "nginx-access-ui.log-20170701_5")
+        agg = aggregate_log(log, series_bucket=300)
+        heatmap = calc_heatmap(agg, calc_url_stats(agg.stats), top=2)
+        self.assertEquals(len(heatmap["urls"]), 2)
+        self.assertEquals(heatmap["start"], calendar.timegm((2017, 6, 29, 0, 50, 0)))
+        self.assertIsNone(calc_heatmap(aggregate_log(log), []))
+        agg = aggregate_log(log, series_bucket=300, series_max_urls=1)
+        heatmap = calc_heatmap(agg, calc_url_stats(agg.stats), top=2)
+        self.assertEquals((len(heatmap["urls"]), len(heatmap["untracked"])), (1, 1))
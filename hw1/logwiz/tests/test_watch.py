@@ -0,0 +1,155 @@
+# -*- coding: utf-8 -*-
+import unittest
+import os
+import imp
+import json
+import time
+import shutil
+import tempfile
+from datetime import datetime
+from threading import Event
+
+from logwiz.conf import DEFAULT_CONFIG
+from logwiz.watch import PollingWatcher, health_file_for, write_health
+
+FIXTURE_PATH = os.path.join(os.path.dirname(__file__), "fixtures")
+LOG_PATH = os.path.join(FIXTURE_PATH, "do_aggregate")
+SCRIPT_PATH = os.path.join(os.path.dirname(__file__), os.pardir, "logwiz", "scripts", "log_analyzer.py")
+
+log_analyzer = imp.load_source("log_analyzer", SCRIPT_PATH)
+
+
+class PollingWatcherTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_wait(self):
+        watcher = PollingWatcher(self.tmp_dir, interval=0.01)
+        self.assertFalse(watcher.wait(0.05))
+        time.sleep(0.01)  # directory mtime resolution
+        open(os.path.join(self.tmp_dir, "nginx-access-ui.log-20170701"), "w").close()
+        os.utime(self.tmp_dir, (time.time() + 1, time.time() + 1))
+        self.assertTrue(watcher.wait(1))
+        self.assertFalse(watcher.wait(0.05))
+
+    def test_stop(self):
+        stop = Event()
+        stop.set()
+        started = time.time()
+        self.assertFalse(PollingWatcher(self.tmp_dir, interval=0.01).wait(10, stop))
+        self.assertTrue(time.time() - started < 1)
+
+    def test_health(self):
+        health_file = health_file_for(os.path.join(self.tmp_dir, "log_analyzer.ts"))
+        self.assertEquals(health_file, os.path.join(self.tmp_dir, "log_analyzer.health"))
+        write_health(health_file, {"state": "watching", "processed": 1})
+        with open(health_file) as infile:
+            health = json.load(infile)
+        self.assertEquals(health["state"], "watching")
+        self.assertTrue(health["updated"] > 0)
+        self.assertEquals(os.listdir(self.tmp_dir), ["log_analyzer.health"])
+
+
+class WatchTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.log_dir = os.path.join(self.tmp_dir, "log")
+        os.mkdir(self.log_dir)
+        self.conf = dict(DEFAULT_CONFIG, LOG_DIR=self.log_dir, REPORT_DIR=os.path.join(self.tmp_dir, "reports"),
+                         TIMESTAMP_FILE=os.path.join(self.tmp_dir, "log_analyzer.ts"), MAX_ERRORS=0,
+                         WATCH_SETTLE=30, WATCH_POLL_INTERVAL=0.01, WATCH_HEARTBEAT=0.01)
+        log_analyzer.prepare_env(self.conf)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def _add_log(self, date, fixture="nginx-access-ui.log-20170701_5", age=60):
+        log_file = os.path.join(self.log_dir, "nginx-access-ui.log-" + date)
+        shutil.copy(os.path.join(LOG_PATH, fixture), log_file)
+        mtime = time.time() - age
+        os.utime(log_file, (mtime, mtime))
+        return log_file
+
+    def _settled(self, since=None, seen=None, failed=None):
+        logs, settling = log_analyzer._settled_logs(self.conf, since, {} if seen is None else seen,
+                                                    {} if failed is None else failed)
+        return [log.name for log, _ in logs], settling
+
+    def test_settle(self):
+        log_file = self._add_log("20170701", age=0)
+        seen = {}
+        self.assertEquals(self._settled(seen=seen), ([], True))
+        self.assertEquals(self._settled(seen=seen), ([], True))  # modified less than WATCH_SETTLE ago
+        mtime = time.time() - 60
+        os.utime(log_file, (mtime, mtime))
+        self.assertEquals(self._settled(seen=seen), ([], True))  # changed since the previous check
+        self.assertEquals(self._settled(seen=seen), (["nginx-access-ui.log-20170701"], False))
+
+        with open(log_file, "a") as outfile:
+            outfile.write("\n")
+        os.utime(log_file, (mtime, mtime))
+        self.assertEquals(self._settled(seen=seen), ([], True))  # size changed
+
+    def test_since(self):
+        self._add_log("20170630")
+        self._add_log("20170701")
+        seen = {}
+        self._settled(datetime(2017, 7, 1), seen)
+        self.assertEquals(seen.keys(), ["nginx-access-ui.log-20170701"])
+        self.assertEquals(self._settled(datetime(2017, 7, 1), seen), (["nginx-access-ui.log-20170701"], False))
+        self.assertEquals(len(self._settled(None, seen)[0]), 1)  # 20170630 is not settled yet
+
+        report_file = os.path.join(self.conf["REPORT_DIR"], "report-2017.07.01.html")
+        open(report_file, "w").close()
+        self.assertEquals(self._settled(datetime(2017, 7, 1), seen), ([], False))
+
+    def test_failed(self):
+        log_file = self._add_log("20170701")
+        seen, failed = {}, {}
+        self._settled(seen=seen)
+        logs, _ = log_analyzer._settled_logs(self.conf, None, seen, failed)
+        failed.update((log.name, identity) for log, identity in logs)
+        self.assertEquals(self._settled(seen=seen, failed=failed), ([], False))  # not retried
+
+        mtime = time.time() - 50
+        os.utime(log_file, (mtime, mtime))
+        self.assertEquals(self._settled(seen=seen, failed=failed), ([], True))
+        self.assertEquals(self._settled(seen=seen, failed=failed), (["nginx-access-ui.log-20170701"], False))
+
+    def test_watch(self):
+        self._add_log("20170630")
+        self._add_log("20170701")
+        self.conf["WATCH_SETTLE"] = 0
+        stop, states = Event(), []
+
+        def record_health(health_file, status):
+            write_health(health_file, status)
+            states.append(dict(status))
+            if status["state"] != "watching":
+                return
+            if status["processed"] == 1 and not status["failed"] and \
+                    not os.path.exists(os.path.join(self.log_dir, "nginx-access-ui.log-20170702")):
+                self._add_log("20170702", fixture="nginx-access-ui.log-20170701_2_3")
+            watching_failed = [state for state in states if state["failed"] and state["state"] == "watching"]
+            if len(watching_failed) >= 5 or len(states) > 1000:
+                stop.set()
+
+        write_health_orig = log_analyzer.write_health
+        log_analyzer.write_health = record_health
+        try:
+            self.assertEquals(log_analyzer.watch(self.conf, stop), 0)
+        finally:
+            log_analyzer.write_health = write_health_orig
+
+        self.assertEquals(sorted(os.listdir(self.conf["REPORT_DIR"])), ["report-2017.07.01.html"])
+        self.assertTrue(os.path.exists(self.conf["TIMESTAMP_FILE"]))
+        self.assertEquals([state["last_log"] for state in states if state["state"] == "processing"],
+                          ["nginx-access-ui.log-20170701", "nginx-access-ui.log-20170702"])  # failed log is not retried
+        self.assertEquals(states[-1]["state"], "stopped")
+        self.assertEquals((states[-1]["processed"], states[-1]["failed"]), (1, 1))
+        self.assertTrue(states[-1]["last_error"].startswith("nginx-access-ui.log-20170702: "))
+        with open(health_file_for(self.conf["TIMESTAMP_FILE"])) as infile:
+            self.assertEquals(json.load(infile)["state"], "stopped")